@@ -0,0 +1,81 @@
+"""
+ZIP backups of the whole collection (database + covers), shared by the API and the CLI.
+"""
+import json
+import os
+import shutil
+import zipfile
+from datetime import datetime
+from typing import IO
+
+from sqlmodel import Session, func, select
+
+from . import changes, crud
+from .covers import COVERS_DIR
+from .database import create_db_and_tables, engine, init_fts, sqlite_file_name
+from .models import Album
+
+def write_backup(zip_path: str, session: Session):
+    album_count = session.exec(select(func.count(Album.id))).one()
+    manifest = {
+        "version": "1.5.0",
+        "date": datetime.now().isoformat(),
+        "album_count": album_count
+    }
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        # Add DB
+        if os.path.exists(sqlite_file_name):
+            zip_file.write(sqlite_file_name, "discvault.db")
+
+        # Add Covers
+        if os.path.exists(COVERS_DIR):
+            for root, dirs, files in os.walk(COVERS_DIR):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    arcname = os.path.join("covers", os.path.relpath(file_path, COVERS_DIR))
+                    zip_file.write(file_path, arcname)
+
+        # Add manifest
+        zip_file.writestr("manifest.json", json.dumps(manifest))
+
+def restore_backup(upload_file: IO[bytes], temp_dir: str) -> bool:
+    """
+    Extracts the uploaded ZIP and replaces covers and database.
+    Returns False if the archive has no database.
+    """
+    zip_path = os.path.join(temp_dir, "import.zip")
+    upload_file.seek(0)
+    with open(zip_path, "wb") as buffer:
+        shutil.copyfileobj(upload_file, buffer)
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        zip_ref.extractall(temp_dir)
+
+    # Validate
+    import_db_path = os.path.join(temp_dir, "discvault.db")
+    if not os.path.exists(import_db_path):
+        return False
+
+    # Replace Covers
+    import_covers_dir = os.path.join(temp_dir, "covers")
+    if os.path.exists(import_covers_dir):
+        if os.path.exists(COVERS_DIR):
+            shutil.rmtree(COVERS_DIR)
+        shutil.copytree(import_covers_dir, COVERS_DIR)
+
+    # Replace DB and drop pooled connections that still point at the old file
+    shutil.copy(import_db_path, sqlite_file_name)
+    engine.dispose()
+    # Older backups lack tables, columns and triggers added since; bring them up to date
+    create_db_and_tables()
+    with Session(engine) as session:
+        init_fts(session, rebuild=False)
+        # Backups from before change tracking get the log here; every restore gets a new
+        # epoch, since the restored seq can be behind the tokens clients already hold
+        changes.init_change_log(session)
+        changes.rotate_epoch(session)
+        # ...and duplicate-detection keys and runtimes, as at startup, before caches reload
+        crud.backfill_album_keys(session)
+        crud.backfill_durations(session)
+        crud.notify_collection_replaced(session)
+    return True
@@ -0,0 +1,293 @@
+"""
+Reproducible benchmark suite for the DiscVault API.
+
+Builds deterministic collections (see synthetic.py), drives the FastAPI app in-process
+through a scenario matrix and writes the timings as JSON, optionally comparing them
+against an earlier run:
+
+    python -m backend.app.benchmark --sizes 1k 10k --output bench.json
+    python -m backend.app.benchmark --sizes 10k --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SORT_ORDERS = ["created_at", "title", "artist", "year"]
+SEARCH_CASES = [
+    ("all", "night"),
+    ("title", "summer"),
+    ("artist", "davis"),
+    ("genre", "rock"),
+    ("genre", "rock and jazz"),
+    ("genre", "rock or jazz"),
+    ("genre", '"rock"'),
+    ("tag", "live"),
+    ("tag", "favoriet and remaster"),
+    ("track", "river"),
+    ("media_type", "sacd"),
+]
+REPORT_TYPES = [
+    "unused_genres", "unused_tags", "unused_artists", "low_usage_genres", "low_usage_tags",
+    "missing_covers", "missing_tracks", "missing_year", "missing_location", "missing_media", "missing_catalog",
+]
+BULK_OPS = 50
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _summarise(timings_ms: List[float], queries: Optional[int], status: int, items: Optional[int]) -> Dict:
+    return {
+        "runs": len(timings_ms),
+        "min_ms": round(min(timings_ms), 3),
+        "median_ms": round(statistics.median(timings_ms), 3),
+        "p95_ms": round(_percentile(timings_ms, 95), 3),
+        "mean_ms": round(statistics.fmean(timings_ms), 3),
+        "queries": queries,
+        "status": status,
+        "items": items,
+    }
+
+def _queries(response) -> Optional[int]:
+    match = SERVER_TIMING_QUERIES.search(response.headers.get("server-timing", ""))
+    return int(match.group(1)) if match else None
+
+def _items(response) -> Optional[int]:
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    return len(body) if isinstance(body, list) else None
+
+def time_request(client, method: str, url: str, repeat: int, warmup: int = 1, **kwargs) -> Dict:
+    for _ in range(warmup):
+        client.request(method, url, **kwargs)
+    timings = []
+    response = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+    return _summarise(timings, _queries(response), response.status_code, _items(response))
+
+def time_operations(operations) -> Dict:
+    """
+    Times a list of zero-argument callables that each perform one request.
+    """
+    timings = []
+    response = None
+    for op in operations:
+        start = time.perf_counter()
+        response = op()
+        timings.append((time.perf_counter() - start) * 1000)
+    return _summarise(timings, _queries(response), response.status_code, None)
+
+def _album_payload(i: int) -> Dict:
+    return {
+        "title": f"Benchmark Album {i}",
+        "year": 1990 + i % 30,
+        "artist_names": [f"Benchmark Artist {i % 7}"],
+        "genre_names": ["Rock", "Benchmark"],
+        "tag_ids": [1],
+        "tracks": [{"track_no": n, "title": f"Track {n}", "duration": "3:30", "disc_no": 1 + n // 12} for n in range(1, 15)],
+    }
+
+def run_scenarios(client, album_count: int, repeat: int) -> Dict[str, Dict]:
+    results: Dict[str, Dict] = {}
+    deep_offset = max(0, int(album_count * 0.9))
+
+    # Listing: every sort order, first page and a deep page
+    for sort_by in SORT_ORDERS:
+        for order in ("asc", "desc"):
+            results[f"list/{sort_by}/{order}/page1"] = time_request(
+                client, "GET", "/albums/", repeat, params={"sort_by": sort_by, "order": order, "limit": 50})
+        results[f"list/{sort_by}/desc/deep"] = time_request(
+            client, "GET", "/albums/", repeat, params={"sort_by": sort_by, "order": "desc", "offset": deep_offset, "limit": 50})
+    results["list/status/wishlist"] = time_request(client, "GET", "/albums/", repeat, params={"status": "wishlist", "limit": 50})
+
+    # Search: each filter mode, including AND/OR and exact matches
+    for filter_mode, q in SEARCH_CASES:
+        results[f"search/{filter_mode}/{q}"] = time_request(
+            client, "GET", "/search", repeat, params={"q": q, "filter": filter_mode, "status": "collection"})
+
+    # Faceted drill-down: whole collection, text plus facets
+    results["search/facets/all"] = time_request(client, "GET", "/search/facets", repeat)
+    results["search/facets/night+rock+cd"] = time_request(
+        client, "GET", "/search/facets", repeat, params={"q": "night", "genre": [1], "media_type": ["CD"], "status": ["collection"]})
+
+    # Reports and statistics
+    results["stats"] = time_request(client, "GET", "/stats", repeat)
+    results["reports/stats"] = time_request(client, "GET", "/reports/stats", repeat)
+    for report_type in REPORT_TYPES:
+        results[f"reports/details/{report_type}"] = time_request(client, "GET", f"/reports/details/{report_type}", repeat)
+    for dist_type in ("genres", "tags"):
+        results[f"reports/distribution/{dist_type}"] = time_request(client, "GET", f"/reports/distribution/{dist_type}", repeat)
+    results["metadata/genres"] = time_request(client, "GET", "/genres/", repeat)
+    results["metadata/tags"] = time_request(client, "GET", "/tags/", repeat)
+    results["metadata/artists"] = time_request(client, "GET", "/artists/", repeat)
+    results["albums/check-duplicate"] = time_request(
+        client, "GET", "/albums/check-duplicate", repeat, params={"title": "Summer Night", "artist_names": ["Miles Davis"]})
+    results["albums/detail"] = time_request(client, "GET", f"/albums/{max(1, album_count // 2)}", repeat)
+
+    # Bulk writes: sequential creates and updates, measured per operation
+    def create(i):
+        return lambda: client.post("/albums/", json=_album_payload(i))
+    results["write/create_album"] = time_operations([create(i) for i in range(BULK_OPS)])
+
+    def update(album_id, i):
+        return lambda: client.put(f"/albums/{album_id}", json={
+            "notes": f"updated {i}", "tag_ids": [1, 2], "genre_ids": [1],
+            "artist_names": ["Benchmark Artist 1"],
+            "tracks": [{"track_no": n, "title": f"Updated {n}", "duration": "4:00", "disc_no": 1} for n in range(1, 13)],
+        })
+    update_ids = [1 + (i * 7919) % album_count for i in range(BULK_OPS)]
+    results["write/update_album"] = time_operations([update(album_id, i) for i, album_id in enumerate(update_ids)])
+
+    # Streaming exports, measured end to end
+    for fmt in ("ndjson", "csv"):
+        start = time.perf_counter()
+        streamed = client.get("/export/albums", params={"format": fmt})
+        results[f"export/albums/{fmt}"] = _summarise([(time.perf_counter() - start) * 1000], _queries(streamed), streamed.status_code, None)
+        results[f"export/albums/{fmt}"]["bytes"] = len(streamed.content)
+
+    # Backup round trip: ZIP export followed by a restore of the same archive
+    start = time.perf_counter()
+    export = client.get("/export")
+    export_ms = (time.perf_counter() - start) * 1000
+    results["backup/export"] = _summarise([export_ms], _queries(export), export.status_code, None)
+    results["backup/export"]["bytes"] = len(export.content)
+    start = time.perf_counter()
+    restored = client.post("/import", files={"file": ("backup.zip", export.content, "application/zip")})
+    results["backup/import"] = _summarise([(time.perf_counter() - start) * 1000], _queries(restored), restored.status_code, None)
+
+    return results
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_database(path: Path, albums: int, seed: int) -> Dict[str, int]:
+    from sqlmodel import create_engine
+    from .synthetic import generate_collection
+
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        return generate_collection(engine, albums=albums, seed=seed)
+    finally:
+        engine.dispose()
+
+def run(sizes: List[str], repeat: int, seed: int, cache_dir: Optional[str]) -> Dict:
+    # DATA_DIR must point at a scratch directory before the app (and its engine) is imported
+    data_dir = tempfile.mkdtemp(prefix="discvault-bench-")
+    os.environ["DATA_DIR"] = data_dir
+    (Path(data_dir) / "covers").mkdir(parents=True, exist_ok=True)
+    cache = Path(cache_dir) if cache_dir else Path(data_dir) / "cache"
+    cache.mkdir(parents=True, exist_ok=True)
+
+    from fastapi.testclient import TestClient
+    from .synthetic import parse_size
+    from . import database
+    from .main import app
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "datasets": {},
+        "results": {},
+    }
+    try:
+        for size in sizes:
+            albums = parse_size(size)
+            source = cache / f"bench_{albums}_{seed}.db"
+            if not source.exists():
+                start = time.perf_counter()
+                counts = build_database(source, albums, seed)
+                counts["generate_seconds"] = round(time.perf_counter() - start, 2)
+                (cache / f"bench_{albums}_{seed}.json").write_text(json.dumps(counts))
+            else:
+                counts = json.loads((cache / f"bench_{albums}_{seed}.json").read_text())
+            report["datasets"][size] = counts
+            print(f"[{size}] dataset ready: {counts}", file=sys.stderr)
+
+            # Swap the generated database in underneath the app
+            database.engine.dispose()
+            shutil.copy(source, database.sqlite_file_name)
+            with TestClient(app) as client:
+                report["results"][size] = run_scenarios(client, albums, repeat)
+            database.engine.dispose()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return report
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Prints a median-vs-median table and returns the scenarios that regressed beyond threshold.
+    """
+    regressions = []
+    for size, scenarios in current["results"].items():
+        previous = baseline.get("results", {}).get(size)
+        if not previous:
+            continue
+        print(f"\n== {size} (baseline {baseline['meta'].get('git_revision')} -> {current['meta'].get('git_revision')}) ==")
+        for name, result in scenarios.items():
+            old = previous.get(name)
+            if not old or not old.get("median_ms"):
+                continue
+            ratio = result["median_ms"] / old["median_ms"]
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{size}:{name}")
+            elif ratio < 1 - threshold:
+                flag = "  faster"
+            print(f"{name:55s} {old['median_ms']:10.2f} -> {result['median_ms']:10.2f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="DiscVault benchmark suite")
+    parser.add_argument("--sizes", nargs="+", default=["1k"], help="Collection sizes, e.g. 1k 10k 100k")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per read scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache-dir", help="Keep generated databases here between runs")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.repeat, args.seed, args.cache_dir)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) regressed: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Optional in-process catalogue of the collection for hot read paths.
+
+Holds one compact __slots__ record per album (sort keys, status and the ids of its
+artists, genres and tags) plus the artist/genre/tag names. Album listing, sorting,
+status/id filtering, the headline stats and the distributions are then answered from
+memory; only the albums on the requested page are loaded from SQLite.
+
+Enable with DISCVAULT_CATALOGUE=1. The catalogue loads at startup and is kept current
+through crud's change listeners.
+"""
+import os
+import string
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .monitoring import registry
+from .models import Album, Artist, Genre, Tag, AlbumArtistLink, AlbumGenreLink, AlbumTagLink
+
+CATALOGUE_ENABLED = os.getenv("DISCVAULT_CATALOGUE", "0").lower() in ("1", "true", "yes")
+
+# SQLite's lower() only folds ASCII; sorting must agree with the SQL path
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+class AlbumRecord:
+    __slots__ = ("id", "title_lower", "year", "status", "created_at", "runtime_ms", "artist_ids", "genre_ids", "tag_ids")
+
+    def __init__(self, id: int, title: str, year: Optional[int], status: str, created_at: datetime, runtime_ms: Optional[int]):
+        self.id = id
+        self.title_lower = (title or "").translate(_ASCII_LOWER)
+        self.year = year
+        self.status = status
+        self.created_at = created_at
+        self.runtime_ms = runtime_ms
+        self.artist_ids = self.genre_ids = self.tag_ids = ()
+
+def _nulls_first(value):
+    # SQLite sorts NULL before any value ascending (and therefore last descending)
+    return (value is not None, value)
+
+class Catalogue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._albums: Dict[int, AlbumRecord] = {}
+        self._names: Dict[str, Dict[int, str]] = {"artists": {}, "genres": {}, "tags": {}}
+        # Albums share a handful of genre/tag combinations; one tuple per distinct combination
+        self._interned: Dict[Tuple[int, ...], Tuple[int, ...]] = {}
+        self._orders: Dict[Tuple[str, str], List[int]] = {}
+        self.loaded = False
+
+    def _intern(self, ids) -> Tuple[int, ...]:
+        key = tuple(sorted(ids))
+        return self._interned.setdefault(key, key)
+
+    def _read_albums(self, session: Session, album_ids: Optional[List[int]] = None) -> Dict[int, AlbumRecord]:
+        def scoped(statement, column):
+            return statement if album_ids is None else statement.where(column.in_(album_ids))
+
+        records = {
+            row[0]: AlbumRecord(*row)
+            # Archived albums are left out, so refreshing an album that was archived drops it
+            for row in session.exec(scoped(select(Album.id, Album.title, Album.year, Album.status, Album.created_at, Album.runtime_ms)
+                                           .where(Album.archived_at == None), Album.id)).all()
+        }
+        for attr, link_model, column in (("artist_ids", AlbumArtistLink, AlbumArtistLink.artist_id),
+                                         ("genre_ids", AlbumGenreLink, AlbumGenreLink.genre_id),
+                                         ("tag_ids", AlbumTagLink, AlbumTagLink.tag_id)):
+            linked: Dict[int, List[int]] = {}
+            for album_id, item_id in session.exec(scoped(select(link_model.album_id, column), link_model.album_id)).all():
+                linked.setdefault(album_id, []).append(item_id)
+            for album_id, ids in linked.items():
+                if album_id in records:
+                    setattr(records[album_id], attr, self._intern(ids))
+        return records
+
+    def _read_names(self, session: Session, kind: str, ids: Optional[List[int]] = None) -> Dict[int, str]:
+        model = {"artists": Artist, "genres": Genre, "tags": Tag}[kind]
+        statement = select(model.id, model.name)
+        if ids is not None:
+            statement = statement.where(model.id.in_(ids))
+        return {item_id: sys.intern(name) for item_id, name in session.exec(statement).all()}
+
+    def load(self, session: Session):
+        self._interned = {}
+        albums = self._read_albums(session)
+        names = {kind: self._read_names(session, kind) for kind in self._names}
+        with self._lock:
+            self._albums = albums
+            self._names = names
+            self._orders = {}
+            self.loaded = True
+
+    def refresh_albums(self, session: Session, album_ids: List[int]):
+        records = self._read_albums(session, album_ids)
+        # Names the albums link to but the index hasn't seen (a writer that didn't announce
+        # them): fetched here so sorting by artist doesn't treat them as missing
+        missing = {}
+        for kind, attr in (("artists", "artist_ids"), ("genres", "genre_ids"), ("tags", "tag_ids")):
+            unknown = {i for r in records.values() for i in getattr(r, attr)} - self._names[kind].keys()
+            if unknown:
+                missing[kind] = self._read_names(session, kind, list(unknown))
+        with self._lock:
+            for kind, names in missing.items():
+                self._names[kind].update(names)
+            for album_id in album_ids:
+                if album_id in records:
+                    self._albums[album_id] = records[album_id]
+                else:
+                    self._albums.pop(album_id, None)
+            self._orders = {}
+
+    def refresh_names(self, session: Session, kind: str, ids: List[int]):
+        names = self._read_names(session, kind, ids)
+        with self._lock:
+            for item_id in ids:
+                if item_id in names:
+                    self._names[kind][item_id] = names[item_id]
+                else:
+                    self._names[kind].pop(item_id, None)
+            if kind == "artists":
+                self._orders = {}
+
+    def on_change(self, session: Session, kind: str, ids: Optional[List[int]]):
+        # crud change listener
+        if ids is None:
+            self.load(session)
+        elif kind == "albums":
+            self.refresh_albums(session, ids)
+        elif kind in self._names:
+            self.refresh_names(session, kind, ids)
+
+    def _artist_key(self, record: AlbumRecord) -> Optional[str]:
+        names = self._names["artists"]
+        return min((names[i] for i in record.artist_ids if i in names), default=None)
+
+    def _order(self, sort_by: str, order: str) -> List[int]:
+        # Same ordering as crud.get_albums: primary key in the requested direction, then
+        # artist and title ascending. Sorting least significant key first keeps it stable.
+        cached = self._orders.get((sort_by, order))
+        if cached is not None:
+            return cached
+        descending = order == "desc"
+        artist = {r.id: _nulls_first(self._artist_key(r)) for r in self._albums.values()}
+        records = list(self._albums.values())
+        if sort_by == "title":
+            records.sort(key=lambda r: artist[r.id])
+            records.sort(key=lambda r: r.title_lower, reverse=descending)
+        elif sort_by == "artist":
+            records.sort(key=lambda r: r.title_lower)
+            records.sort(key=lambda r: artist[r.id], reverse=descending)
+        else:
+            records.sort(key=lambda r: r.title_lower)
+            records.sort(key=lambda r: artist[r.id])
+            if sort_by == "year":
+                records.sort(key=lambda r: _nulls_first(r.year), reverse=descending)
+            else:
+                if sort_by != "created_at":
+                    descending = True
+                records.sort(key=lambda r: _nulls_first(r.created_at), reverse=descending)
+        ids = [r.id for r in records]
+        self._orders[(sort_by, order)] = ids
+        return ids
+
+    def page(self, offset: int, limit: int, sort_by: str, order: str, album_ids: Optional[List[int]] = None, status: Optional[str] = None) -> List[int]:
+        with self._lock:
+            ordered = self._order(sort_by, order)
+            if album_ids is None and status is None:
+                return ordered[offset:offset + limit]
+            wanted = set(album_ids) if album_ids is not None else None
+            albums = self._albums
+            page, skipped = [], 0
+            for album_id in ordered:
+                if wanted is not None and album_id not in wanted:
+                    continue
+                if status is not None and albums[album_id].status != status:
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                page.append(album_id)
+                if len(page) >= limit:
+                    break
+            return page
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            collection = [r for r in self._albums.values() if r.status == "collection"]
+            return {
+                "albums": len(collection),
+                "artists": len(self._names["artists"]),
+                "genres": len(self._names["genres"]),
+                "runtime_ms": sum(r.runtime_ms for r in collection if r.runtime_ms),
+            }
+
+    def distribution(self, kind: str, limit: int = 10) -> List[Dict]:
+        attr = {"genres": "genre_ids", "tags": "tag_ids"}[kind]
+        with self._lock:
+            names = self._names[kind]
+            totals = Counter()
+            for record in self._albums.values():
+                if record.status == "collection":
+                    for item_id in getattr(record, attr):
+                        if item_id in names:
+                            totals[names[item_id]] += 1
+        return [{"name": name, "count": count} for name, count in totals.most_common(limit)]
+
+    def memory_stats(self) -> Dict:
+        """
+        Approximate footprint: records, their title and date objects, the shared id
+        tuples and the name tables.
+        """
+        with self._lock:
+            records = list(self._albums.values())
+            album_bytes = sum(
+                sys.getsizeof(r) + sys.getsizeof(r.title_lower) + sys.getsizeof(r.created_at)
+                for r in records
+            ) + sys.getsizeof(self._albums)
+            tuple_bytes = sum(sys.getsizeof(t) for t in self._interned.values()) + sys.getsizeof(self._interned)
+            name_bytes = sum(
+                sys.getsizeof(table) + sum(sys.getsizeof(name) for name in table.values())
+                for table in self._names.values()
+            )
+            total = album_bytes + tuple_bytes + name_bytes
+            return {
+                "enabled": CATALOGUE_ENABLED,
+                "loaded": self.loaded,
+                "albums": len(records),
+                "bytes": total,
+                "bytes_per_album": round(total / len(records), 1) if records else 0,
+                "shared_id_tuples": len(self._interned),
+            }
+
+index = Catalogue()
+
+registry.gauge("discvault_catalogue_albums", "Albums held in the in-memory catalogue.", fn=lambda: len(index._albums))
+registry.gauge("discvault_catalogue_bytes", "Approximate memory used by the in-memory catalogue.", fn=lambda: index.memory_stats()["bytes"] if index.loaded else 0)
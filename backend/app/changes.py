@@ -0,0 +1,125 @@
+"""
+Change tracking for delta sync.
+
+SQLite triggers record every write to albums, artists, genres, tags and locations in
+change_log under a monotonic sequence number (AUTOINCREMENT never reuses one). Writes
+to tracks and link tables count as a change of their album. The log keeps one row per
+entity: a newer change replaces the older row, and a delete leaves a tombstone. The log
+therefore stays as large as the set of entities ever touched, and a client asking for
+everything after its token reads only what changed since.
+
+Tokens are "<epoch>:<seq>". The epoch is created with the log and replaced on every backup
+restore, so a token from another database, or from before a restore of this one, is
+recognised and the client is told to reload. Archived albums are reported as deleted:
+sync clients only mirror the active collection.
+"""
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlmodel import Session, select, text
+
+from .models import Album, AlbumRead, Artist, Genre, Tag, Location
+from . import crud
+
+ENTITIES = {"albums": Album, "artists": Artist, "genres": Genre, "tags": Tag, "locations": Location}
+# Tables whose rows belong to an album
+ALBUM_CHILDREN = ["tracks", "album_artist_links", "album_genre_links", "album_tag_links"]
+
+def _record(kind: str, ref: str, deleted: int) -> str:
+    return f"INSERT OR REPLACE INTO change_log (kind, entity_id, deleted) VALUES ('{kind}', {ref}, {deleted});"
+
+def _record_album(ref: str) -> str:
+    # Child rows removed together with their album must not overwrite the album's tombstone
+    return (f"INSERT OR REPLACE INTO change_log (kind, entity_id, deleted) "
+            f"SELECT 'albums', {ref}, 0 WHERE EXISTS (SELECT 1 FROM albums WHERE id = {ref});")
+
+def init_change_log(session: Session):
+    session.exec(text("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (kind, entity_id)
+    );
+    """))
+    session.exec(text("CREATE TABLE IF NOT EXISTS change_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"))
+    _set_epoch(session, replace=False)
+
+    for kind, model in ENTITIES.items():
+        table = model.__tablename__
+        session.exec(text(f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN {_record(kind, 'new.id', 0)} END;"))
+        session.exec(text(f"CREATE TRIGGER IF NOT EXISTS {table}_changes_au AFTER UPDATE ON {table} BEGIN {_record(kind, 'new.id', 0)} END;"))
+        session.exec(text(f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN {_record(kind, 'old.id', 1)} END;"))
+    for table in ALBUM_CHILDREN:
+        session.exec(text(f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN {_record_album('new.album_id')} END;"))
+        session.exec(text(f"CREATE TRIGGER IF NOT EXISTS {table}_changes_au AFTER UPDATE ON {table} BEGIN "
+                          f"{_record_album('old.album_id')} {_record_album('new.album_id')} END;"))
+        session.exec(text(f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN {_record_album('old.album_id')} END;"))
+    session.commit()
+
+def _set_epoch(session: Session, replace: bool):
+    verb = "REPLACE" if replace else "IGNORE"
+    session.exec(text(f"INSERT OR {verb} INTO change_meta (key, value) VALUES ('epoch', :epoch)"), params={"epoch": uuid.uuid4().hex[:12]})
+
+def rotate_epoch(session: Session):
+    """
+    Starts a new epoch after the database was replaced: a restored log's seq can be behind
+    tokens handed out before, so every client has to reload.
+    """
+    _set_epoch(session, replace=True)
+    session.commit()
+
+def _epoch(session: Session) -> str:
+    return session.exec(text("SELECT value FROM change_meta WHERE key = 'epoch'")).one()[0]
+
+def _current_seq(session: Session) -> int:
+    return session.exec(text("SELECT COALESCE(MAX(seq), 0) FROM change_log")).one()[0]
+
+def parse_token(token: Optional[str]) -> Tuple[Optional[str], int]:
+    if not token or ":" not in token:
+        return None, 0
+    epoch, _, seq = token.partition(":")
+    return epoch, int(seq) if seq.isdigit() else 0
+
+def get_changes(session: Session, since: Optional[str], limit: int = 500) -> Dict:
+    """
+    Everything that changed after the token, up to limit log entries: current rows for
+    created or updated entities (albums as AlbumRead, with relationships) and ids of
+    deleted or archived ones. "more" means another call with the returned token is needed.
+
+    Without a valid token the response only carries the current token and reset=true:
+    fetch the token first, then the full lists, then poll with the token.
+    """
+    epoch = _epoch(session)
+    token_epoch, seq = parse_token(since)
+    if token_epoch != epoch:
+        return {"token": f"{epoch}:{_current_seq(session)}", "reset": True, "more": False}
+
+    rows = session.exec(
+        text("SELECT seq, kind, entity_id, deleted FROM change_log WHERE seq > :seq ORDER BY seq LIMIT :limit"),
+        params={"seq": seq, "limit": limit},
+    ).all()
+    changed: Dict[str, List[int]] = {kind: [] for kind in ENTITIES}
+    deleted: Dict[str, List[int]] = {kind: [] for kind in ENTITIES}
+    for _, kind, entity_id, is_deleted in rows:
+        if kind in ENTITIES:
+            (deleted if is_deleted else changed)[kind].append(entity_id)
+
+    result = {"token": f"{epoch}:{rows[-1][0] if rows else seq}", "reset": False, "more": len(rows) == limit}
+    for kind, model in ENTITIES.items():
+        ids = changed[kind]
+        if not ids:
+            items = []
+        elif kind == "albums":
+            items = []
+            for album in crud.get_albums_by_ids(session, ids):
+                if album.archived_at is None:
+                    items.append(AlbumRead.model_validate(album))
+                else:
+                    deleted[kind].append(album.id)
+        else:
+            items = session.exec(select(model).where(model.id.in_(ids))).all()
+        result[kind] = {"upserted": items, "deleted": deleted[kind]}
+    return result
@@ -0,0 +1,377 @@
+"""
+Offline administration for DiscVault, without a running server:
+
+    python main.py stats
+    python main.py check --full
+    python main.py import cues /music/rips --workers 8
+    python main.py export albums --format csv -o albums.csv
+
+Quick commands (stats, check, reindex) talk to the database file with the standard sqlite3
+module only, so they start as fast as Python itself. Everything else shares the crud layer,
+which is imported per command together with whatever that command needs (SQLModel, httpx,
+uvicorn); nothing heavy is imported at module level.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Same default as database.py, which is not imported here because it pulls in SQLModel
+DATA_DIR = Path(os.getenv("DATA_DIR", str(Path(__file__).parent.parent.parent / "data")))
+DB_PATH = DATA_DIR / "discvault.db"
+COVERS_PATH = DATA_DIR / "covers"
+
+ORPHAN_CHECKS = {
+    "tracks without album": "SELECT COUNT(*) FROM tracks WHERE album_id NOT IN (SELECT id FROM albums)",
+    "artist links without album or artist": "SELECT COUNT(*) FROM album_artist_links "
+        "WHERE album_id NOT IN (SELECT id FROM albums) OR artist_id NOT IN (SELECT id FROM artists)",
+    "genre links without album or genre": "SELECT COUNT(*) FROM album_genre_links "
+        "WHERE album_id NOT IN (SELECT id FROM albums) OR genre_id NOT IN (SELECT id FROM genres)",
+    "tag links without album or tag": "SELECT COUNT(*) FROM album_tag_links "
+        "WHERE album_id NOT IN (SELECT id FROM albums) OR tag_id NOT IN (SELECT id FROM tags)",
+    "albums with a stale runtime": "SELECT COUNT(*) FROM albums "
+        "WHERE runtime_ms IS NOT (SELECT SUM(duration_ms) FROM tracks WHERE tracks.album_id = albums.id)",
+    "albums without duplicate keys": "SELECT COUNT(*) FROM albums WHERE title_key IS NULL",
+}
+
+def _print(data):
+    print(json.dumps(data, indent=2, ensure_ascii=False, default=str))
+
+def _require_database():
+    if not DB_PATH.exists():
+        raise SystemExit(f"No database at {DB_PATH} (set DATA_DIR or start the server once)")
+
+def _connect() -> sqlite3.Connection:
+    _require_database()
+    return sqlite3.connect(DB_PATH, timeout=30)
+
+def _scalar(conn: sqlite3.Connection, sql: str):
+    return conn.execute(sql).fetchone()[0]
+
+def _local_covers(conn: sqlite3.Connection) -> Dict[str, int]:
+    # Stored cover file name -> album id, for covers we downloaded or received ourselves
+    rows = conn.execute("SELECT id, cover_url FROM albums WHERE cover_url LIKE '/covers/%'")
+    return {Path(url.split("?")[0]).name: album_id for album_id, url in rows}
+
+# --- Quick commands (sqlite3 only) ---
+def cmd_stats(args) -> int:
+    with _connect() as conn:
+        by_status = dict(conn.execute("SELECT status, COUNT(*) FROM albums WHERE archived_at IS NULL GROUP BY status"))
+        cover_files = list(COVERS_PATH.iterdir()) if COVERS_PATH.is_dir() else []
+        page_size = _scalar(conn, "PRAGMA page_size")
+        _print({
+            "database": str(DB_PATH),
+            "albums": by_status,
+            "archived": _scalar(conn, "SELECT COUNT(*) FROM albums WHERE archived_at IS NOT NULL"),
+            "tracks": _scalar(conn, "SELECT COUNT(*) FROM tracks"),
+            "artists": _scalar(conn, "SELECT COUNT(*) FROM artists"),
+            "genres": _scalar(conn, "SELECT COUNT(*) FROM genres"),
+            "tags": _scalar(conn, "SELECT COUNT(*) FROM tags"),
+            "runtime_ms": _scalar(conn, "SELECT COALESCE(SUM(runtime_ms), 0) FROM albums WHERE archived_at IS NULL"),
+            "database_bytes": _scalar(conn, "PRAGMA page_count") * page_size,
+            "free_bytes": _scalar(conn, "PRAGMA freelist_count") * page_size,
+            "cover_files": len(cover_files),
+            "cover_bytes": sum(f.stat().st_size for f in cover_files if f.is_file()),
+        })
+    return 0
+
+def cmd_check(args) -> int:
+    """
+    Read-only consistency checks; exits with 1 when anything needs attention.
+    """
+    problems = 0
+
+    def report(name: str, count: int, hint: str = ""):
+        nonlocal problems
+        problems += count
+        print(f"{'ok' if not count else 'FAIL':4s}  {name}" + (f": {count}{hint}" if count else ""))
+
+    with _connect() as conn:
+        pragma = "integrity_check" if args.full else "quick_check"
+        errors = [row[0] for row in conn.execute(f"PRAGMA {pragma}") if row[0] != "ok"]
+        report(pragma, len(errors))
+        for error in errors[:20]:
+            print(f"      {error}")
+        report("foreign keys", len(conn.execute("PRAGMA foreign_key_check").fetchall()))
+        for name, sql in ORPHAN_CHECKS.items():
+            report(name, _scalar(conn, sql), " (run rebuild-stats)" if name.startswith("albums") else "")
+        try:
+            # For an external-content table, rank 1 also compares the index against albums
+            conn.execute("INSERT INTO album_search(album_search, rank) VALUES('integrity-check', 1)")
+            report("search index", 0)
+        except sqlite3.DatabaseError as e:
+            report("search index", 1, f" ({e}; run reindex)")
+        covers = _local_covers(conn)
+
+    files = {f.name for f in COVERS_PATH.iterdir() if f.is_file()} if COVERS_PATH.is_dir() else set()
+    report("albums with a missing cover file", len(covers.keys() - files))
+    report("cover files without album", len(files - covers.keys()))
+    return 1 if problems else 0
+
+def cmd_reindex(args) -> int:
+    start = time.perf_counter()
+    with _connect() as conn:
+        if not _scalar(conn, "SELECT COUNT(*) FROM sqlite_master WHERE name = 'album_search'"):
+            # Never opened by the server: let the application create the table and its triggers
+            _session().close()
+        conn.execute("INSERT INTO album_search(album_search) VALUES('rebuild')")
+        conn.execute("INSERT INTO album_search(album_search) VALUES('optimize')")
+        conn.execute("ANALYZE")
+    print(f"Search index rebuilt and statistics refreshed in {time.perf_counter() - start:.2f}s")
+    return 0
+
+# --- Commands on the crud layer ---
+def _session():
+    """
+    Opens a Session on the application database, creating missing tables, indexes and
+    triggers first (without the full search rebuild the server does at startup).
+    """
+    from sqlmodel import Session
+    from . import changes
+    from .database import create_db_and_tables, engine, init_fts
+
+    COVERS_PATH.mkdir(parents=True, exist_ok=True)
+    create_db_and_tables()
+    session = Session(engine)
+    init_fts(session, rebuild=False)
+    changes.init_change_log(session)
+    return session
+
+def cmd_rebuild_stats(args) -> int:
+    from . import crud
+    start = time.perf_counter()
+    with _session() as session:
+        result = crud.rebuild_album_caches(session)
+    _print({**result, "seconds": round(time.perf_counter() - start, 2)})
+    return 0
+
+def cmd_export(args) -> int:
+    from . import exports
+    if args.what == "backup":
+        from . import backup
+        if not args.output:
+            raise SystemExit("export backup needs --output")
+        with _session() as session:
+            backup.write_backup(args.output, session)
+        print(f"Backup written to {args.output}")
+        return 0
+
+    if args.what == "tracks" and args.format not in ("ndjson", "csv"):
+        raise SystemExit("Tracks can be exported as ndjson or csv")
+    if args.format == "parquet":
+        if not exports.parquet_available():
+            raise SystemExit("Parquet export requires the optional pyarrow package")
+        if not args.output:
+            raise SystemExit("Parquet export needs --output")
+    _require_database()
+    if args.format == "parquet":
+        chunks = exports.stream_albums_parquet(args.status)
+    elif args.what == "albums":
+        chunks = exports.stream_albums(args.format, args.status)
+    else:
+        chunks = exports.stream_tracks(args.format, args.status)
+
+    if args.output:
+        with (open(args.output, "wb") if args.format == "parquet" else open(args.output, "w", encoding="utf-8", newline="")) as f:
+            for chunk in chunks:
+                f.write(chunk)
+    else:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+    return 0
+
+def cmd_import(args) -> int:
+    if args.what == "backup":
+        import tempfile
+        from . import backup
+        if not args.yes:
+            raise SystemExit("Restoring a backup replaces the whole collection; pass --yes to confirm")
+        with open(args.path, "rb") as f, tempfile.TemporaryDirectory() as temp_dir:
+            if not backup.restore_backup(f, temp_dir):
+                raise SystemExit("Invalid backup: discvault.db is missing")
+        print(f"Collection restored from {args.path}")
+        return 0
+
+    from . import discid
+    root = Path(args.path)
+    if not root.is_dir():
+        raise SystemExit(f"Not a directory: {root}")
+    start = time.perf_counter()
+    with _session() as session:
+        report = discid.import_cue_directory(session, root, status=args.status, dry_run=args.dry_run, workers=args.workers)
+    _print({"scanned": report["scanned"], "created": report["created"], "skipped": len(report["skipped"]),
+            "errors": report["errors"], "seconds": round(time.perf_counter() - start, 2)})
+    return 1 if report["errors"] else 0
+
+def cmd_covers(args) -> int:
+    if args.action == "hash":
+        return _hash_covers(args)
+    if args.action == "placeholders":
+        return _cover_placeholders(args)
+
+    import asyncio
+    from .covers import external_covers, pull_external_cover
+
+    with _session() as session:
+        albums = list(external_covers(session))
+
+    async def pull_all() -> List[bool]:
+        # The downloads overlap; the database writes still go one by one through the blocking executor
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def pull(album_id: int, url: str) -> bool:
+            async with semaphore:
+                return await pull_external_cover(album_id, url)
+        return await asyncio.gather(*(pull(album_id, url) for album_id, url in albums))
+
+    pulled = sum(asyncio.run(pull_all())) if albums else 0
+    _print({"external": len(albums), "pulled": pulled, "failed": len(albums) - pulled})
+    return 0 if pulled == len(albums) else 1
+
+def _hash_covers(args) -> int:
+    from . import coverhash
+    if not coverhash.available():
+        raise SystemExit("Cover hashing requires the optional Pillow and NumPy packages")
+    start = time.perf_counter()
+    with _session() as session:
+        pending = coverhash.pending_covers(session, rehash=args.rehash)
+    result = coverhash.hash_covers(pending, workers=args.workers)
+    _print({**result, "seconds": round(time.perf_counter() - start, 2)})
+    return 0 if not result["failed"] else 1
+
+def _cover_placeholders(args) -> int:
+    from . import placeholders
+    if not placeholders.available():
+        raise SystemExit("Cover placeholders require the optional Pillow and NumPy packages")
+    start = time.perf_counter()
+    with _session() as session:
+        pending = placeholders.pending_covers(session, refresh=args.rehash)
+    result = placeholders.compute_placeholders(pending, workers=args.workers)
+    _print({**result, "seconds": round(time.perf_counter() - start, 2)})
+    return 0 if not result["failed"] else 1
+
+def cmd_purge_archived(args) -> int:
+    from datetime import datetime, timedelta
+    from . import crud
+    from .covers import remove_cover_files
+    from .database import optimize_fts, reclaim_space
+
+    albums = covers = 0
+    with _session() as session:
+        album_ids = crud.archived_album_ids(session, datetime.utcnow() - timedelta(days=args.older_than_days))
+        for i in range(0, len(album_ids), crud.PURGE_BATCH):
+            deleted = crud.delete_albums(session, album_ids[i:i + crud.PURGE_BATCH])
+            covers += remove_cover_files([url for _, url in deleted])
+            albums += len(deleted)
+        optimize_fts(session)
+    _print({"albums": albums, "covers": covers, **reclaim_space()})
+    return 0
+
+def cmd_vacuum(args) -> int:
+    from .database import optimize_fts, reclaim_space
+    with _session() as session:
+        optimize_fts(session)
+    _print(reclaim_space())
+    return 0
+
+TOOLS = {
+    "benchmark": "Run the benchmark suite",
+    "loadtest": "Run a concurrent load test against a local server",
+    "queryplan": "Run the query plan checks",
+    "mbstore": "Build or query the offline MusicBrainz store",
+}
+
+def run_tool(name: str, argv: List[str]) -> int:
+    # The existing module CLIs under one entry point; their arguments pass through untouched
+    if name == "benchmark":
+        from . import benchmark
+        return benchmark.main(argv)
+    if name == "loadtest":
+        from . import loadtest
+        return loadtest.main(argv)
+    if name == "queryplan":
+        from . import queryplan
+        return queryplan.main(argv)
+    from . import mbstore
+    sys.argv = [f"{sys.argv[0]} mbstore"] + argv
+    mbstore.main()
+    return 0
+
+def cmd_serve(args) -> int:
+    import uvicorn
+    uvicorn.run("backend.app.main:app", host=args.host, port=args.port, reload=args.reload)
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in TOOLS:
+        return run_tool(argv[0], argv[1:])
+
+    parser = argparse.ArgumentParser(prog="discvault", description="DiscVault administration")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress of background work")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("stats", help="Collection and database statistics").set_defaults(func=cmd_stats)
+    check = sub.add_parser("check", help="Integrity check of database, search index and cover files")
+    check.add_argument("--full", action="store_true", help="Full integrity_check instead of quick_check")
+    check.set_defaults(func=cmd_check)
+    sub.add_parser("reindex", help="Rebuild the search index and query planner statistics").set_defaults(func=cmd_reindex)
+    sub.add_parser("rebuild-stats", help="Recompute cached runtimes and duplicate-detection keys").set_defaults(func=cmd_rebuild_stats)
+
+    export = sub.add_parser("export", help="Export a ZIP backup or the albums/tracks as a file")
+    export.add_argument("what", choices=["backup", "albums", "tracks"])
+    export.add_argument("-o", "--output", help="Target file (albums and tracks default to stdout)")
+    export.add_argument("--format", default="ndjson", choices=["ndjson", "csv", "parquet"])
+    export.add_argument("--status", choices=["collection", "wishlist"])
+    export.set_defaults(func=cmd_export)
+
+    load = sub.add_parser("import", help="Restore a ZIP backup or import a directory of cue sheets")
+    load.add_argument("what", choices=["backup", "cues"])
+    load.add_argument("path")
+    load.add_argument("--status", default="collection", choices=["collection", "wishlist"])
+    load.add_argument("--dry-run", action="store_true", help="Only report what a cue import would create")
+    load.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes parsing cue sheets")
+    load.add_argument("--yes", action="store_true", help="Confirm replacing the collection with a backup")
+    load.set_defaults(func=cmd_import)
+
+    covers = sub.add_parser("covers", help="Download external covers, or compute perceptual hashes or placeholders of stored ones")
+    covers.add_argument("action", choices=["pull", "hash", "placeholders"])
+    covers.add_argument("--concurrency", type=int, default=8, help="Parallel downloads (pull)")
+    covers.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes decoding covers (hash, placeholders)")
+    covers.add_argument("--rehash", action="store_true", help="Process every cover again, not only new ones (hash, placeholders)")
+    covers.set_defaults(func=cmd_covers)
+
+    purge = sub.add_parser("purge-archived", help="Delete long-archived albums and reclaim their space")
+    purge.add_argument("--older-than-days", type=int, default=30)
+    purge.set_defaults(func=cmd_purge_archived)
+    sub.add_parser("vacuum", help="Compact the search index and return free pages to the file system").set_defaults(func=cmd_vacuum)
+
+    for name, description in TOOLS.items():
+        # Listed for --help only; main() hands these over before argparse sees their options
+        sub.add_parser(name, help=description, add_help=False)
+
+    serve = sub.add_parser("serve", help="Run the API server")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--reload", action="store_true")
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    if args.verbose:
+        import logging
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    try:
+        code = args.func(args)
+        sys.stdout.flush()
+        return code
+    except BrokenPipeError:
+        # Piped into head and the like: stop quietly, and keep the exit flush from failing too
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
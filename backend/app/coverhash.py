@@ -0,0 +1,251 @@
+"""
+Perceptual hashes of stored covers: the same artwork on different pressings, and the album
+that belongs to a photo of a sleeve.
+
+Every local cover gets an aHash (8x8 block means against their mean) and a pHash (the low
+8x8 DCT coefficients of a 32x32 greyscale thumbnail against their median), 64 bits each.
+Covers are decoded and hashed in batches in a process pool, the DCT as two matrix products
+over the whole batch. Decoding and hashing need the optional Pillow and NumPy packages.
+
+Lookups use multi-index hashing: the pHash is stored as four indexed 16-bit segments, and
+two hashes within distance d share at least one segment within distance d // 4. A query
+probes the indexes for every segment variant within that radius and ranks the few
+candidates by their exact Hamming distance.
+"""
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, bindparam
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select, text
+
+from . import covers
+from .database import engine
+from .models import Album
+
+HASH_SIZE = 8
+IMAGE_SIZE = 32
+SEGMENTS = 4
+SEGMENT_BITS = 16
+HASH_MASK = (1 << 64) - 1
+# Up to 3 bits per segment: 4 x 697 index probes
+MAX_DISTANCE = 15
+DUPLICATE_DISTANCE = 3
+# Beyond 3 every hash probes 17+ variants per segment: seconds instead of ~1 s at 100k covers
+MAX_DUPLICATE_DISTANCE = 7
+BATCH_SIZE = 64
+
+# Only hashes of the album's current cover count, and archived albums stay out of lookups.
+# CROSS JOIN keeps cover_hashes as the outer loop so the segment indexes drive every lookup.
+_CURRENT = ("CROSS JOIN albums ON albums.id = cover_hashes.album_id "
+            "WHERE albums.cover_url = cover_hashes.cover_url AND albums.archived_at IS NULL")
+_NEIGHBOURS = text(
+    f"SELECT cover_hashes.album_id, cover_hashes.phash FROM cover_hashes {_CURRENT} AND (cover_hashes.phash_0 IN :s0 "
+    "OR cover_hashes.phash_1 IN :s1 OR cover_hashes.phash_2 IN :s2 OR cover_hashes.phash_3 IN :s3)"
+).bindparams(*[bindparam(f"s{i}", expanding=True) for i in range(SEGMENTS)])
+_STORE = text(
+    "INSERT OR REPLACE INTO cover_hashes (album_id, cover_url, ahash, phash, phash_0, phash_1, phash_2, phash_3, computed_at) "
+    "VALUES (:album_id, :cover_url, :ahash, :phash, :phash_0, :phash_1, :phash_2, :phash_3, :computed_at)"
+).bindparams(bindparam("computed_at", type_=DateTime()))
+
+@lru_cache(maxsize=1)
+def available() -> bool:
+    try:
+        import numpy  # noqa: F401
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+# --- Hashing (runs in worker processes) ---
+@lru_cache(maxsize=1)
+def _dct_rows():
+    # The first HASH_SIZE rows of the (unscaled) DCT-II matrix; scaling doesn't change any sign
+    import numpy as np
+    k = np.arange(HASH_SIZE)[:, None]
+    n = np.arange(IMAGE_SIZE)[None, :]
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * IMAGE_SIZE)).astype(np.float32)
+
+def _to_ints(bits) -> List[int]:
+    import numpy as np
+    return [int(value) for value in np.packbits(bits, axis=1).view(">u8").ravel()]
+
+def hash_pixels(pixels) -> Tuple[List[int], List[int]]:
+    """
+    aHashes and pHashes for a (n, 32, 32) batch of greyscale thumbnails.
+    """
+    import numpy as np
+    n = len(pixels)
+    block = IMAGE_SIZE // HASH_SIZE
+    means = pixels.reshape(n, HASH_SIZE, block, HASH_SIZE, block).mean(axis=(2, 4)).reshape(n, -1)
+    ahash = means > means.mean(axis=1, keepdims=True)
+    dct = _dct_rows()
+    low = (dct @ pixels @ dct.T).reshape(n, -1)
+    # The DC term only says how bright the cover is and would skew the median
+    phash = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return _to_ints(ahash), _to_ints(phash)
+
+def _thumbnail(source):
+    import numpy as np
+    from PIL import Image
+    with Image.open(source) as image:
+        # JPEGs decode straight at a fraction of their size, far cheaper than a full decode
+        image.draft("L", (IMAGE_SIZE * 2, IMAGE_SIZE * 2))
+        return np.asarray(image.convert("L").resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.BOX), dtype=np.float32)
+
+def hash_image(source) -> Tuple[int, int]:
+    """
+    (aHash, pHash) of one image file or file object. Raises ValueError if it can't be decoded.
+    """
+    try:
+        pixels = _thumbnail(source)
+    except Exception as e:
+        raise ValueError(f"Unreadable image: {e}") from e
+    ahashes, phashes = hash_pixels(pixels[None])
+    return ahashes[0], phashes[0]
+
+def hash_files(items: List[Tuple[int, str]]) -> List[Tuple[int, Optional[int], Optional[int]]]:
+    """
+    (album_id, aHash, pHash) per (album_id, path); None hashes for files that can't be decoded.
+    Top-level so worker processes can run it.
+    """
+    import numpy as np
+    results, decoded, thumbnails = [], [], []
+    for album_id, path in items:
+        try:
+            thumbnails.append(_thumbnail(path))
+            decoded.append(album_id)
+        except Exception:
+            # Missing, truncated or not an image at all: reported as failed, retried next run
+            results.append((album_id, None, None))
+    if thumbnails:
+        ahashes, phashes = hash_pixels(np.stack(thumbnails))
+        results.extend(zip(decoded, ahashes, phashes))
+    return results
+
+# --- Storage ---
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _segments(value: int) -> List[int]:
+    value &= HASH_MASK
+    return [(value >> (SEGMENT_BITS * (SEGMENTS - 1 - i))) & 0xFFFF for i in range(SEGMENTS)]
+
+def distance(a: int, b: int) -> int:
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+def store_hashes(session: Session, rows: List[Tuple[int, str, int, int]]):
+    now = datetime.utcnow()
+    params = []
+    for album_id, cover_url, ahash, phash in rows:
+        segments = _segments(phash)
+        params.append({"album_id": album_id, "cover_url": cover_url, "ahash": _signed(ahash), "phash": _signed(phash),
+                       **{f"phash_{i}": segment for i, segment in enumerate(segments)}, "computed_at": now})
+    if params:
+        session.exec(_STORE, params=params)
+        session.commit()
+
+def pending_covers(session: Session, rehash: bool = False) -> List[Tuple[int, str]]:
+    """
+    (album_id, cover_url) of stored covers without a current hash (all of them with rehash).
+    """
+    sql = ("SELECT albums.id, albums.cover_url FROM albums LEFT JOIN cover_hashes ON cover_hashes.album_id = albums.id "
+           "AND cover_hashes.cover_url = albums.cover_url WHERE albums.cover_url LIKE '/covers/%'")
+    if not rehash:
+        sql += " AND cover_hashes.album_id IS NULL"
+    return [(row[0], row[1]) for row in session.exec(text(sql + " ORDER BY albums.id")).all()]
+
+def hash_covers(pending: List[Tuple[int, str]], workers: Optional[int] = None,
+                progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Hashes the given covers in a process pool and stores them batch by batch.
+    progress(hashed, failed) is called after every batch.
+    """
+    urls = dict(pending)
+    items = [(album_id, str(covers.cover_file(url))) for album_id, url in pending]
+    hashed = failed = 0
+    for results in covers.map_cover_batches(hash_files, items, BATCH_SIZE, workers):
+        rows = [(album_id, urls[album_id], ahash, phash) for album_id, ahash, phash in results if phash is not None]
+        with Session(engine) as session:
+            store_hashes(session, rows)
+        hashed += len(rows)
+        failed += len(results) - len(rows)
+        if progress:
+            progress(len(rows), len(results) - len(rows))
+    return {"hashed": hashed, "failed": failed}
+
+def hash_cover(album_id: int, cover_url: str) -> List[Tuple[int, str, int, int]]:
+    """
+    Rows for store_hashes for one album's cover right after it was stored; empty if it
+    can't be decoded (the batch job picks those up).
+    """
+    path = covers.cover_file(cover_url)
+    if path is None:
+        return []
+    return [(album_id, cover_url, ahash, phash) for _, ahash, phash in hash_files([(album_id, str(path))])
+            if phash is not None]
+
+# --- Lookups ---
+@lru_cache(maxsize=None)
+def _masks(radius: int) -> Tuple[int, ...]:
+    # Every 16-bit pattern with at most radius bits set, fewest first
+    return tuple(sorted((m for m in range(1 << SEGMENT_BITS) if m.bit_count() <= radius), key=int.bit_count))
+
+def _summaries(session: Session, album_ids: List[int]) -> Dict[int, Dict]:
+    albums = session.exec(select(Album).where(Album.id.in_(album_ids)).options(selectinload(Album.artists))).all()
+    return {a.id: {"id": a.id, "title": a.title, "artists": [ar.name for ar in a.artists], "cover_url": a.cover_url,
+                   "status": a.status} for a in albums}
+
+def album_hash(session: Session, album_id: int) -> Optional[int]:
+    row = session.exec(text(f"SELECT cover_hashes.phash FROM cover_hashes {_CURRENT} AND cover_hashes.album_id = :album_id"),
+                       params={"album_id": album_id}).first()
+    return row[0] if row else None
+
+def nearest(session: Session, phash: int, max_distance: int = 10, limit: int = 10, exclude: Optional[int] = None) -> List[Dict]:
+    """
+    Albums whose current cover is within max_distance of phash, closest first.
+    """
+    masks = _masks(min(max_distance, MAX_DISTANCE) // SEGMENTS)
+    params = {f"s{i}": [segment ^ mask for mask in masks] for i, segment in enumerate(_segments(phash))}
+    matches = sorted(
+        (d, album_id) for album_id, other in session.exec(_NEIGHBOURS, params=params).all()
+        if album_id != exclude and (d := distance(phash, other)) <= max_distance
+    )[:limit]
+    summaries = _summaries(session, [album_id for _, album_id in matches])
+    return [{**summaries[album_id], "distance": d} for d, album_id in matches if album_id in summaries]
+
+def duplicate_groups(session: Session, max_distance: int = DUPLICATE_DISTANCE, limit: int = 100) -> List[Dict]:
+    """
+    Groups of albums whose covers are within max_distance of each other (transitively),
+    largest first.
+    """
+    rows = session.exec(text(f"SELECT cover_hashes.album_id, cover_hashes.phash FROM cover_hashes {_CURRENT}")).all()
+    masks = _masks(min(max_distance, MAX_DUPLICATE_DISTANCE) // SEGMENTS)
+    buckets: List[Dict[int, List[int]]] = [{} for _ in range(SEGMENTS)]
+    for position, (_, phash) in enumerate(rows):
+        for i, segment in enumerate(_segments(phash)):
+            buckets[i].setdefault(segment, []).append(position)
+
+    parent = list(range(len(rows)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for position, (_, phash) in enumerate(rows):
+        for i, segment in enumerate(_segments(phash)):
+            for mask in masks:
+                for other in buckets[i].get(segment ^ mask, ()):
+                    if other > position and distance(phash, rows[other][1]) <= max_distance:
+                        parent[find(other)] = find(position)
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(rows)):
+        groups.setdefault(find(position), []).append(rows[position][0])
+    found = sorted((sorted(ids) for ids in groups.values() if len(ids) > 1), key=lambda ids: (-len(ids), ids[0]))[:limit]
+    summaries = _summaries(session, [album_id for ids in found for album_id in ids])
+    return [{"albums": [summaries[album_id] for album_id in ids if album_id in summaries]} for ids in found]
@@ -0,0 +1,110 @@
+"""
+Locally stored cover images: downloading external covers and removing stored ones.
+Shared by the API and the admin CLI.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, TypeVar
+
+from sqlmodel import Session, select
+
+from . import crud, utils
+from .database import data_dir, run_blocking, run_in_session
+from .models import Album, AlbumUpdate
+from .writer import run_in_writer
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+COVERS_DIR = Path(data_dir) / "covers"
+COVER_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+
+def external_covers(session: Session):
+    # Find all albums where cover_url starts with http
+    return session.exec(select(Album.id, Album.cover_url).where(Album.cover_url.like("http%"))).all()
+
+def _set_cover_url(session: Session, album_id: int, cover_url: str) -> bool:
+    # Runs on the writer; returns only a flag so no ORM state leaks out of the session
+    # We use crud.update_album to ensure any logic there (like FTS triggers) is respected
+    return crud.update_album(session, album_id, AlbumUpdate(cover_url=cover_url)) is not None
+
+async def pull_external_cover(album_id: int, url: str) -> bool:
+    """
+    Downloads an external cover and points the album at the local copy.
+    Returns whether the cover is now stored locally.
+    """
+    if not url or not url.startswith("http"):
+        return False
+
+    # Determine extension from URL or default to .jpg
+    ext = os.path.splitext(url.split("?")[0])[1] or ".jpg"
+    if ext.lower() not in COVER_EXTENSIONS:
+        ext = ".jpg" # Default fallback
+
+    dest_path = COVERS_DIR / f"album_{album_id}{ext}"
+
+    filename = await utils.download_image(url, dest_path)
+    if filename and await run_in_writer(_set_cover_url, album_id, f"/covers/{filename}"):
+        await cover_stored(album_id)
+        return True
+    return False
+
+async def cover_stored(album_id: int):
+    """
+    Brings data derived from an album's cover up to date after a new one was stored.
+    Best effort: whatever fails here is picked up by the batch jobs later.
+    """
+    # Imported here because coverhash and placeholders build on this module
+    from . import coverhash, placeholders
+    album = await run_in_session(crud.get_album, album_id)
+    if not album or not album.cover_url:
+        return
+    # Decoding runs on the blocking executor; only the small store goes through the writer
+    for module, encode, store in ((placeholders, placeholders.encode_cover, crud.set_cover_placeholders),
+                                  (coverhash, coverhash.hash_cover, coverhash.store_hashes)):
+        try:
+            # The first check imports NumPy and Pillow, which takes a while: not on the loop
+            if await run_blocking(module.available):
+                rows = await run_blocking(encode, album_id, album.cover_url)
+                if rows:
+                    await run_in_writer(store, rows)
+        except Exception:
+            logger.exception("Processing the new cover of album %s failed (%s)", album_id, module.__name__)
+
+def map_cover_batches(fn: Callable[[List[T]], R], items: List[T], batch_size: int, workers: Optional[int] = None) -> Iterator[R]:
+    """
+    Yields fn(batch) for items in batches of batch_size, in order. With more than one batch
+    they run in a process pool, so fn must be a top-level function.
+    """
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    if len(batches) <= 1:
+        yield from map(fn, batches)
+        return
+    # spawn, not fork: the server process has threads running, which fork doesn't mix with
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(batches)), mp_context=context) as pool:
+        yield from pool.map(fn, batches)
+
+def cover_file(cover_url: Optional[str]) -> Optional[Path]:
+    # Only covers we stored ourselves have a file; external URLs have nothing on disk
+    if cover_url and cover_url.startswith("/covers/"):
+        return COVERS_DIR / Path(cover_url.split("?")[0]).name
+    return None
+
+def remove_cover_files(cover_urls: List[Optional[str]]) -> int:
+    removed = 0
+    for url in cover_urls:
+        path = cover_file(url)
+        if path is None:
+            continue
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -1,17 +1,118 @@
-from sqlmodel import Session, select, func, text, desc
+from sqlmodel import Session, select, func, text, desc, exists, or_
+from sqlalchemy import bindparam, DateTime
 from sqlalchemy.orm import selectinload
-from .models import Album, Artist, Tag, Location, Track, AlbumArtistLink, AlbumTagLink, AlbumGenreLink, AlbumCreate, AlbumUpdate, Genre
-from typing import List, Optional
+from .models import Album, Artist, Tag, Location, Track, AlbumArtistLink, AlbumTagLink, AlbumGenreLink, AlbumCreate, AlbumUpdate, AlbumBulkUpdate, AlbumSelection, Genre
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from difflib import SequenceMatcher
+import logging
+from . import catalogue, utils
+
+logger = logging.getLogger(__name__)
+
+# --- Change notifications ---
+_change_listeners = []
+
+def add_change_listener(listener):
+    """
+    Registers listener(session, kind, ids), called after a write has been committed.
+    kind "albums" carries the ids of every album whose data or links changed (deleted ones
+    included); metadata kinds ("artists", "genres", "tags", "locations") carry the changed ids.
+    """
+    _change_listeners.append(listener)
+
+# Session.info key: a list there collects (kind, ids) instead of notifying right away,
+# for writes whose transaction is committed later (see writer.py)
+DEFERRED_NOTIFICATIONS = "deferred_notifications"
+
+def _notify(session: Session, kind: str, ids: Optional[List[int]]):
+    deferred = session.info.get(DEFERRED_NOTIFICATIONS)
+    if deferred is not None:
+        deferred.append((kind, ids))
+        return
+    for listener in _change_listeners:
+        try:
+            listener(session, kind, ids)
+        except Exception:
+            # The write is already committed; a broken cache must not turn it into an error
+            logger.exception("Change listener %r failed for %s %s", listener, kind, ids)
+
+def deliver_notifications(session: Session, notifications: List[Tuple[str, Optional[List[int]]]]):
+    """
+    Passes notifications collected under DEFERRED_NOTIFICATIONS on to the listeners, once
+    the writes behind them have been committed.
+    """
+    for kind, ids in notifications:
+        _notify(session, kind, ids)
+
+def notify_collection_replaced(session: Session):
+    """
+    Tells listeners that the whole collection changed underneath them (startup, restore).
+    """
+    _notify(session, "albums", None)
+
+def _album_ids_linked(session: Session, link_model, column, item_id: int) -> List[int]:
+    return list(session.exec(select(link_model.album_id).where(column == item_id)).all())
+
+def _active():
+    # Albums that aren't archived; the same condition as the partial indexes on albums,
+    # so it must stay literally "archived_at IS NULL" for SQLite to use them
+    return Album.archived_at == None
 
 # --- Stats & Reports ---
 def get_stats(session: Session):
-    album_count = session.exec(select(func.count(Album.id)).where(Album.status == "collection")).one()
+    if catalogue.index.loaded:
+        return catalogue.index.counts()
+    album_count, runtime = session.exec(
+        select(func.count(Album.id), func.sum(Album.runtime_ms)).where(Album.status == "collection").where(_active())
+    ).one()
     artist_count = session.exec(select(func.count(Artist.id))).one()
     genre_count = session.exec(select(func.count(Genre.id))).one()
     return {
         "albums": album_count,
         "artists": artist_count,
-        "genres": genre_count
+        "genres": genre_count,
+        "runtime_ms": runtime or 0,
+    }
+
+def get_runtime_stats(session: Session, limit: int = 10):
+    """
+    Runtime aggregates for the collection, all SQL sums over the cached album runtimes.
+    """
+    in_collection = (Album.status == "collection") & _active()
+    total, timed, average = session.exec(
+        select(func.sum(Album.runtime_ms), func.count(Album.runtime_ms), func.avg(Album.runtime_ms)).where(in_collection)
+    ).one()
+    longest = session.exec(
+        select(Album.id, Album.title, Album.runtime_ms).where(in_collection).where(Album.runtime_ms != None)
+        .order_by(desc(Album.runtime_ms)).limit(limit)
+    ).all()
+    by_genre = session.exec(
+        select(Genre.name, func.sum(Album.runtime_ms).label("runtime_ms"), func.count(Album.id))
+        .select_from(Genre).join(AlbumGenreLink).join(Album)
+        .where(in_collection).where(Album.runtime_ms != None)
+        .group_by(Genre.id).order_by(desc("runtime_ms")).limit(limit)
+    ).all()
+    return {
+        "total_ms": total or 0,
+        "albums_with_runtime": timed,
+        "average_ms": round(average) if average else None,
+        "longest": [{"id": i, "title": title, "runtime_ms": ms} for i, title, ms in longest],
+        "by_genre": [{"name": name, "runtime_ms": ms, "albums": n} for name, ms, n in by_genre],
+    }
+
+def get_album_runtime(session: Session, album_id: int) -> Optional[dict]:
+    album = session.get(Album, album_id)
+    if not album:
+        return None
+    discs = session.exec(
+        select(Track.disc_no, func.max(Track.disc_name), func.count(Track.id), func.sum(Track.duration_ms))
+        .where(Track.album_id == album_id).group_by(Track.disc_no).order_by(Track.disc_no)
+    ).all()
+    return {
+        "album_id": album_id,
+        "runtime_ms": album.runtime_ms,
+        "discs": [{"disc_no": d, "disc_name": name, "tracks": n, "runtime_ms": ms} for d, name, n, ms in discs],
     }
 
 def get_report_stats(session: Session):
@@ -31,27 +132,29 @@ def get_report_stats(session: Session):
     # Low usage counts (1-2 albums total)
     low_usage_genres = session.exec(
         select(func.count(Genre.id)).where(Genre.id.in_(
-            select(AlbumGenreLink.genre_id).group_by(AlbumGenreLink.genre_id).having(func.count(AlbumGenreLink.album_id) <= 2)
+            # count(*) lets SQLite answer from the genre_id index alone
+            select(AlbumGenreLink.genre_id).group_by(AlbumGenreLink.genre_id).having(func.count() <= 2)
         ))
     ).one()
 
     low_usage_tags = session.exec(
         select(func.count(Tag.id)).where(Tag.id.in_(
-            select(AlbumTagLink.tag_id).group_by(AlbumTagLink.tag_id).having(func.count(AlbumTagLink.album_id) <= 2)
+            select(AlbumTagLink.tag_id).group_by(AlbumTagLink.tag_id).having(func.count() <= 2)
         ))
     ).one()
 
     # Incomplete albums (only in collection)
-    missing_covers = session.exec(select(func.count(Album.id)).where(Album.cover_url == None).where(Album.status == "collection")).one()
+    missing_covers = session.exec(select(func.count(Album.id)).where(Album.cover_url == None).where(Album.status == "collection").where(_active())).one()
     missing_tracks = session.exec(
         select(func.count(Album.id))
         .where(Album.status == "collection")
-        .where(Album.id.notin_(select(Track.album_id).group_by(Track.album_id)))
+        .where(_active())
+        .where(~_has_tracks())
     ).one()
-    missing_year = session.exec(select(func.count(Album.id)).where((Album.year == None) | (Album.year == 0)).where(Album.status == "collection")).one()
-    missing_location = session.exec(select(func.count(Album.id)).where(Album.location_id == None).where(Album.status == "collection")).one()
-    missing_media = session.exec(select(func.count(Album.id)).where((Album.media_type == None) | (Album.media_type == "")).where(Album.status == "collection")).one()
-    missing_catalog = session.exec(select(func.count(Album.id)).where((Album.catalog_no == None) | (Album.catalog_no == "")).where(Album.status == "collection")).one()
+    missing_year = session.exec(select(func.count(Album.id)).where((Album.year == None) | (Album.year == 0)).where(Album.status == "collection").where(_active())).one()
+    missing_location = session.exec(select(func.count(Album.id)).where(Album.location_id == None).where(Album.status == "collection").where(_active())).one()
+    missing_media = session.exec(select(func.count(Album.id)).where((Album.media_type == None) | (Album.media_type == "")).where(Album.status == "collection").where(_active())).one()
+    missing_catalog = session.exec(select(func.count(Album.id)).where((Album.catalog_no == None) | (Album.catalog_no == "")).where(Album.status == "collection").where(_active())).one()
 
     return {
         "unused_genres": unused_genres,
@@ -64,9 +167,14 @@ def get_report_stats(session: Session):
         "missing_year": missing_year,
         "missing_location": missing_location,
         "missing_media": missing_media,
-        "missing_catalog": missing_catalog
+        "missing_catalog": missing_catalog,
     }
 
+def _has_tracks():
+    # Correlated EXISTS probes ix_tracks_album_id per album instead of materialising
+    # every album_id in tracks the way NOT IN (SELECT ...) does
+    return exists().where(Track.album_id == Album.id)
+
 def get_report_details(session: Session, report_type: str):
     if report_type == "unused_genres":
         return session.exec(select(Genre).outerjoin(AlbumGenreLink).where(AlbumGenreLink.album_id == None)).all()
@@ -99,64 +207,307 @@ def get_report_details(session: Session, report_type: str):
             items.append(t_dict)
         return items
     elif report_type == "missing_covers":
-        return session.exec(select(Album).where(Album.cover_url == None).where(Album.status == "collection").options(selectinload(Album.artists))).all()
+        return session.exec(select(Album).where(Album.cover_url == None).where(Album.status == "collection").where(_active()).options(selectinload(Album.artists))).all()
     elif report_type == "missing_tracks":
-        return session.exec(select(Album).where(Album.id.notin_(select(Track.album_id).group_by(Track.album_id))).where(Album.status == "collection").options(selectinload(Album.artists))).all()
+        return session.exec(select(Album).where(~_has_tracks()).where(Album.status == "collection").where(_active()).options(selectinload(Album.artists))).all()
     elif report_type == "missing_year":
-        return session.exec(select(Album).where((Album.year == None) | (Album.year == 0)).where(Album.status == "collection").options(selectinload(Album.artists))).all()
+        return session.exec(select(Album).where((Album.year == None) | (Album.year == 0)).where(Album.status == "collection").where(_active()).options(selectinload(Album.artists))).all()
     elif report_type == "missing_location":
-        return session.exec(select(Album).where(Album.location_id == None).where(Album.status == "collection").options(selectinload(Album.artists))).all()
+        return session.exec(select(Album).where(Album.location_id == None).where(Album.status == "collection").where(_active()).options(selectinload(Album.artists))).all()
     elif report_type == "missing_media":
-        return session.exec(select(Album).where((Album.media_type == None) | (Album.media_type == "")).where(Album.status == "collection").options(selectinload(Album.artists))).all()
+        return session.exec(select(Album).where((Album.media_type == None) | (Album.media_type == "")).where(Album.status == "collection").where(_active()).options(selectinload(Album.artists))).all()
     elif report_type == "missing_catalog":
-        return session.exec(select(Album).where((Album.catalog_no == None) | (Album.catalog_no == "")).where(Album.status == "collection").options(selectinload(Album.artists))).all()
+        return session.exec(select(Album).where((Album.catalog_no == None) | (Album.catalog_no == "")).where(Album.status == "collection").where(_active()).options(selectinload(Album.artists))).all()
+    elif report_type == "duplicate_albums":
+        return get_duplicate_album_details(session)
+    elif report_type in ("duplicate_artists", "duplicate_genres", "duplicate_tags"):
+        return get_duplicate_name_details(session, report_type.split("_", 1)[1])
     return []
 
-# --- Albums ---
-def create_album(session: Session, album_create: AlbumCreate) -> Album:
-    # Convert AlbumCreate DTO to Album table model, excluding relationships handled manually
-    db_album = Album.model_validate(album_create.model_dump(exclude={"tracks", "artist_names", "genre_names", "tag_ids"}))
-    
-    # Handle Tags
-    if album_create.tag_ids:
-        tags = session.exec(select(Tag).where(Tag.id.in_(album_create.tag_ids))).all()
-        db_album.tags = tags
+# --- Duplicates & Merging ---
+# Metadata kinds that can be deduplicated and merged: model, link model, link column, key function
+MERGE_KINDS = {
+    "artists": (Artist, AlbumArtistLink, "artist_id", utils.artist_key),
+    "genres": (Genre, AlbumGenreLink, "genre_id", utils.normalize_text),
+    "tags": (Tag, AlbumTagLink, "tag_id", utils.normalize_text),
+}
 
-    # Handle Artists
-    if album_create.artist_names:
-        artists = []
-        for name in album_create.artist_names:
-            artist = session.exec(select(Artist).where(Artist.name == name)).first()
-            if not artist:
-                artist = Artist(name=name)
-                session.add(artist)
-                session.commit()
-                session.refresh(artist)
-            artists.append(artist)
-        db_album.artists = artists
+def _group_by_keys(rows, key_funcs) -> List[List[int]]:
+    """
+    Hash-based blocking in one pass: rows sharing any non-empty key end up in the same group.
+    rows are (id, *values); key_funcs has one function per value. Groups of one are dropped.
+    """
+    parent = {}
 
-    # Handle Genres
-    if album_create.genre_names:
-        genres = []
-        for name in album_create.genre_names:
-            genre = session.exec(select(Genre).where(Genre.name == name)).first()
-            if not genre:
-                genre = Genre(name=name)
-                session.add(genre)
-                session.commit()
-                session.refresh(genre)
-            genres.append(genre)
-        db_album.genres = genres
-        
-    # Handle Tracks
-    if album_create.tracks:
-        db_tracks = [Track(**t.model_dump(), album=db_album) for t in album_create.tracks]
-        db_album.tracks = db_tracks
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
 
-    session.add(db_album)
+    first_seen = {}
+    for row in rows:
+        row_id = row[0]
+        parent.setdefault(row_id, row_id)
+        for i, key_func in enumerate(key_funcs):
+            key = key_func(row[i + 1])
+            if not key:
+                continue
+            other = first_seen.setdefault((i, key), row_id)
+            if other != row_id:
+                parent[find(row_id)] = find(other)
+
+    groups = {}
+    for row_id in parent:
+        groups.setdefault(find(row_id), []).append(row_id)
+    return sorted((sorted(ids) for ids in groups.values() if len(ids) > 1), key=lambda ids: ids[0])
+
+def find_duplicate_albums(session: Session) -> List[List[int]]:
+    rows = session.exec(select(Album.id, Album.fingerprint, Album.barcode_key).where(_active())).all()
+    return _group_by_keys(rows, [lambda v: v, lambda v: v])
+
+def find_duplicate_names(session: Session, kind: str) -> List[List[int]]:
+    model, _, _, key_func = MERGE_KINDS[kind]
+    rows = session.exec(select(model.id, model.name)).all()
+    return _group_by_keys(rows, [key_func])
+
+def count_duplicates(session: Session) -> Dict[str, int]:
+    """
+    Duplicate groups per duplicate_* report. Groups the whole collection, so it runs as a
+    report job rather than with every /reports/stats call.
+    """
+    counts = {"duplicate_albums": len(find_duplicate_albums(session))}
+    for kind in MERGE_KINDS:
+        counts[f"duplicate_{kind}"] = len(find_duplicate_names(session, kind))
+    return counts
+
+def get_duplicate_album_details(session: Session) -> List[dict]:
+    groups = find_duplicate_albums(session)
+    ids = [album_id for group in groups for album_id in group]
+    albums = {a.id: a for a in session.exec(select(Album).where(Album.id.in_(ids)).options(selectinload(Album.artists))).all()}
+    items = []
+    for group_no, group in enumerate(groups, start=1):
+        barcodes = {albums[i].barcode_key for i in group}
+        for album_id in group:
+            album = albums[album_id]
+            items.append({
+                "id": album.id,
+                "title": album.title,
+                "year": album.year,
+                "upc_ean": album.upc_ean,
+                "status": album.status,
+                "artists": [{"id": a.id, "name": a.name} for a in album.artists],
+                "duplicate_group": group_no,
+                "match": "barcode" if album.barcode_key and len(barcodes) == 1 else "title_artists",
+            })
+    return items
+
+def get_duplicate_name_details(session: Session, kind: str) -> List[dict]:
+    model, link_model, link_column, _ = MERGE_KINDS[kind]
+    groups = find_duplicate_names(session, kind)
+    ids = [item_id for group in groups for item_id in group]
+    column = getattr(link_model, link_column)
+    rows = session.exec(
+        select(model.id, model.name, func.count(link_model.album_id))
+        .join(link_model, column == model.id, isouter=True)
+        .where(model.id.in_(ids))
+        .group_by(model.id)
+    ).all()
+    by_id = {row[0]: row for row in rows}
+    items = []
+    for group_no, group in enumerate(groups, start=1):
+        for item_id in group:
+            _, name, count = by_id[item_id]
+            items.append({"id": item_id, "name": name, "count": count, "duplicate_group": group_no})
+    return items
+
+def _expanding(statement: str, *names: str):
+    return text(statement).bindparams(*[bindparam(name, expanding=True) for name in names])
+
+def merge_metadata(session: Session, kind: str, target_id: int, source_ids: List[int]) -> Optional[int]:
+    """
+    Merges artists, genres or tags into target_id: links are re-pointed with set-based SQL
+    and the sources deleted, all in one transaction. Returns the number of merged items,
+    or None if the target doesn't exist.
+    """
+    model, link_model, link_column, _ = MERGE_KINDS[kind]
+    if not session.get(model, target_id):
+        return None
+    source_ids = [i for i in dict.fromkeys(source_ids) if i != target_id]
+    if not source_ids:
+        return 0
+
+    link_table = link_model.__tablename__
+    params = {"target": target_id, "sources": source_ids}
+    affected = session.exec(_expanding(
+        f"SELECT DISTINCT album_id FROM {link_table} WHERE {link_column} IN :sources", "sources"
+    ), params=params).all()
+    extra_columns = ", role" if link_model is AlbumArtistLink else ""
+    session.exec(_expanding(
+        f"INSERT OR IGNORE INTO {link_table} (album_id, {link_column}{extra_columns}) "
+        f"SELECT album_id, :target{extra_columns} FROM {link_table} WHERE {link_column} IN :sources", "sources"
+    ), params=params)
+    session.exec(_expanding(f"DELETE FROM {link_table} WHERE {link_column} IN :sources", "sources"), params=params)
+    result = session.exec(_expanding(f"DELETE FROM {model.__tablename__} WHERE id IN :sources", "sources"), params=params)
+
+    if kind == "artists":
+        _refresh_keys_after_artist_change(session, [row[0] for row in affected])
     session.commit()
-    session.refresh(db_album)
-    return db_album
+    _notify(session, kind, [target_id] + source_ids)
+    _notify(session, "albums", [row[0] for row in affected])
+    return result.rowcount
+
+ALBUM_FILL_FIELDS = ["year", "upc_ean", "catalog_no", "spars_code", "cover_url", "notes", "location_id"]
+
+def merge_albums(session: Session, target_id: int, source_ids: List[int]) -> Optional[Tuple[int, List[str]]]:
+    """
+    Merges duplicate albums into target_id in one transaction: artist, genre and tag links are
+    unioned onto the target, empty target fields are filled from the sources, the tracklist
+    is taken over if the target has none, and the sources are deleted together with their
+    cover hashes. Returns the number of merged albums and the cover URLs nothing refers to
+    any more, so the caller can remove stored covers.
+    """
+    target = session.get(Album, target_id)
+    if not target:
+        return None
+    source_ids = [i for i in dict.fromkeys(source_ids) if i != target_id]
+    sources = session.exec(select(Album).where(Album.id.in_(source_ids)).order_by(Album.id)).all()
+    if not sources:
+        return 0, []
+    source_ids = [a.id for a in sources]
+    params = {"target": target_id, "sources": source_ids}
+
+    for field_name in ALBUM_FILL_FIELDS:
+        if getattr(target, field_name) in (None, "", 0):
+            source = next((a for a in sources if getattr(a, field_name) not in (None, "", 0)), None)
+            if source is not None:
+                setattr(target, field_name, getattr(source, field_name))
+                if field_name == "cover_url":
+                    # The placeholder and the hashes belong to the cover
+                    target.cover_blurhash, target.cover_color = source.cover_blurhash, source.cover_color
+                    session.exec(text(
+                        "INSERT OR REPLACE INTO cover_hashes (album_id, cover_url, ahash, phash, phash_0, phash_1, phash_2, phash_3, computed_at) "
+                        "SELECT :target, cover_url, ahash, phash, phash_0, phash_1, phash_2, phash_3, computed_at "
+                        "FROM cover_hashes WHERE album_id = :source AND cover_url = :cover_url"
+                    ), params={"target": target_id, "source": source.id, "cover_url": source.cover_url})
+    unused_covers = [a.cover_url for a in sources if a.cover_url and a.cover_url != target.cover_url]
+
+    for link_table, column, extra in (("album_artist_links", "artist_id", ", role"), ("album_genre_links", "genre_id", ""), ("album_tag_links", "tag_id", "")):
+        session.exec(_expanding(
+            f"INSERT OR IGNORE INTO {link_table} (album_id, {column}{extra}) "
+            f"SELECT :target, {column}{extra} FROM {link_table} WHERE album_id IN :sources", "sources"
+        ), params=params)
+        session.exec(_expanding(f"DELETE FROM {link_table} WHERE album_id IN :sources", "sources"), params=params)
+
+    has_tracks = session.exec(select(func.count(Track.id)).where(Track.album_id == target_id)).one()
+    if not has_tracks:
+        donor = session.exec(
+            select(Track.album_id).where(Track.album_id.in_(source_ids)).order_by(Track.album_id).limit(1)
+        ).first()
+        if donor:
+            session.exec(text("UPDATE tracks SET album_id = :target WHERE album_id = :donor"), params={"target": target_id, "donor": donor})
+            _refresh_runtimes(session, [target_id])
+    for table in ("tracks", "cover_hashes"):
+        session.exec(_expanding(f"DELETE FROM {table} WHERE album_id IN :sources", "sources"), params=params)
+    session.exec(_expanding("DELETE FROM albums WHERE id IN :sources", "sources"), params=params)
+
+    session.flush()
+    session.expire(target, ["artists", "genres", "tags", "tracks", "runtime_ms"])
+    target.updated_at = datetime.utcnow()
+    _refresh_album_keys(target)
+    session.add(target)
+    session.commit()
+    _notify(session, "albums", [target_id] + source_ids)
+    return len(source_ids), unused_covers
+
+# --- Albums ---
+def _normalise_duration(track: dict) -> dict:
+    """
+    Fills duration_ms from the duration string and rewrites the string from it ("4.05" and
+    "245" become "4:05"). A duration_ms that still matches the string keeps its precision
+    (MusicBrainz lengths); strings that can't be parsed are kept as entered.
+    """
+    ms = utils.parse_duration(track.get("duration"))
+    given = track.get("duration_ms")
+    if isinstance(given, int) and given >= 0:
+        if ms is None and not track.get("duration") or utils.format_duration(given) == utils.format_duration(ms):
+            ms = given
+    track["duration_ms"] = ms
+    if ms is not None:
+        track["duration"] = utils.format_duration(ms)
+    return track
+
+def _refresh_runtimes(session: Session, album_ids: List[int]):
+    # Cached album runtime: a pure SQL sum per album over ix_tracks_album_id
+    if album_ids:
+        session.exec(_expanding(
+            "UPDATE albums SET runtime_ms = (SELECT SUM(duration_ms) FROM tracks WHERE tracks.album_id = albums.id) WHERE id IN :ids", "ids"
+        ), params={"ids": album_ids})
+
+def _get_or_create_by_name(session: Session, model, names: List[str], chunk_size: int = 500):
+    """
+    Maps each name to its row, inserting the missing ones; one lookup per chunk of names.
+    Returns the mapping and the rows that had to be created.
+    """
+    wanted = list(dict.fromkeys(n for n in names if n))
+    found = {}
+    for i in range(0, len(wanted), chunk_size):
+        chunk = wanted[i:i + chunk_size]
+        for item in session.exec(select(model).where(model.name.in_(chunk))).all():
+            found[item.name] = item
+    created = [model(name=name) for name in wanted if name not in found]
+    if created:
+        session.add_all(created)
+        session.flush()
+        found.update((item.name, item) for item in created)
+    return found, created
+
+def create_albums(session: Session, album_creates: List[AlbumCreate], batch_size: int = 200) -> List[int]:
+    """
+    Creates albums in batches: artists and genres are resolved per batch with set-based
+    lookups and every batch is committed once. Returns the new album ids in input order.
+    """
+    album_ids = []
+    for start in range(0, len(album_creates), batch_size):
+        batch = album_creates[start:start + batch_size]
+        artists, new_artists = _get_or_create_by_name(session, Artist, [n for a in batch for n in a.artist_names])
+        genres, new_genres = _get_or_create_by_name(session, Genre, [n for a in batch for n in a.genre_names])
+        tag_ids = {i for a in batch for i in a.tag_ids}
+        tags = {t.id: t for t in session.exec(select(Tag).where(Tag.id.in_(tag_ids))).all()} if tag_ids else {}
+
+        db_albums = []
+        for album_create in batch:
+            # Convert AlbumCreate DTO to Album table model, excluding relationships handled manually
+            db_album = Album.model_validate(album_create.model_dump(exclude={"tracks", "artist_names", "genre_names", "tag_ids"}))
+            db_album.tags = [tags[i] for i in dict.fromkeys(album_create.tag_ids) if i in tags]
+            db_album.artists = [artists[n] for n in dict.fromkeys(album_create.artist_names) if n in artists]
+            db_album.genres = [genres[n] for n in dict.fromkeys(album_create.genre_names) if n in genres]
+            db_album.tracks = [Track(**_normalise_duration(t.model_dump())) for t in album_create.tracks]
+            _refresh_album_keys(db_album)
+            db_albums.append(db_album)
+
+        session.add_all(db_albums)
+        session.flush()
+        batch_ids = [a.id for a in db_albums]
+        _refresh_runtimes(session, batch_ids)
+        new_artist_ids = [a.id for a in new_artists]
+        new_genre_ids = [g.id for g in new_genres]
+        session.commit()
+        album_ids.extend(batch_ids)
+        if new_artist_ids:
+            _notify(session, "artists", new_artist_ids)
+        if new_genre_ids:
+            _notify(session, "genres", new_genre_ids)
+        _notify(session, "albums", batch_ids)
+    return album_ids
+
+def create_album(session: Session, album_create: AlbumCreate) -> Album:
+    album_id = create_albums(session, [album_create])[0]
+    return session.get(Album, album_id)
+
+def get_album_ids_by_disc_id(session: Session, disc_ids: List[str]) -> dict:
+    rows = session.exec(select(Album.mb_disc_id, Album.id).where(Album.mb_disc_id.in_(disc_ids))).all() if disc_ids else []
+    return {disc_id: album_id for disc_id, album_id in rows}
 
 def update_album(session: Session, album_id: int, album_update: AlbumUpdate) -> Optional[Album]:
     db_album = session.get(Album, album_id)
@@ -179,25 +530,27 @@ def update_album(session: Session, album_id: int, album_update: AlbumUpdate) ->
             genres = session.exec(select(Genre).where(Genre.id.in_(genre_ids))).all()
             db_album.genres = genres
 
+    # Genres by name (MusicBrainz sync sends names, not ids)
+    new_genres, new_artists = [], []
+    if "genre_names" in update_data:
+        genre_names = update_data.pop("genre_names")
+        if genre_names is not None:
+            genres, new_genres = _get_or_create_by_name(session, Genre, genre_names)
+            db_album.genres = [genres[n] for n in dict.fromkeys(genre_names) if n in genres]
+
     # Handle Artists
     if "artist_names" in update_data:
         artist_names = update_data.pop("artist_names")
         if artist_names is not None:
-            artists = []
-            for name in artist_names:
-                artist = session.exec(select(Artist).where(Artist.name == name)).first()
-                if not artist:
-                    artist = Artist(name=name)
-                    session.add(artist)
-                    session.commit()
-                    session.refresh(artist)
-                artists.append(artist)
-            db_album.artists = artists
+            artists, new_artists = _get_or_create_by_name(session, Artist, artist_names)
+            db_album.artists = [artists[n] for n in dict.fromkeys(artist_names) if n in artists]
             
     # Handle Tracks
+    tracks_replaced = False
     if "tracks" in update_data:
         new_tracks = update_data.pop("tracks")
         if new_tracks is not None:
+            tracks_replaced = True
             # Simple approach: Replace tracklist
             # Delete old tracks
             session.exec(text("DELETE FROM tracks WHERE album_id = :id"), params={"id": album_id})
@@ -205,7 +558,7 @@ def update_album(session: Session, album_id: int, album_update: AlbumUpdate) ->
             db_tracks = []
             for t in new_tracks:
                 # Strip extra fields like _originalIndex and ensure album_id is set
-                clean_track = {k: v for k, v in t.items() if k in Track.model_fields}
+                clean_track = _normalise_duration({k: v for k, v in t.items() if k in Track.model_fields})
                 clean_track["album_id"] = album_id
                 db_tracks.append(Track(**clean_track))
             db_album.tracks = db_tracks
@@ -213,12 +566,313 @@ def update_album(session: Session, album_id: int, album_update: AlbumUpdate) ->
     # Update other fields
     for key, value in update_data.items():
         setattr(db_album, key, value)
+    if "cover_url" in update_data:
+        # Even the same URL may be a new file (uploads reuse album_<id>.<ext>)
+        db_album.cover_blurhash = db_album.cover_color = None
         
+    db_album.updated_at = datetime.utcnow()
+    _refresh_album_keys(db_album)
     session.add(db_album)
+    if tracks_replaced:
+        session.flush()
+        _refresh_runtimes(session, [album_id])
+    new_artist_ids = [a.id for a in new_artists]
+    new_genre_ids = [g.id for g in new_genres]
     session.commit()
     session.refresh(db_album)
+    # Names first, so listeners indexing the album already know its new artists and genres
+    if new_artist_ids:
+        _notify(session, "artists", new_artist_ids)
+    if new_genre_ids:
+        _notify(session, "genres", new_genre_ids)
+    _notify(session, "albums", [db_album.id])
     return db_album
 
+BULK_LINKS = [
+    # (link table, column, extra columns, add field, remove field, lookup table)
+    ("album_tag_links", "tag_id", "", "add_tag_ids", "remove_tag_ids", "tags"),
+    ("album_genre_links", "genre_id", "", "add_genre_ids", "remove_genre_ids", "genres"),
+    ("album_artist_links", "artist_id", ", role", "add_artist_ids", "remove_artist_ids", "artists"),
+]
+
+def _stage_ids(session: Session, name: str, source_table: str, ids: List[int]) -> List[int]:
+    """
+    Loads the ids that exist in source_table into TEMP table name and returns them.
+    Statements can then join against selections of any size; expanding IN lists run
+    into SQLite's bound-parameter limit.
+    """
+    session.exec(text(f"CREATE TEMP TABLE IF NOT EXISTS {name} (id INTEGER PRIMARY KEY)"))
+    session.exec(text(f"DELETE FROM temp.{name}"))
+    if ids:
+        session.exec(
+            text(f"INSERT OR IGNORE INTO temp.{name} (id) SELECT id FROM {source_table} WHERE id = :id"),
+            params=[{"id": item_id} for item_id in ids],
+        )
+    return list(session.exec(text(f"SELECT id FROM temp.{name}")).scalars().all())
+
+def resolve_bulk_selection(session: Session, bulk: AlbumSelection) -> List[int]:
+    if bulk.album_ids is not None:
+        album_ids = list(dict.fromkeys(bulk.album_ids))
+    elif bulk.q and bulk.q.strip():
+        album_ids = search_album_ids(session, bulk.q, bulk.filter)
+    else:
+        return []
+    if bulk.match_status is not None and album_ids:
+        matching = set(session.exec(
+            _expanding("SELECT id FROM albums WHERE status = :status AND id IN :ids", "ids"),
+            params={"status": bulk.match_status, "ids": album_ids},
+        ).scalars().all())
+        album_ids = [i for i in album_ids if i in matching]
+    return album_ids
+
+def bulk_update_albums(session: Session, album_ids: List[int], bulk: AlbumBulkUpdate) -> int:
+    """
+    Applies add/remove link operations and location/status changes to many albums with
+    set-based SQL in one transaction. The selection is staged in a temp table, so it can
+    be as large as a whole search result. Returns the number of albums touched.
+    """
+    touched = _stage_ids(session, "bulk_album_ids", "albums", album_ids)
+    if not touched:
+        return 0
+
+    selection = "album_id IN (SELECT id FROM temp.bulk_album_ids)"
+    for link_table, column, extra, add_field, remove_field, lookup_table in BULK_LINKS:
+        remove_ids = getattr(bulk, remove_field)
+        if remove_ids:
+            session.exec(_expanding(
+                f"DELETE FROM {link_table} WHERE {column} IN :remove AND {selection}", "remove"
+            ), params={"remove": remove_ids})
+        add_ids = getattr(bulk, add_field)
+        if add_ids:
+            # Cross join of selection and (existing) items; links already present are skipped
+            session.exec(_expanding(
+                f"INSERT OR IGNORE INTO {link_table} (album_id, {column}{extra}) "
+                f"SELECT b.id, x.id{', :role' if extra else ''} FROM temp.bulk_album_ids b, {lookup_table} x WHERE x.id IN :add", "add"
+            ), params={"add": add_ids, "role": "Main"})
+
+    assignments = ["updated_at = :now"]
+    params = {"now": datetime.utcnow()}
+    if "location_id" in bulk.model_fields_set:
+        assignments.append("location_id = :location_id")
+        params["location_id"] = bulk.location_id
+    if "status" in bulk.model_fields_set and bulk.status is not None:
+        assignments.append("status = :status")
+        params["status"] = bulk.status
+    session.exec(
+        text(f"UPDATE albums SET {', '.join(assignments)} WHERE id IN (SELECT id FROM temp.bulk_album_ids)")
+        .bindparams(bindparam("now", type_=DateTime())),
+        params=params,
+    )
+
+    if bulk.add_artist_ids or bulk.remove_artist_ids:
+        _refresh_keys_after_artist_change(session, touched)
+    session.exec(text("DELETE FROM temp.bulk_album_ids"))
+    session.commit()
+    _notify(session, "albums", touched)
+    return len(touched)
+
+# --- Archive & delete ---
+def archived_album_ids(session: Session, before: Optional[datetime] = None) -> List[int]:
+    """
+    Ids of archived albums, oldest archive first; optionally only those archived before a
+    cutoff. Reads the partial index on archived albums only, so it costs next to nothing
+    while few albums are archived.
+    """
+    statement = select(Album.id).where(Album.archived_at != None)
+    if before is not None:
+        statement = statement.where(Album.archived_at < before)
+    return list(session.exec(statement.order_by(Album.archived_at)).all())
+
+def get_archived_albums(session: Session, offset: int = 0, limit: int = 100) -> List[Album]:
+    return session.exec(
+        select(Album).options(*_album_load_options()).where(Album.archived_at != None)
+        .order_by(desc(Album.archived_at)).offset(offset).limit(limit)
+    ).all()
+
+def set_albums_archived(session: Session, album_ids: List[int], archived: bool) -> List[int]:
+    """
+    Archives or restores albums. Archived albums keep their tracks and links but drop out
+    of listings, search, stats and reports. Returns the ids that actually changed state.
+    """
+    _stage_ids(session, "archive_album_ids", "albums", album_ids)
+    selection = "id IN (SELECT id FROM temp.archive_album_ids) AND " + ("archived_at IS NULL" if archived else "archived_at IS NOT NULL")
+    changed = list(session.exec(text(f"SELECT id FROM albums WHERE {selection}")).scalars().all())
+    if changed:
+        now = datetime.utcnow()
+        session.exec(
+            text(f"UPDATE albums SET archived_at = :archived_at, updated_at = :now WHERE {selection}")
+            .bindparams(bindparam("now", type_=DateTime()), bindparam("archived_at", type_=DateTime())),
+            params={"archived_at": now if archived else None, "now": now},
+        )
+    session.exec(text("DELETE FROM temp.archive_album_ids"))
+    session.commit()
+    if changed:
+        _notify(session, "albums", changed)
+    return changed
+
+# Albums per transaction when purging, so other writers get the database in between
+PURGE_BATCH = 500
+
+def delete_albums(session: Session, album_ids: List[int]) -> List[Tuple[int, Optional[str]]]:
+    """
+    Deletes albums for good together with their tracks, artist/genre/tag links and cover hashes in one
+    transaction; the search index and change log follow through their triggers. Returns
+    (id, cover_url) per deleted album so the caller can remove stored covers.
+    """
+    deleted_ids = _stage_ids(session, "delete_album_ids", "albums", album_ids)
+    if not deleted_ids:
+        return []
+    selection = "IN (SELECT id FROM temp.delete_album_ids)"
+    deleted = [(row[0], row[1]) for row in session.exec(text(f"SELECT id, cover_url FROM albums WHERE id {selection}")).all()]
+    for table in ("album_artist_links", "album_genre_links", "album_tag_links", "tracks", "cover_hashes"):
+        session.exec(text(f"DELETE FROM {table} WHERE album_id {selection}"))
+    session.exec(text(f"DELETE FROM albums WHERE id {selection}"))
+    session.exec(text("DELETE FROM temp.delete_album_ids"))
+    session.commit()
+    _notify(session, "albums", deleted_ids)
+    return deleted
+
+def _refresh_album_keys(album: Album):
+    # Keep the duplicate-detection keys in step with title, artists and barcode
+    album.title_key = utils.normalize_title(album.title)
+    album.fingerprint = utils.album_fingerprint(album.title, [a.name for a in album.artists])
+    album.barcode_key = utils.normalize_barcode(album.upc_ean)
+
+def _refresh_keys_after_artist_change(session: Session, album_ids: List[int], chunk_size: int = 500):
+    # Artist sets changed behind the ORM's back, so reload them and let the fingerprints follow
+    if not album_ids:
+        return
+    session.flush()
+    session.expire_all()
+    for i in range(0, len(album_ids), chunk_size):
+        chunk = album_ids[i:i + chunk_size]
+        for album in session.exec(select(Album).where(Album.id.in_(chunk)).options(selectinload(Album.artists))).all():
+            _refresh_album_keys(album)
+            session.add(album)
+
+_UPDATE_ALBUM_KEYS = text("UPDATE albums SET title_key = :title_key, fingerprint = :fingerprint, barcode_key = :barcode_key WHERE id = :id")
+
+def _album_key_params(session: Session, rows) -> List[Dict]:
+    # Duplicate-detection keys for (id, title, upc_ean) rows, with the artists in one query
+    ids = [row[0] for row in rows]
+    names = {}
+    for album_id, name in session.exec(
+        select(AlbumArtistLink.album_id, Artist.name).join(Artist).where(AlbumArtistLink.album_id.in_(ids))
+    ).all():
+        names.setdefault(album_id, []).append(name)
+    return [{
+        "id": album_id,
+        "title_key": utils.normalize_title(title),
+        "fingerprint": utils.album_fingerprint(title, names.get(album_id, [])),
+        "barcode_key": utils.normalize_barcode(upc_ean),
+    } for album_id, title, upc_ean, *_ in rows]
+
+def backfill_album_keys(session: Session, batch_size: int = 1000) -> int:
+    """
+    Computes duplicate-detection keys for albums written before they existed
+    (or inserted behind crud's back), and recomputes all of them once after the
+    normalisation changed. Returns the number of albums updated.
+    """
+    updated = 0
+    # The database's user_version records the utils.KEYS_VERSION its keys were computed with
+    if session.exec(text("PRAGMA user_version")).one()[0] < utils.KEYS_VERSION:
+        updated = _rebuild_album_keys(session, batch_size)
+        session.exec(text(f"PRAGMA user_version = {int(utils.KEYS_VERSION)}"))
+        session.commit()
+    while True:
+        rows = session.exec(
+            select(Album.id, Album.title, Album.upc_ean).where(Album.title_key == None).limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+        params = _album_key_params(session, rows)
+        session.exec(_UPDATE_ALBUM_KEYS, params=params)
+        session.commit()
+        updated += len(params)
+
+def backfill_durations(session: Session, batch_size: int = 5000) -> int:
+    """
+    Normalises track durations written before duration_ms existed (or behind crud's back)
+    and recomputes the runtime of the affected albums. Returns the number of tracks updated.
+    """
+    updated, last_id = 0, 0
+    while True:
+        # Keyset over ids: unparseable strings stay NULL and must not be fetched again
+        rows = session.exec(
+            select(Track.id, Track.album_id, Track.duration)
+            .where(Track.id > last_id).where(Track.duration_ms == None).where(Track.duration != None)
+            .order_by(Track.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        params = [{"id": track_id, "ms": ms, "duration": utils.format_duration(ms)}
+                  for track_id, _, duration in rows if (ms := utils.parse_duration(duration)) is not None]
+        if params:
+            session.exec(text("UPDATE tracks SET duration_ms = :ms, duration = :duration WHERE id = :id"), params=params)
+            parsed = {p["id"] for p in params}
+            _refresh_runtimes(session, list({album_id for track_id, album_id, _ in rows if track_id in parsed}))
+            session.commit()
+            updated += len(params)
+    # Albums with durations whose runtime was never computed (e.g. bulk inserts)
+    stale = session.exec(
+        select(Album.id).where(Album.runtime_ms == None).where(
+            exists().where(Track.album_id == Album.id).where(Track.duration_ms != None)
+        )
+    ).all()
+    for i in range(0, len(stale), batch_size):
+        _refresh_runtimes(session, list(stale[i:i + batch_size]))
+    session.commit()
+    return updated
+
+def set_cover_placeholders(session: Session, rows: List[Tuple[int, str, str, str]]):
+    """
+    Stores (album_id, cover_url, blurhash, color) rows. Albums whose cover changed since
+    cover_url was read are skipped; their new cover gets its own placeholder.
+    """
+    if not rows:
+        return
+    params = [{"id": album_id, "cover_url": cover_url, "blurhash": blurhash, "color": color}
+              for album_id, cover_url, blurhash, color in rows]
+    session.exec(text("UPDATE albums SET cover_blurhash = :blurhash, cover_color = :color "
+                      "WHERE id = :id AND cover_url = :cover_url"), params=params)
+    session.commit()
+    _notify(session, "albums", [row[0] for row in rows])
+
+def rebuild_album_caches(session: Session, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Recomputes every cached per-album value (track durations, runtime, duplicate-detection
+    keys) from the source columns, e.g. after the database was edited by hand. Only rows
+    whose cached values differ are written, so a consistent database is left untouched.
+    """
+    tracks = backfill_durations(session)
+    runtime_sql = "(SELECT SUM(duration_ms) FROM tracks WHERE tracks.album_id = albums.id)"
+    runtimes = session.exec(text(f"UPDATE albums SET runtime_ms = {runtime_sql} WHERE runtime_ms IS NOT {runtime_sql}")).rowcount
+    session.commit()
+
+    keys = _rebuild_album_keys(session, batch_size)
+    notify_collection_replaced(session)
+    return {"tracks": tracks, "runtimes": runtimes, "keys": keys}
+
+def _rebuild_album_keys(session: Session, batch_size: int) -> int:
+    # Recomputes the duplicate-detection keys of every album, writing only those that differ
+    keys, last_id = 0, 0
+    while True:
+        rows = session.exec(
+            select(Album.id, Album.title, Album.upc_ean, Album.title_key, Album.fingerprint, Album.barcode_key)
+            .where(Album.id > last_id).order_by(Album.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return keys
+        last_id = rows[-1][0]
+        current = {row[0]: tuple(row[3:]) for row in rows}
+        params = [p for p in _album_key_params(session, rows)
+                  if current[p["id"]] != (p["title_key"], p["fingerprint"], p["barcode_key"])]
+        if params:
+            session.exec(_UPDATE_ALBUM_KEYS, params=params)
+            session.commit()
+            keys += len(params)
+
 # --- Genres ---
 def get_genres(session: Session):
     # Return list of dicts with count
@@ -236,36 +890,38 @@ def update_genre(session: Session, genre_id: int, genre_data: Genre) -> Optional
     session.add(db_genre)
     session.commit()
     session.refresh(db_genre)
+    _notify(session, "genres", [genre_id])
     return db_genre
 
-def delete_genre(session: Session, genre_id: int) -> bool:
-    genre = session.get(Genre, genre_id)
-    if not genre:
-        return False
-    
-    # Check dependencies or cascade? 
-    # SQLModel/SQLAlchemy relationships might block delete if not configured to cascade.
-    # Manually delete links first to be safe and ensure "force delete" behavior for cleanup.
-    session.exec(text("DELETE FROM album_genre_links WHERE genre_id = :id"), params={"id": genre_id})
-    
-    session.delete(genre)
-    session.commit()
-    return True
-
-def get_albums(session: Session, offset: int = 0, limit: int = 100, sort_by: str = "created_at", order: str = "desc", album_ids: Optional[List[int]] = None, status: Optional[str] = None) -> List[Album]:
-    statement = select(Album).options(
+def _album_load_options():
+    return (
         selectinload(Album.artists),
         selectinload(Album.location),
         selectinload(Album.tags),
         selectinload(Album.genres),
         selectinload(Album.tracks)
     )
+
+def get_albums_by_ids(session: Session, album_ids: List[int]) -> List[Album]:
+    return session.exec(select(Album).options(*_album_load_options()).where(Album.id.in_(album_ids))).all()
+
+def get_albums(session: Session, offset: int = 0, limit: int = 100, sort_by: str = "created_at", order: str = "desc", album_ids: Optional[List[int]] = None, status: Optional[str] = None) -> List[Album]:
+    if catalogue.index.loaded:
+        # Sort and page in memory, then load just the page
+        page_ids = catalogue.index.page(offset, limit, sort_by, order, album_ids, status)
+        if not page_ids:
+            return []
+        albums = {a.id: a for a in session.exec(select(Album).options(*_album_load_options()).where(Album.id.in_(page_ids))).all()}
+        return [albums[i] for i in page_ids if i in albums]
+
+    statement = select(Album).options(*_album_load_options())
     
     if album_ids is not None:
         statement = statement.where(Album.id.in_(album_ids))
 
     if status is not None:
         statement = statement.where(Album.status == status)
+    statement = statement.where(_active())
 
     # For secondary sorting we always need Artist info to sort conditionally.
     # Joining Artist is safe even if Album doesn't have an artist (isouter=True).
@@ -304,6 +960,100 @@ def get_albums(session: Session, offset: int = 0, limit: int = 100, sort_by: str
 
     return session.exec(statement.offset(offset).limit(limit)).all()
 
+# --- Search ---
+def _name_matches(model, term: str, is_exact: bool):
+    column = func.lower(model.name)
+    return column == term if is_exact else column.contains(term)
+
+def _not_archived(album_id_column):
+    # Archived albums never show up in search. Their ids come off the partial index on
+    # archived albums, a handful of rows, instead of a lookup per matching link or track.
+    return album_id_column.not_in(select(Album.id).where(Album.archived_at != None))
+
+def _linked_album_ids(link_model, link_column, model, condition):
+    # Resolve the (small) set of matching genre/tag/artist ids first, so the link table
+    # is probed through its reverse index instead of scanned and joined row by row
+    return (select(link_model.album_id).where(link_column.in_(select(model.id).where(condition)))
+            .where(_not_archived(link_model.album_id)))
+
+def search_album_ids(session: Session, q: str, filter: str = "all") -> List[int]:
+    """
+    Returns the ids of albums matching q for the given filter mode, deduplicated in match order.
+    Genre and tag terms support "a and b" (all) and "a or b" (any); "quotes" force an exact match.
+    """
+    q_lower = q.lower().strip()
+    
+    is_exact = False
+    if q_lower.startswith('"') and q_lower.endswith('"') and len(q_lower) > 1:
+        is_exact = True
+        q_lower = q_lower[1:-1].strip()
+    
+    results: List[int] = []
+    
+    # helper for AND logic on tags/genres
+    def search_with_logic(model, link_model, link_column):
+        nonlocal results
+        # Check for AND/OR
+        if " and " in q_lower and not is_exact:
+            terms = [t.strip() for t in q_lower.split(" and ") if t.strip()]
+            if not terms: return
+            
+            # For AND, we need albums that have ALL terms. 
+            # We find IDs that match each term and then intersect.
+            id_sets = []
+            for term in terms:
+                stmt = _linked_album_ids(link_model, link_column, model, _name_matches(model, term, False))
+                id_sets.append(set(session.exec(stmt).all()))
+            
+            if not id_sets: return
+            results += sorted(set.intersection(*id_sets))
+        
+        elif " or " in q_lower and not is_exact:
+            terms = [t.strip() for t in q_lower.split(" or ") if t.strip()]
+            if not terms: return
+            
+            # For OR, any term matches.
+            condition = or_(*[_name_matches(model, term, False) for term in terms])
+            results += session.exec(_linked_album_ids(link_model, link_column, model, condition)).all()
+        else:
+            # Standard single term search
+            results += session.exec(_linked_album_ids(link_model, link_column, model, _name_matches(model, q_lower, is_exact))).all()
+
+    def match(column):
+        return func.lower(column) == q_lower if is_exact else func.lower(column).contains(q_lower)
+
+    # 1. Search by Title
+    if filter in ["all", "title"]:
+        results += session.exec(select(Album.id).where(Album.archived_at == None).where(match(Album.title))).all()
+    
+    # 2. Search by Artist Name
+    if filter in ["all", "artist"]:
+        # We can also support AND/OR for artists if we want, but requirements specifically mentioned genres/tags
+        results += session.exec(_linked_album_ids(AlbumArtistLink, AlbumArtistLink.artist_id, Artist, _name_matches(Artist, q_lower, is_exact))).all()
+    
+    # 3. Search by Notes
+    if filter == "all":
+        results += session.exec(select(Album.id).where(Album.archived_at == None).where(match(Album.notes))).all()
+
+    # 4. Search by Genre
+    if filter in ["all", "genre"]:
+        search_with_logic(Genre, AlbumGenreLink, AlbumGenreLink.genre_id)
+
+    # 5. Search by Tag
+    if filter in ["all", "tag"]:
+        search_with_logic(Tag, AlbumTagLink, AlbumTagLink.tag_id)
+        
+    # 6. Search by Track Title
+    if filter in ["all", "track"]:
+        results += session.exec(select(Track.album_id).where(match(Track.title)).where(_not_archived(Track.album_id)).distinct()).all()
+
+    # 7. Search by Media Type
+    if filter in ["all", "media_type"]:
+        results += session.exec(select(Album.id).where(Album.archived_at == None).where(match(Album.media_type))).all()
+
+    # Combine and Deduplicate (by ID)
+    return list(dict.fromkeys(results))
+
 def get_album(session: Session, album_id: int) -> Optional[Album]:
     return session.get(Album, album_id)
 
@@ -312,6 +1062,7 @@ def create_artist(session: Session, artist: Artist) -> Artist:
     session.add(artist)
     session.commit()
     session.refresh(artist)
+    _notify(session, "artists", [artist.id])
     return artist
 
 def get_artists(session: Session) -> List[Artist]:
@@ -322,32 +1073,79 @@ def create_tag(session: Session, tag: Tag) -> Tag:
     session.add(tag)
     session.commit()
     session.refresh(tag)
+    _notify(session, "tags", [tag.id])
     return tag
 
 def delete_genre(session: Session, genre_id: int) -> bool:
     genre = session.get(Genre, genre_id)
     if not genre:
         return False
+    album_ids = _album_ids_linked(session, AlbumGenreLink, AlbumGenreLink.genre_id, genre_id)
+    # Remove the links explicitly so no orphaned link rows survive the delete
+    session.exec(text("DELETE FROM album_genre_links WHERE genre_id = :id"), params={"id": genre_id})
     session.delete(genre)
     session.commit()
+    _notify(session, "genres", [genre_id])
+    _notify(session, "albums", album_ids)
     return True
 
 def delete_tag(session: Session, tag_id: int) -> bool:
     tag = session.get(Tag, tag_id)
     if not tag:
         return False
+    album_ids = _album_ids_linked(session, AlbumTagLink, AlbumTagLink.tag_id, tag_id)
+    # Remove the links explicitly so no orphaned link rows survive the delete
+    session.exec(text("DELETE FROM album_tag_links WHERE tag_id = :id"), params={"id": tag_id})
     session.delete(tag)
     session.commit()
+    _notify(session, "tags", [tag_id])
+    _notify(session, "albums", album_ids)
     return True
 
 def delete_artist(session: Session, artist_id: int) -> bool:
     artist = session.get(Artist, artist_id)
     if not artist:
         return False
+    album_ids = _album_ids_linked(session, AlbumArtistLink, AlbumArtistLink.artist_id, artist_id)
+    # Remove the links explicitly so no orphaned link rows survive the delete
+    session.exec(text("DELETE FROM album_artist_links WHERE artist_id = :id"), params={"id": artist_id})
     session.delete(artist)
+    _refresh_keys_after_artist_change(session, album_ids)
     session.commit()
+    _notify(session, "artists", [artist_id])
+    _notify(session, "albums", album_ids)
     return True
 
+def cleanup_metadata(session: Session, kind: str, ids: Optional[List[int]] = None) -> int:
+    """
+    Deletes genres, tags or artists in one transaction: every unused one when ids is None,
+    otherwise the given ids together with their album links. Returns the number deleted.
+    """
+    model, link_model, column, _ = MERGE_KINDS[kind]
+    table, link_table = model.__tablename__, link_model.__tablename__
+    affected: List[int] = []
+    if ids is None:
+        # NOT EXISTS probes the reverse link index per row instead of building an id list
+        unused = f"NOT EXISTS (SELECT 1 FROM {link_table} WHERE {link_table}.{column} = {table}.id)"
+        deleted = list(session.exec(text(f"SELECT id FROM {table} WHERE {unused}")).scalars().all())
+        if deleted:
+            session.exec(text(f"DELETE FROM {table} WHERE {unused}"))
+    else:
+        deleted = _stage_ids(session, "cleanup_ids", table, ids)
+        selection = f"{column} IN (SELECT id FROM temp.cleanup_ids)"
+        affected = list(dict.fromkeys(session.exec(text(f"SELECT album_id FROM {link_table} WHERE {selection}")).scalars().all()))
+        session.exec(text(f"DELETE FROM {link_table} WHERE {selection}"))
+        session.exec(text(f"DELETE FROM {table} WHERE id IN (SELECT id FROM temp.cleanup_ids)"))
+        session.exec(text("DELETE FROM temp.cleanup_ids"))
+        if kind == "artists":
+            _refresh_keys_after_artist_change(session, affected)
+    session.commit()
+    if deleted:
+        _notify(session, kind, deleted)
+    if affected:
+        _notify(session, "albums", affected)
+    return len(deleted)
+
 def get_tags(session: Session):
     # Return list of dicts with count
     statement = select(Tag, func.count(AlbumTagLink.album_id)).join(AlbumTagLink, isouter=True).group_by(Tag.id)
@@ -366,6 +1164,7 @@ def update_tag(session: Session, tag_id: int, tag_data: Tag) -> Optional[Tag]:
     session.add(db_tag)
     session.commit()
     session.refresh(db_tag)
+    _notify(session, "tags", [tag_id])
     return db_tag
 
 # --- Locations ---
@@ -373,6 +1172,7 @@ def create_location(session: Session, location: Location) -> Location:
     session.add(location)
     session.commit()
     session.refresh(location)
+    _notify(session, "locations", [location.id])
     return location
 
 def get_location(session: Session, location_id: int) -> Optional[Location]:
@@ -390,6 +1190,7 @@ def update_location(session: Session, location_id: int, location_data: Location)
     session.add(db_location)
     session.commit()
     session.refresh(db_location)
+    _notify(session, "locations", [location_id])
     return db_location
 
 def get_locations(session: Session) -> List[Location]:
@@ -401,46 +1202,100 @@ def add_artist_to_album(session: Session, album_id: int, artist_id: int, role: O
     session.add(link)
     session.commit()
     session.refresh(link)
+    # The artist set is part of the fingerprint
+    album = session.get(Album, album_id)
+    if album:
+        session.refresh(album, ["artists"])
+        album.updated_at = datetime.utcnow()
+        _refresh_album_keys(album)
+        session.add(album)
+        session.commit()
+        session.refresh(link)
+    _notify(session, "albums", [album_id])
     return link
 
-def check_duplicate_album(session: Session, title: str, artist_names: List[str], upc_ean: Optional[str] = None) -> List[Album]:
+FUZZY_THRESHOLD = 0.85
+FUZZY_CANDIDATES = 200
+
+def check_duplicate_album(session: Session, title: str, artist_names: List[str], upc_ean: Optional[str] = None, fuzzy: bool = False) -> List[Album]:
     """
     Checks if an album already exists by barcode or Title + Artists combination.
+    Both checks are a single lookup on the normalised barcode_key / fingerprint indexes,
+    so "The Beatles - Abbey Road (Remastered)" matches "Beatles - Abbey Road".
+    With fuzzy=True, near-matches on title and artists are appended after the exact ones.
     """
-    results = []
-    
+    barcode_key = utils.normalize_barcode(upc_ean)
+    fingerprint = utils.album_fingerprint(title, artist_names) if artist_names else None
+
+    conditions = []
     # 1. Check by barcode (highest confidence)
-    if upc_ean:
-        stmt = select(Album).where(Album.upc_ean == upc_ean).options(selectinload(Album.artists))
-        barcode_matches = session.exec(stmt).all()
-        for m in barcode_matches:
-            if m not in results:
-                results.append(m)
-                
-    # 2. Check by Title + Artists (case insensitive title, exact artist match)
-    if title and artist_names:
-        # Get albums with matching title first
-        stmt = select(Album).where(func.lower(Album.title) == title.lower()).options(selectinload(Album.artists))
-        title_matches = session.exec(stmt).all()
-        
-        for album in title_matches:
-            album_artist_names = [a.name for a in album.artists]
-            # Check if all provided artists are in the album's artists (simplification)
-            # or if the lists match exactly
-            if sorted(album_artist_names) == sorted(artist_names):
-                if album not in results:
-                    results.append(album)
-                    
+    if barcode_key:
+        conditions.append(Album.barcode_key == barcode_key)
+    # 2. Check by Title + Artists
+    if fingerprint:
+        conditions.append(Album.fingerprint == fingerprint)
+
+    results = []
+    if conditions:
+        matches = session.exec(select(Album).where(or_(*conditions)).where(_active()).options(selectinload(Album.artists))).all()
+        # Barcode matches first, as before
+        results = sorted(matches, key=lambda a: (a.barcode_key != barcode_key, a.id))
+
+    if fuzzy and title:
+        seen = {a.id for a in results}
+        results += [a for a in _fuzzy_duplicates(session, title, artist_names) if a.id not in seen]
     return results
 
+def _fuzzy_duplicates(session: Session, title: str, artist_names: List[str]) -> List[Album]:
+    title_key = utils.normalize_title(title)
+    if not title_key:
+        return []
+    # Block on the first title word, then take the FUZZY_CANDIDATES keys closest to title_key
+    # in index order (half after, half before it), so a common first word ("the", "live")
+    # still yields the nearest titles, the same ones on every run. Candidates are scored in Python.
+    first_word = title_key.split()[0]
+    half = FUZZY_CANDIDATES // 2
+    candidates = session.exec(
+        select(Album)
+        .where(Album.title_key >= title_key, Album.title_key < first_word + "\uffff")
+        .where(_active())
+        .order_by(Album.title_key, Album.id)
+        .options(selectinload(Album.artists))
+        .limit(half)
+    ).all()
+    candidates += session.exec(
+        select(Album)
+        .where(Album.title_key >= first_word, Album.title_key < title_key)
+        .where(_active())
+        .order_by(Album.title_key.desc(), Album.id.desc())
+        .options(selectinload(Album.artists))
+        .limit(half)
+    ).all()
+
+    wanted_artists = {utils.artist_key(name) for name in artist_names if name}
+    scored = []
+    for album in candidates:
+        score = SequenceMatcher(None, title_key, album.title_key or "").ratio()
+        if wanted_artists:
+            have = {utils.artist_key(a.name) for a in album.artists}
+            overlap = len(wanted_artists & have) / len(wanted_artists | have) if have else 0.0
+            score = 0.7 * score + 0.3 * overlap
+        if score >= FUZZY_THRESHOLD:
+            scored.append((score, album))
+    scored.sort(key=lambda item: (-item[0], item[1].id))
+    return [album for _, album in scored]
+
 # --- Statistics ---
 def get_genre_distribution(session: Session):
+    if catalogue.index.loaded:
+        return catalogue.index.distribution("genres")
     # Only for albums in collection
     statement = select(Genre.name, func.count(Album.id).label("count"))\
         .select_from(Genre)\
         .join(AlbumGenreLink)\
         .join(Album)\
         .where(Album.status == "collection")\
+        .where(_active())\
         .group_by(Genre.name)\
         .order_by(desc("count"))\
         .limit(10)
@@ -448,12 +1303,15 @@ def get_genre_distribution(session: Session):
     return [{"name": name, "count": count} for name, count in results]
 
 def get_tag_distribution(session: Session):
+    if catalogue.index.loaded:
+        return catalogue.index.distribution("tags")
     # Only for albums in collection
     statement = select(Tag.name, func.count(Album.id).label("count"))\
         .select_from(Tag)\
         .join(AlbumTagLink)\
         .join(Album)\
         .where(Album.status == "collection")\
+        .where(_active())\
         .group_by(Tag.name)\
         .order_by(desc("count"))\
         .limit(10)
@@ -1,4 +1,8 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import SQLModel, create_engine, Session, text
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
 import os
 
 from pathlib import Path
@@ -11,12 +15,126 @@ if not os.path.exists(data_dir):
 sqlite_file_name = os.path.join(data_dir, "discvault.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-connect_args = {"check_same_thread": False}
+# Writers outside the group-commit writer (imports, maintenance jobs, the CLI) wait this long
+# for the write lock while a group is being committed, instead of failing straight away
+BUSY_TIMEOUT = float(os.getenv("DISCVAULT_BUSY_TIMEOUT", "30"))
+connect_args = {"check_same_thread": False, "timeout": BUSY_TIMEOUT}
 engine = create_engine(sqlite_url, connect_args=connect_args)
 
+# Dedicated pool for blocking work (SQLite queries, disk writes) issued from async routes.
+# Keeping it separate from Starlette's threadpool means a burst of slow cover writes can't
+# starve the sync endpoints, and the event loop itself never waits on the disk.
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DISCVAULT_IO_WORKERS", "4")),
+    thread_name_prefix="discvault-io",
+)
+
+# Indexes replaced by newer ones; dropped so existing databases don't keep maintaining them
+OBSOLETE_INDEXES = ["ix_albums_status", "ix_albums_status_runtime_ms"]
+
 def create_db_and_tables():
+    with engine.connect() as conn:
+        # Only takes effect on a new, empty file; older databases switch on their first purge
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
     SQLModel.metadata.create_all(engine)
+    ensure_columns()
+    ensure_indexes()
+
+def ensure_columns():
+    # Lightweight migration: add nullable columns introduced after the database was created
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+            if not existing:
+                continue
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+
+def ensure_indexes():
+    # create_all only creates indexes together with a new table, so indexes added to the
+    # models later would never reach an existing database without this pass
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+
+def init_fts(session: Session, rebuild: bool = True):
+    # Create FTS5 virtual table for albums if it doesn't exist
+    session.exec(text("CREATE VIRTUAL TABLE IF NOT EXISTS album_search USING fts5(title, notes, content='albums', content_rowid='id');"))
+    
+    # Triggers to keep FTS index in sync
+    session.exec(text("""
+    CREATE TRIGGER IF NOT EXISTS album_ai AFTER INSERT ON albums BEGIN
+      INSERT INTO album_search(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+    END;
+    """))
+    session.exec(text("""
+    CREATE TRIGGER IF NOT EXISTS album_ad AFTER DELETE ON albums BEGIN
+      INSERT INTO album_search(album_search, rowid, title, notes) VALUES('delete', old.id, old.title, old.notes);
+    END;
+    """))
+    session.exec(text("""
+    CREATE TRIGGER IF NOT EXISTS album_au AFTER UPDATE ON albums BEGIN
+      INSERT INTO album_search(album_search, rowid, title, notes) VALUES('delete', old.id, old.title, old.notes);
+      INSERT INTO album_search(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+    END;
+    """))
+    
+    # Force rebuild of the FTS index to ensure existing data is indexed (Good for dev/small dbs)
+    if rebuild:
+        session.exec(text("INSERT INTO album_search(album_search) VALUES('rebuild');"))
+    
+    session.commit()
+
+def optimize_fts(session: Session):
+    # Merges the FTS b-tree segments, dropping the space held by deleted rows
+    session.exec(text("INSERT INTO album_search(album_search) VALUES('optimize');"))
+    session.commit()
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+def reclaim_space() -> dict:
+    """
+    Returns the pages freed by deletes to the file system with an incremental vacuum.
+    A database created before auto_vacuum was enabled needs one full VACUUM to switch modes.
+    """
+    with engine.connect() as conn:
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        pages_before = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        full = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2
+        if full:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        else:
+            # execute() would step the pragma once and free a single page; executescript runs it to the end
+            conn.connection.driver_connection.executescript("PRAGMA incremental_vacuum;")
+        pages_after = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    return {"full_vacuum": full, "free_pages": free_pages, "bytes_reclaimed": (pages_before - pages_after) * page_size,
+            "bytes": pages_after * page_size}
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Runs a blocking callable on the dedicated executor and awaits its result.
+    """
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context along so per-request query profiling still attributes the work
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+async def run_in_session(fn, *args, **kwargs):
+    """
+    Runs fn(session, *args, **kwargs) with a fresh Session on the dedicated executor.
+    Anything that needs lazy-loaded relationships must be serialised inside fn,
+    because the session is closed once the call returns.
+    """
+    def call():
+        with Session(engine) as session:
+            return fn(session, *args, **kwargs)
+    return await run_blocking(call)
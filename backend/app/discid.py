@@ -0,0 +1,279 @@
+"""
+Offline MusicBrainz disc IDs from cue sheets and raw disc TOCs.
+
+A disc ID is the SHA-1 of the TOC (first and last track number, lead-out offset and the
+99 track offsets, all in CD frames of 1/75 s including the 150-frame lead-in), encoded in
+MusicBrainz' URL-safe base64. Track durations fall out of the same offsets, so a cue
+sheet next to its rip is enough to catalogue a disc without any network access.
+"""
+import base64
+import glob
+import hashlib
+import os
+import re
+import struct
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from . import crud, utils
+from .models import Album, AlbumCreate
+from .tracklist import FRAMES_PER_SECOND, cue_tracks, format_frames, parse_cue
+
+LEAD_IN_FRAMES = 150
+RAW_FRAME_BYTES = 2352
+BARCODE_RE = re.compile(r"^\d{12,14}$")
+
+Toc = Tuple[int, int, int, List[int]]  # first track, last track, lead-out offset, track offsets
+
+def disc_id(first: int, last: int, leadout: int, offsets: List[int]) -> str:
+    sha = hashlib.sha1()
+    sha.update(f"{first:02X}{last:02X}".encode("ascii"))
+    padded = [leadout] + list(offsets) + [0] * (99 - len(offsets))
+    sha.update("".join(f"{offset:08X}" for offset in padded).encode("ascii"))
+    return base64.b64encode(sha.digest()).decode("ascii").translate(str.maketrans("+/=", "._-"))
+
+def toc_string(first: int, last: int, leadout: int, offsets: List[int]) -> str:
+    # The format MusicBrainz accepts as ?toc= on /ws/2/discid
+    return " ".join(str(n) for n in [first, last, leadout] + list(offsets))
+
+def parse_toc(text: str) -> Toc:
+    """
+    Parses "first last leadout offset1 offset2 ..." (spaces or '+', as in MusicBrainz URLs).
+    """
+    numbers = [int(part) for part in re.split(r"[\s+]+", text.strip()) if part]
+    if len(numbers) < 4:
+        raise ValueError("A TOC needs the first and last track, the lead-out and at least one offset")
+    first, last, leadout, offsets = numbers[0], numbers[1], numbers[2], numbers[3:]
+    if last - first + 1 != len(offsets):
+        raise ValueError(f"TOC lists {len(offsets)} offsets for tracks {first}-{last}")
+    if offsets != sorted(offsets) or leadout <= offsets[-1]:
+        raise ValueError("TOC offsets must increase and end before the lead-out")
+    return first, last, leadout, offsets
+
+def toc_tracks(first: int, last: int, leadout: int, offsets: List[int], disc_no: int = 1) -> List[Dict]:
+    bounds = list(offsets) + [leadout]
+    return [{
+        "position": first + i,
+        "title": f"Track {first + i}",
+        "duration": format_frames(bounds[i + 1] - bounds[i]),
+        "disc_no": disc_no,
+        "disc_name": None,
+    } for i in range(len(offsets))]
+
+def describe_toc(toc: Toc, disc_no: int = 1) -> Dict:
+    return {"disc_no": disc_no, "disc_id": disc_id(*toc), "toc": toc_string(*toc), "tracks": toc_tracks(*toc, disc_no=disc_no)}
+
+# --- Audio file lengths (for the lead-out of cue-referenced images) ---
+def _flac_frames(path: Path) -> Optional[int]:
+    with open(path, "rb") as f:
+        if f.read(4) != b"fLaC":
+            return None
+        header = f.read(4)
+        if len(header) < 4 or header[0] & 0x7F != 0:  # first block must be STREAMINFO
+            return None
+        info = f.read(34)
+    sample_rate = (info[10] << 12) | (info[11] << 4) | (info[12] >> 4)
+    total_samples = ((info[13] & 0x0F) << 32) | struct.unpack(">I", info[14:18])[0]
+    if not sample_rate or not total_samples:
+        return None
+    return round(total_samples * FRAMES_PER_SECOND / sample_rate)
+
+def audio_frames(path: Optional[Path]) -> Optional[int]:
+    """
+    Length of a WAV, FLAC or raw BIN image in CD frames, or None if it can't be determined.
+    """
+    if path is None or not path.is_file():
+        return None
+    suffix = path.suffix.lower()
+    try:
+        if suffix == ".wav":
+            with wave.open(str(path), "rb") as w:
+                return round(w.getnframes() * FRAMES_PER_SECOND / w.getframerate())
+        if suffix == ".flac":
+            return _flac_frames(path)
+        if suffix in (".bin", ".raw", ".img"):
+            return path.stat().st_size // RAW_FRAME_BYTES
+    except (OSError, wave.Error, EOFError, struct.error):
+        return None
+    return None
+
+def _resolve(base_dir: Optional[Path], name: Optional[str]) -> Optional[Path]:
+    if not base_dir or not name:
+        return None
+    candidate = base_dir / name.replace("\\", "/")
+    if candidate.exists():
+        return candidate
+    # Cue sheets often name the file with a different extension than the rip that sits next to them
+    for sibling in base_dir.glob(glob.escape(Path(name.replace("\\", "/")).stem) + ".*"):
+        if sibling.suffix.lower() in (".wav", ".flac", ".bin"):
+            return sibling
+    return None
+
+def cue_discs(sheet: Dict, base_dir: Optional[Path] = None, file_frames: Optional[Dict[str, int]] = None) -> List[Dict]:
+    """
+    Per disc of a parsed cue sheet: tracks with durations and, when the lengths of all
+    referenced files are known (found next to the cue or passed in), TOC and disc ID.
+    """
+    file_frames = dict(file_frames or {})
+    for name in sheet["files"]:
+        if name not in file_frames:
+            frames = audio_frames(_resolve(base_dir, name)) if base_dir else None
+            if frames:
+                file_frames[name] = frames
+
+    discs = []
+    for disc_no in sorted({t["disc_no"] for t in sheet["tracks"]}):
+        tracks = [t for t in sheet["tracks"] if t["disc_no"] == disc_no and t["type"] == "AUDIO"]
+        if not tracks:
+            continue
+        tracklist = cue_tracks({"tracks": tracks}, file_frames)
+        disc = {"disc_no": disc_no, "disc_id": None, "toc": None, "tracks": tracklist}
+
+        # Lay the files of this disc end to end; every offset needs the length of all earlier files
+        offsets, start, current_file, known = [], LEAD_IN_FRAMES, None, True
+        for track in tracks:
+            if track["file"] != current_file:
+                if current_file is not None:
+                    if current_file not in file_frames:
+                        known = False
+                        break
+                    start += file_frames[current_file]
+                current_file = track["file"]
+            if track["index01"] is None:
+                known = False
+                break
+            offsets.append(start + track["index01"])
+        if known and current_file in file_frames:
+            toc = (tracks[0]["number"], tracks[-1]["number"], start + file_frames[current_file], offsets)
+            disc["disc_id"] = disc_id(*toc)
+            disc["toc"] = toc_string(*toc)
+        for item in tracklist:
+            item["disc_no"] = disc_no
+        discs.append(disc)
+    return discs
+
+def read_cue(path: Path) -> Dict:
+    raw = path.read_bytes()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("cp1252", errors="replace")
+    return parse_cue(text.splitlines())
+
+def album_from_cue(sheet: Dict, discs: List[Dict]) -> Dict:
+    """
+    AlbumCreate-compatible fields for a cue sheet (title, artists, year, genre, barcode, tracks).
+    """
+    year = sheet.get("date")
+    catalog = (sheet.get("catalog") or "").strip()
+    tracks = []
+    for disc in discs:
+        for track in disc["tracks"]:
+            tracks.append({
+                "track_no": track["position"],
+                "title": track["title"],
+                "duration": track["duration"],
+                "disc_no": disc["disc_no"],
+                "disc_name": f"CD {disc['disc_no']}" if len(discs) > 1 else None,
+            })
+    return {
+        "title": sheet.get("title") or "Onbekend album",
+        "artist_names": [sheet["performer"]] if sheet.get("performer") else [],
+        "genre_names": [sheet["genre"]] if sheet.get("genre") else [],
+        "year": int(year[:4]) if year and year[:4].isdigit() else None,
+        "upc_ean": catalog if BARCODE_RE.match(catalog) else None,
+        "mb_disc_id": next((d["disc_id"] for d in discs if d["disc_id"]), None),
+        "tracks": tracks,
+    }
+
+def iter_cue_files(root: Path) -> Iterator[Path]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".cue"):
+                yield Path(dirpath) / filename
+
+def cue_album_fields(path: Path) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Reads one cue sheet (and the headers of its audio files) into album fields.
+    Returns (fields, None) or (None, error); top-level so worker processes can run it.
+    """
+    try:
+        sheet = read_cue(path)
+        if not sheet["tracks"]:
+            raise ValueError("no tracks in cue sheet")
+        return album_from_cue(sheet, cue_discs(sheet, path.parent)), None
+    except (OSError, ValueError) as e:
+        return None, str(e)
+
+def import_cue_directory(session: Session, root: Path, status: str = "collection", dry_run: bool = False, batch_size: int = 200,
+                         workers: int = 1) -> Dict:
+    """
+    Builds an album from every cue sheet below root and creates them through crud's batched
+    pipeline. Discs whose ID (or, without one, whose title/artist fingerprint) is already in
+    the collection are skipped, so re-running an import is harmless.
+
+    With workers > 1 the sheets are parsed in that many processes; results are still
+    consumed in file order, so the report is the same as for a serial run.
+    """
+    report = {"scanned": 0, "created": 0, "skipped": [], "errors": [], "albums": []}
+    pending: List[Tuple[str, AlbumCreate]] = []
+    seen_disc_ids, seen_fingerprints = set(), set()
+
+    def flush():
+        batch = [album for _, album in pending]
+        disc_ids = [a.mb_disc_id for a in batch if a.mb_disc_id]
+        fingerprints = [utils.album_fingerprint(a.title, a.artist_names) for a in batch]
+        existing_ids = crud.get_album_ids_by_disc_id(session, disc_ids)
+        existing_fps = set(session.exec(
+            select(Album.fingerprint).where(Album.fingerprint.in_([f for f in fingerprints if f]))
+        ).all())
+        to_create = []
+        for (source, album), fingerprint in zip(pending, fingerprints):
+            if album.mb_disc_id:
+                duplicate = album.mb_disc_id in existing_ids or album.mb_disc_id in seen_disc_ids
+            else:
+                duplicate = fingerprint is not None and (fingerprint in existing_fps or fingerprint in seen_fingerprints)
+            if duplicate:
+                report["skipped"].append(source)
+                continue
+            seen_disc_ids.add(album.mb_disc_id)
+            seen_fingerprints.add(fingerprint)
+            to_create.append((source, album))
+        if to_create and not dry_run:
+            ids = crud.create_albums(session, [album for _, album in to_create], batch_size=batch_size)
+        else:
+            ids = [None] * len(to_create)
+        for (source, album), album_id in zip(to_create, ids):
+            report["albums"].append({"source": source, "id": album_id, "title": album.title,
+                                     "mb_disc_id": album.mb_disc_id, "tracks": len(album.tracks)})
+        report["created"] += 0 if dry_run else len(to_create)
+        pending.clear()
+
+    def collect(paths: List[Path], parsed: Iterator[Tuple[Optional[Dict], Optional[str]]]):
+        for path, (fields, error) in zip(paths, parsed):
+            report["scanned"] += 1
+            source = str(path.relative_to(root))
+            if error is None:
+                try:
+                    pending.append((source, AlbumCreate(**fields, status=status)))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                report["errors"].append({"source": source, "error": error})
+            if len(pending) >= batch_size:
+                flush()
+
+    paths = list(iter_cue_files(root))
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            collect(paths, pool.map(cue_album_fields, paths, chunksize=max(1, min(64, len(paths) // (workers * 4)))))
+    else:
+        collect(paths, map(cue_album_fields, paths))
+    if pending:
+        flush()
+    return report
@@ -0,0 +1,191 @@
+"""
+In-process pub/sub for pushing collection changes and background-job progress to clients.
+
+Publishers (crud's change listeners, background jobs) may run on any thread; events are
+handed to the event loop and fanned out to one bounded queue per subscriber. A subscriber
+that falls behind never slows down publishers or other subscribers: once its queue is full
+it is dropped to a single "resync" event and should reload (or catch up via /changes).
+
+Recent events stay in a short replay buffer so a reconnecting EventSource can resume from
+its Last-Event-ID without missing anything.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+
+from sqlmodel import Session
+
+from .monitoring import registry
+
+QUEUE_SIZE = 256
+REPLAY_SIZE = 1000
+HEARTBEAT_SECONDS = 15.0
+
+events_published = registry.counter("discvault_events_published_total", "Events published on the push bus, by type.", ("type",))
+events_dropped = registry.counter("discvault_events_dropped_total", "Subscribers reset to a resync event because they fell behind.")
+
+class Subscriber:
+    def __init__(self, types: Optional[Set[str]] = None, maxsize: int = QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.types = types
+
+    def offer(self, event: Dict):
+        if self.types is not None and event["type"] not in self.types and event["type"] != "resync":
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow: throw away the backlog and tell the client to reload instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"id": event["id"], "type": "resync", "reason": "slow consumer"})
+            events_dropped.inc()
+
+class EventBus:
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: List[Subscriber] = []
+        self._ids = itertools.count(1)
+        self._recent: Deque[Dict] = deque(maxlen=REPLAY_SIZE)
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publish(self, type: str, **data):
+        """
+        Thread-safe; without a running loop (scripts, tests without lifespan) events are dropped.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(type, data)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, type, data)
+
+    def _dispatch(self, type: str, data: Dict):
+        # Always on the loop thread, so ids are assigned in delivery order
+        event = {"id": next(self._ids), "type": type, "at": time.time(), **data}
+        self._recent.append(event)
+        events_published.inc(type=type)
+        for subscriber in list(self._subscribers):
+            subscriber.offer(event)
+
+    def subscribe(self, types: Optional[Set[str]] = None, last_event_id: Optional[int] = None) -> Subscriber:
+        subscriber = Subscriber(types)
+        if last_event_id is not None:
+            if self._recent and self._recent[0]["id"] > last_event_id + 1:
+                subscriber.offer({"id": self._recent[-1]["id"], "type": "resync", "reason": "replay window exceeded"})
+            else:
+                for event in self._recent:
+                    if event["id"] > last_event_id:
+                        subscriber.offer(event)
+        self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self._subscribers:
+            self._subscribers.remove(subscriber)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def on_change(self, session: Session, kind: str, ids: Optional[List[int]]):
+        # crud change listener; ids=None means everything of that kind was replaced
+        self.publish("change", kind=kind, ids=ids)
+
+bus = EventBus()
+
+registry.gauge("discvault_event_subscribers", "Clients connected to the event stream.", fn=lambda: bus.subscribers)
+
+# --- Background jobs ---
+class Job:
+    PROGRESS_INTERVAL = 0.25  # seconds between progress events; the final state is always sent
+
+    def __init__(self, job_id: int, name: str, total: Optional[int]):
+        self.id = job_id
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.state = "running"
+        self.error: Optional[str] = None
+        self.result: Optional[Dict] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._last_sent = 0.0
+
+    def snapshot(self) -> Dict:
+        return {"job_id": self.id, "name": self.name, "state": self.state, "done": self.done, "failed": self.failed,
+                "total": self.total, "error": self.error, "result": self.result, "started_at": self.started_at, "finished_at": self.finished_at}
+
+    def _send(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self._last_sent >= self.PROGRESS_INTERVAL:
+            self._last_sent = now
+            bus.publish("job", **self.snapshot())
+
+    def advance(self, n: int = 1, failed: bool = False):
+        self.done += n
+        if failed:
+            self.failed += n
+        self._send()
+
+    def finish(self, error: Optional[str] = None, result: Optional[Dict] = None):
+        self.state = "failed" if error else "finished"
+        self.error = error
+        self.result = result
+        self.finished_at = time.time()
+        self._send(force=True)
+
+class JobRegistry:
+    KEEP_FINISHED = 50
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._jobs: Dict[int, Job] = {}
+
+    def start(self, name: str, total: Optional[int] = None) -> Job:
+        job = Job(next(self._ids), name, total)
+        self._jobs[job.id] = job
+        finished = [j.id for j in self._jobs.values() if j.state != "running"]
+        for job_id in finished[:max(0, len(finished) - self.KEEP_FINISHED)]:
+            del self._jobs[job_id]
+        job._send(force=True)
+        return job
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict]:
+        return [job.snapshot() for job in reversed(list(self._jobs.values()))]
+
+jobs = JobRegistry()
+
+def format_sse(event: Dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+async def stream(subscriber: Subscriber, heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+    """
+    Server-sent events for one subscriber, with a comment line as heartbeat so proxies
+    keep the connection open. Unsubscribes when the client goes away.
+    """
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        bus.unsubscribe(subscriber)
@@ -0,0 +1,163 @@
+"""
+Streaming exports of the catalogue (albums with artists, genres, tags and tracks).
+
+Albums are read in keyset-paginated chunks (WHERE id > last ORDER BY id), each chunk with
+its links and tracks fetched in a few set-based queries on a short-lived session. Memory
+stays bounded by the chunk size, the first bytes go out immediately, and writers are never
+blocked behind one long-running read.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+from typing import Dict, Iterator, List, Optional
+
+from sqlmodel import Session, select
+
+from .database import engine
+from .models import Album, Artist, Genre, Tag, Location, Track, AlbumArtistLink, AlbumGenreLink, AlbumTagLink
+
+CHUNK_SIZE = 500
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+ALBUM_FIELDS = ["id", "title", "year", "upc_ean", "catalog_no", "spars_code", "media_type", "status",
+                "notes", "cover_url", "location", "created_at", "updated_at"]
+ALBUM_COLUMNS = [getattr(Album, field) for field in ALBUM_FIELDS if field != "location"] + [Album.location_id]
+ALBUM_CSV_COLUMNS = ALBUM_FIELDS + ["artists", "genres", "tags", "discs", "track_count"]
+TRACK_CSV_COLUMNS = ["album_id", "disc_no", "disc_name", "track_no", "title", "duration"]
+
+def _linked_names(session: Session, link_model, link_column, model, album_ids: List[int]) -> Dict[int, List[str]]:
+    names: Dict[int, List[str]] = {}
+    rows = session.exec(
+        select(link_model.album_id, model.name).join(model, link_column == model.id).where(link_model.album_id.in_(album_ids))
+    ).all()
+    for album_id, name in rows:
+        names.setdefault(album_id, []).append(name)
+    return names
+
+def iter_album_chunks(status: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """
+    Yields lists of plain album dicts (relationships resolved to names, tracks in disc order).
+    """
+    last_id = 0
+    locations: Dict[int, str] = {}
+    while True:
+        with Session(engine) as session:
+            # Plain column rows: hydrating ORM objects would dominate the export time
+            statement = select(*ALBUM_COLUMNS).where(Album.id > last_id).order_by(Album.id).limit(chunk_size)
+            if status is not None:
+                statement = statement.where(Album.status == status)
+            albums = session.exec(statement).all()
+            if not albums:
+                return
+            album_ids = [a.id for a in albums]
+            if not locations:
+                locations = dict(session.exec(select(Location.id, Location.name)).all())
+            artists = _linked_names(session, AlbumArtistLink, AlbumArtistLink.artist_id, Artist, album_ids)
+            genres = _linked_names(session, AlbumGenreLink, AlbumGenreLink.genre_id, Genre, album_ids)
+            tags = _linked_names(session, AlbumTagLink, AlbumTagLink.tag_id, Tag, album_ids)
+            tracks: Dict[int, List[Dict]] = {}
+            for album_id, disc_no, disc_name, track_no, title, duration in session.exec(
+                select(Track.album_id, Track.disc_no, Track.disc_name, Track.track_no, Track.title, Track.duration)
+                .where(Track.album_id.in_(album_ids)).order_by(Track.album_id, Track.disc_no, Track.track_no)
+            ).all():
+                tracks.setdefault(album_id, []).append(
+                    {"disc_no": disc_no, "disc_name": disc_name, "track_no": track_no, "title": title, "duration": duration}
+                )
+
+            chunk = []
+            for album in albums:
+                record = album._asdict()
+                record["location"] = locations.get(record.pop("location_id"))
+                record["created_at"] = album.created_at.isoformat() if album.created_at else None
+                record["updated_at"] = album.updated_at.isoformat() if album.updated_at else None
+                record["artists"] = artists.get(album.id, [])
+                record["genres"] = genres.get(album.id, [])
+                record["tags"] = tags.get(album.id, [])
+                record["tracks"] = tracks.get(album.id, [])
+                chunk.append(record)
+            last_id = album_ids[-1]
+        yield chunk
+
+def _csv_lines(columns: List[str], rows: Iterator[Dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _album_csv_rows(chunks: Iterator[List[Dict]]) -> Iterator[Dict]:
+    for chunk in chunks:
+        for record in chunk:
+            row = dict(record)
+            row["artists"] = "; ".join(record["artists"])
+            row["genres"] = "; ".join(record["genres"])
+            row["tags"] = "; ".join(record["tags"])
+            row["discs"] = len({t["disc_no"] for t in record["tracks"]})
+            row["track_count"] = len(record["tracks"])
+            yield row
+
+def _track_rows(chunks: Iterator[List[Dict]]) -> Iterator[Dict]:
+    for chunk in chunks:
+        for record in chunk:
+            for track in record["tracks"]:
+                yield {"album_id": record["id"], **track}
+
+def stream_albums(fmt: str, status: Optional[str] = None) -> Iterator[str]:
+    chunks = iter_album_chunks(status)
+    if fmt == "csv":
+        return _csv_lines(ALBUM_CSV_COLUMNS, _album_csv_rows(chunks))
+    return (
+        "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in chunk)
+        for chunk in chunks
+    )
+
+def stream_tracks(fmt: str, status: Optional[str] = None) -> Iterator[str]:
+    rows = _track_rows(iter_album_chunks(status))
+    if fmt == "csv":
+        return _csv_lines(TRACK_CSV_COLUMNS, rows)
+    return (json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def stream_albums_parquet(status: Optional[str] = None, read_size: int = 256 * 1024) -> Iterator[bytes]:
+    """
+    Writes one Parquet row group per chunk to a temporary file and streams it once complete:
+    the footer can only be written at the end, but memory still stays at one chunk.
+    Requires the optional pyarrow package.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    track_type = pa.struct([("disc_no", pa.int64()), ("disc_name", pa.string()), ("track_no", pa.int64()),
+                            ("title", pa.string()), ("duration", pa.string())])
+    schema = pa.schema(
+        [(field, pa.int64() if field in ("id", "year") else pa.string()) for field in ALBUM_FIELDS]
+        + [(name, pa.list_(pa.string())) for name in ("artists", "genres", "tags")]
+        + [("tracks", pa.list_(track_type))]
+    )
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in iter_album_chunks(status):
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+        with open(path, "rb") as f:
+            while data := f.read(read_size):
+                yield data
+    finally:
+        os.remove(path)
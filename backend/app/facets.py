@@ -0,0 +1,208 @@
+"""
+In-memory facet index for drill-down search.
+
+Every facet value (genre, tag, media type, decade, location, status) keeps a posting list
+of album ids stored as a bitset in a plain Python int (bit n set = album n matches).
+Filtering is a handful of AND/OR operations on those ints and a facet count is a single
+popcount, so counts for every value stay cheap even on large collections.
+
+The index is built lazily from the database and kept up to date through crud's change
+listeners: album writes patch the affected bits, anything broader triggers a rebuild.
+Each album's current values are remembered, so a write only touches the posting lists the
+album leaves or joins, never every value in the index.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .models import Album, Genre, Tag, Location, AlbumGenreLink, AlbumTagLink
+
+# Facet name -> label table for id-valued facets
+FACETS = ["genres", "tags", "media_type", "decade", "location", "status"]
+LABELS = {"genres": Genre, "tags": Tag, "location": Location}
+
+def to_bitset(ids: Iterable[int]) -> int:
+    ids = list(ids)
+    if not ids:
+        return 0
+    # Building through a bytearray is linear; OR-ing 1 << id per id would be quadratic
+    buf = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+def from_bitset(bits: int) -> List[int]:
+    ids = []
+    for offset, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        while byte:
+            low = byte & -byte
+            ids.append(offset * 8 + low.bit_length() - 1)
+            byte ^= low
+    return ids
+
+def decade(year: Optional[int]) -> Optional[int]:
+    return year // 10 * 10 if year else None
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Optional[Dict[str, Dict[object, int]]] = None
+        self._all = 0
+        # Album id -> the (facet, value) postings its bit is set in; pairs are shared objects
+        self._album_values: Dict[int, List[Tuple[str, object]]] = {}
+        self._pairs: Dict[Tuple[str, object], Tuple[str, object]] = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+            self._album_values = {}
+            self._pairs = {}
+
+    def _remember(self, album_id: int, facet: str, value) -> None:
+        pair = (facet, value)
+        self._album_values.setdefault(album_id, []).append(self._pairs.setdefault(pair, pair))
+
+    def _build(self, session: Session):
+        postings = {facet: {} for facet in FACETS}
+        album_ids = []
+        self._album_values, self._pairs = {}, {}
+        for album_id, media_type, year, location_id, status in session.exec(
+            select(Album.id, Album.media_type, Album.year, Album.location_id, Album.status).where(Album.archived_at == None)
+        ).all():
+            album_ids.append(album_id)
+            for facet, value in (("media_type", media_type), ("decade", decade(year)), ("location", location_id), ("status", status)):
+                postings[facet].setdefault(value, []).append(album_id)
+                self._remember(album_id, facet, value)
+        # Links of archived albums end up in the postings too, but every query is masked with _all
+        for album_id, genre_id in session.exec(select(AlbumGenreLink.album_id, AlbumGenreLink.genre_id)).all():
+            postings["genres"].setdefault(genre_id, []).append(album_id)
+            self._remember(album_id, "genres", genre_id)
+        for album_id, tag_id in session.exec(select(AlbumTagLink.album_id, AlbumTagLink.tag_id)).all():
+            postings["tags"].setdefault(tag_id, []).append(album_id)
+            self._remember(album_id, "tags", tag_id)
+
+        self._postings = {facet: {value: to_bitset(ids) for value, ids in values.items()} for facet, values in postings.items()}
+        self._all = to_bitset(album_ids)
+
+    def _ensure(self, session: Session):
+        if self._postings is None:
+            self._build(session)
+
+    def refresh_albums(self, session: Session, album_ids: List[int]):
+        """
+        Re-reads the facet values of the given albums (deleted ones simply drop out).
+        """
+        with self._lock:
+            if self._postings is None or not album_ids:
+                return
+            self._all &= ~to_bitset(album_ids)
+            # Clear the albums' bits only in the postings they were in
+            for album_id in album_ids:
+                keep = ~(1 << album_id)
+                for facet, value in self._album_values.pop(album_id, ()):
+                    values = self._postings[facet]
+                    bits = values.get(value, 0) & keep
+                    if bits:
+                        values[value] = bits
+                    else:
+                        values.pop(value, None)
+
+            def add(facet, value, album_id):
+                bit = 1 << album_id
+                values = self._postings[facet]
+                values[value] = values.get(value, 0) | bit
+                self._remember(album_id, facet, value)
+
+            for album_id, media_type, year, location_id, status in session.exec(
+                select(Album.id, Album.media_type, Album.year, Album.location_id, Album.status)
+                .where(Album.id.in_(album_ids)).where(Album.archived_at == None)
+            ).all():
+                self._all |= 1 << album_id
+                for facet, value in (("media_type", media_type), ("decade", decade(year)), ("location", location_id), ("status", status)):
+                    add(facet, value, album_id)
+            for album_id, genre_id in session.exec(
+                select(AlbumGenreLink.album_id, AlbumGenreLink.genre_id).where(AlbumGenreLink.album_id.in_(album_ids))
+            ).all():
+                add("genres", genre_id, album_id)
+            for album_id, tag_id in session.exec(
+                select(AlbumTagLink.album_id, AlbumTagLink.tag_id).where(AlbumTagLink.album_id.in_(album_ids))
+            ).all():
+                add("tags", tag_id, album_id)
+
+    def on_change(self, session: Session, kind: str, ids: Optional[List[int]]):
+        # crud change listener: patch album bits in place, rebuild for anything wider
+        if kind == "albums" and ids is not None:
+            self.refresh_albums(session, ids)
+        elif kind in ("albums", "genres", "tags", "locations"):
+            self.invalidate()
+
+    def search(self, session: Session, candidates: Optional[List[int]], selected: Dict[str, List]) -> Dict:
+        """
+        Applies the selected facet values to the candidate albums (None = whole collection).
+        Values within one facet are OR-ed, facets are AND-ed. Each facet is counted against
+        the filters of the *other* facets, so unselected values still show how many albums
+        picking them would add.
+        """
+        with self._lock:
+            self._ensure(session)
+            base = self._all if candidates is None else self._all & to_bitset(candidates)
+            filters = {}
+            for facet, values in selected.items():
+                if values:
+                    postings = self._postings[facet]
+                    bits = 0
+                    for value in values:
+                        bits |= postings.get(value, 0)
+                    filters[facet] = bits
+
+            matched = base
+            for bits in filters.values():
+                matched &= bits
+
+            counts = {}
+            for facet in FACETS:
+                scope = base
+                for other, bits in filters.items():
+                    if other != facet:
+                        scope &= bits
+                counts[facet] = {value: n for value, bits in self._postings[facet].items() if (n := (bits & scope).bit_count())}
+
+        return {"ids": from_bitset(matched), "counts": counts}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            if self._postings is None:
+                return {"built": False}
+            return {
+                "built": True,
+                "albums": self._all.bit_count(),
+                "values": {facet: len(values) for facet, values in self._postings.items()},
+                "bytes": sum((bits.bit_length() + 7) // 8 for values in self._postings.values() for bits in values.values()),
+            }
+
+index = FacetIndex()
+
+def facet_search(session: Session, candidates: Optional[List[int]], selected: Dict[str, List]) -> Dict:
+    """
+    Runs a facet query and attaches display labels; facet values come back sorted by count.
+    """
+    result = index.search(session, candidates, selected)
+    labels = {}
+    for facet, model in LABELS.items():
+        wanted = [value for value in result["counts"][facet] if value is not None]
+        if wanted:
+            labels[facet] = dict(session.exec(select(model.id, model.name).where(model.id.in_(wanted))).all())
+
+    facets = {}
+    for facet, counts in result["counts"].items():
+        chosen = set(selected.get(facet) or [])
+        entries = []
+        for value, count in counts.items():
+            entry = {"value": value, "count": count, "selected": value in chosen}
+            if facet in labels:
+                entry["label"] = labels[facet].get(value)
+            entries.append(entry)
+        entries.sort(key=lambda e: (-e["count"], str(e["value"])))
+        facets[facet] = entries
+    return {"total": len(result["ids"]), "ids": result["ids"], "facets": facets}
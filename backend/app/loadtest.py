@@ -0,0 +1,422 @@
+"""
+Concurrent load test for the DiscVault API.
+
+Starts a real uvicorn server on a copy of a synthetic collection (see synthetic.py), with
+MusicBrainz and the Cover Art Archive replaced by a local stub that answers after a
+configurable latency. A number of simulated users then run a mixed workload against it
+(browse, search, edit, scan/lookup, export) for a fixed time, and the throughput, p50/p99
+latency and error rate are reported per endpoint, as a table and as JSON:
+
+    python -m backend.app.loadtest --size 10k --users 32 --duration 60
+    python -m backend.app.loadtest --mix browse=3 edit=1 --mb-latency-ms 400 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .benchmark import SORT_ORDERS, _git_revision, _percentile, build_database
+from .synthetic import ean13, musicbrainz_releases, parse_size
+
+WORKLOADS = ["browse", "search", "edit", "lookup", "export"]
+DEFAULT_MIX = {"browse": 45, "search": 25, "edit": 15, "lookup": 10, "export": 5}
+SEARCH_TERMS = ["night", "summer", "davis", "rock", "live", "river", "blue", "love", "jazz", "remaster"]
+# Lookups for barcodes MusicBrainz doesn't know, answered with 404
+UNKNOWN_BARCODE_SHARE = 0.1
+
+# (endpoint label, method, url, request kwargs, statuses that count as success)
+Request = Tuple[str, str, str, Dict, Tuple[int, ...]]
+
+# --- MusicBrainz / Cover Art Archive stub ---
+def _png(rgb: Tuple[int, int, int], size: int = 64) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\0" + bytes(rgb) * size for _ in range(size))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: "_StubServer"
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.wait()
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip("/").split("/")
+        if path[1:4] == ["ws", "2", "release"] and len(path) == 4:
+            barcode = parse_qs(parts.query).get("query", [""])[0].removeprefix("barcode:")
+            release = stub.by_barcode.get(barcode)
+            self._send(200, "application/json", json.dumps({"releases": [release] if release else []}).encode())
+        elif path[1:4] == ["ws", "2", "release"] and len(path) == 5 and path[4] in stub.by_mbid:
+            self._send(200, "application/json", json.dumps(stub.by_mbid[path[4]]).encode())
+        elif len(path) == 4 and path[1] == "release" and path[3].startswith("front") and path[2] in stub.by_mbid:
+            self._send(200, "image/png", stub.cover)
+        else:
+            self._send(404, "application/json", b'{"error": "Not Found"}')
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.server.stub.count(status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "MusicBrainzStub"
+
+class MusicBrainzStub:
+    """
+    Serves /ws/2/release searches and lookups plus Cover Art Archive images for a set of
+    synthetic releases, each response delayed by latency_ms (+ up to jitter_ms).
+    """
+    def __init__(self, releases: List[Dict], latency_ms: float = 0, jitter_ms: float = 0):
+        self.by_barcode = {r["barcode"]: r for r in releases}
+        self.by_mbid = {r["id"]: r for r in releases}
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.cover = _png((180, 40, 60))
+        self.responses: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = _StubServer(("127.0.0.1", 0), _StubHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def wait(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def count(self, status: int):
+        with self._lock:
+            self.responses[status] += 1
+
+    def __enter__(self) -> "MusicBrainzStub":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+# --- Server under test ---
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(data_dir: str, port: int, workers: int, env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    """
+    Runs the app under uvicorn in its own process, as in production, and waits until it answers.
+    """
+    # The directory the package is importable from, whatever it is called in this checkout
+    root = Path(__file__).resolve().parents[len(__package__.split("."))]
+    command = [sys.executable, "-m", "uvicorn", f"{__package__}.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    log = open(log_path, "wb")
+    process = subprocess.Popen(command, cwd=root, env={**os.environ, **env, "DATA_DIR": data_dir},
+                               stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+
+    import httpx
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}:\n{log_path.read_text()[-2000:]}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start within 60 s:\n{log_path.read_text()[-2000:]}")
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+# --- Workload ---
+class Context:
+    # What the simulated users share: the collection size and the releases the stub knows
+    def __init__(self, album_count: int, releases: List[Dict], stub_url: str):
+        self.album_count = album_count
+        self.barcodes = [r["barcode"] for r in releases]
+        self.mbids = {r["barcode"]: r["id"] for r in releases}
+        self.stub_url = stub_url
+        self.created = 0
+
+    def album_id(self, rng: random.Random) -> int:
+        return rng.randint(1, self.album_count)
+
+def _browse(rng: random.Random, ctx: Context) -> Request:
+    roll = rng.random()
+    if roll < 0.5:
+        # Mostly the first pages, now and then a deep one
+        page = 0 if rng.random() < 0.6 else rng.randrange(max(1, ctx.album_count // 50))
+        return ("GET /albums/", "GET", "/albums/", {"params": {
+            "sort_by": rng.choice(SORT_ORDERS), "order": rng.choice(["asc", "desc"]), "offset": page * 50, "limit": 50}}, (200,))
+    if roll < 0.85:
+        return ("GET /albums/{id}", "GET", f"/albums/{ctx.album_id(rng)}", {}, (200, 404))
+    return ("GET /stats", "GET", "/stats", {}, (200,))
+
+def _search(rng: random.Random, ctx: Context) -> Request:
+    roll = rng.random()
+    term = rng.choice(SEARCH_TERMS)
+    if roll < 0.6:
+        return ("GET /search", "GET", "/search", {"params": {"q": term, "filter": rng.choice(["all", "title", "artist", "genre"])}}, (200,))
+    if roll < 0.8:
+        return ("GET /suggest", "GET", "/suggest", {"params": {"q": term[:rng.randint(1, 3)]}}, (200,))
+    return ("GET /search/facets", "GET", "/search/facets", {"params": {"q": term}}, (200,))
+
+def _edit(rng: random.Random, ctx: Context) -> Request:
+    if rng.random() < 0.7:
+        return ("PUT /albums/{id}", "PUT", f"/albums/{ctx.album_id(rng)}", {"json": {
+            "notes": f"load test {rng.getrandbits(32):08x}", "tag_ids": rng.sample(range(1, 6), 2)}}, (200, 404))
+    ctx.created += 1
+    payload = {
+        "title": f"Load Test Album {ctx.created}",
+        "year": rng.randint(1960, 2024),
+        "artist_names": [f"Load Test Artist {ctx.created % 13}"],
+        "genre_names": ["Rock"],
+        "tracks": [{"track_no": n, "title": f"Track {n}", "duration": "3:45", "disc_no": 1} for n in range(1, 11)],
+    }
+    if rng.random() < 0.5:
+        # An external cover makes the server pull it from the stub in a background task
+        barcode = rng.choice(ctx.barcodes)
+        payload["upc_ean"] = barcode
+        payload["cover_url"] = f"{ctx.stub_url}/release/{ctx.mbids[barcode]}/front-250"
+    return ("POST /albums/", "POST", "/albums/", {"json": payload}, (200,))
+
+def _lookup(rng: random.Random, ctx: Context) -> Request:
+    if rng.random() < 0.7:
+        barcode = ean13(rng) if rng.random() < UNKNOWN_BARCODE_SHARE else rng.choice(ctx.barcodes)
+        return ("GET /lookup/{barcode}", "GET", f"/lookup/{barcode}", {}, (200, 404))
+    # The duplicate check a scan runs alongside the lookup
+    return ("GET /albums/check-duplicate", "GET", "/albums/check-duplicate",
+            {"params": {"upc_ean": rng.choice(ctx.barcodes), "title": rng.choice(SEARCH_TERMS)}}, (200,))
+
+def _export(rng: random.Random, ctx: Context) -> Request:
+    if rng.random() < 0.9:
+        return ("GET /export/albums", "GET", "/export/albums", {"params": {"format": rng.choice(["ndjson", "csv"])}}, (200,))
+    return ("GET /export", "GET", "/export", {}, (200,))
+
+WORKLOAD_REQUESTS: Dict[str, Callable[[random.Random, Context], Request]] = {
+    "browse": _browse, "search": _search, "edit": _edit, "lookup": _lookup, "export": _export,
+}
+
+class EndpointStats:
+    def __init__(self):
+        self.timings_ms: List[float] = []
+        self.errors = 0
+        self.statuses: Counter = Counter()
+
+    def add(self, elapsed_ms: float, status, ok: bool):
+        self.timings_ms.append(elapsed_ms)
+        self.statuses[str(status)] += 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self, seconds: float) -> Dict:
+        timings = self.timings_ms
+        return {
+            "requests": len(timings),
+            "rps": round(len(timings) / seconds, 2),
+            "p50_ms": round(_percentile(timings, 50), 2),
+            "p99_ms": round(_percentile(timings, 99), 2),
+            "max_ms": round(max(timings), 2),
+            "mean_ms": round(statistics.fmean(timings), 2),
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(timings), 4),
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+async def _user(client, rng: random.Random, ctx: Context, mix: Dict[str, float], deadline: float,
+                stats: Dict[str, EndpointStats], think_s: float):
+    import httpx
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        label, method, url, kwargs, ok = WORKLOAD_REQUESTS[rng.choices(names, weights)[0]](rng, ctx)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status, success = response.status_code, response.status_code in ok
+        except httpx.HTTPError as e:
+            status, success = type(e).__name__, False
+        stats.setdefault(label, EndpointStats()).add((time.perf_counter() - start) * 1000, status, success)
+        if think_s:
+            await asyncio.sleep(rng.uniform(0, 2 * think_s))
+
+async def drive(base_url: str, ctx: Context, users: int, duration: float, warmup: float, mix: Dict[str, float],
+                think_ms: float, seed: int, timeout: float) -> Tuple[Dict[str, EndpointStats], float]:
+    """
+    Runs users concurrent simulated users; returns the per-endpoint stats of the measured
+    phase (after warmup) and how long it took.
+    """
+    import httpx
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for phase, seconds in (("warmup", warmup), ("measured", duration)):
+            if seconds <= 0:
+                continue
+            stats: Dict[str, EndpointStats] = {}
+            start = time.monotonic()
+            await asyncio.gather(*(
+                _user(client, random.Random(f"{seed}/{phase}/{i}"), ctx, mix, start + seconds, stats, think_ms / 1000)
+                for i in range(users)
+            ))
+            elapsed = time.monotonic() - start
+    return stats, elapsed
+
+def report_table(results: Dict[str, Dict], total: Dict):
+    print(f"\n{'endpoint':32s} {'requests':>9s} {'rps':>8s} {'p50 ms':>9s} {'p99 ms':>9s} {'max ms':>9s} {'errors':>7s}", file=sys.stderr)
+    for label, r in sorted(results.items(), key=lambda item: -item[1]["requests"]):
+        print(f"{label:32s} {r['requests']:9d} {r['rps']:8.1f} {r['p50_ms']:9.1f} {r['p99_ms']:9.1f} {r['max_ms']:9.1f} "
+              f"{r['error_rate']:7.2%}", file=sys.stderr)
+    print(f"{'total':32s} {total['requests']:9d} {total['rps']:8.1f} {total['p50_ms']:9.1f} {total['p99_ms']:9.1f} "
+          f"{total['max_ms']:9.1f} {total['error_rate']:7.2%}", file=sys.stderr)
+
+def run(args) -> Dict:
+    import httpx
+
+    albums = parse_size(args.size)
+    data_dir = tempfile.mkdtemp(prefix="discvault-load-")
+    (Path(data_dir) / "covers").mkdir(parents=True)
+    cache = Path(args.cache_dir) if args.cache_dir else Path(data_dir) / "cache"
+    cache.mkdir(parents=True, exist_ok=True)
+    source = cache / f"bench_{albums}_{args.seed}.db"
+    if not source.exists():
+        print(f"Generating a {args.size} collection...", file=sys.stderr)
+        counts = build_database(source, albums, args.seed)
+        (cache / f"bench_{albums}_{args.seed}.json").write_text(json.dumps(counts))
+    shutil.copy(source, Path(data_dir) / "discvault.db")
+
+    releases = list(musicbrainz_releases(args.releases, args.seed))
+    ctx = Context(albums, releases, "")
+    mix = {name: weight for name, weight in args.mix.items() if weight > 0}
+
+    try:
+        with MusicBrainzStub(releases, args.mb_latency_ms, args.mb_jitter_ms) as stub:
+            ctx.stub_url = stub.url
+            port = args.port or _free_port()
+            env = {"MUSICBRAINZ_API": f"{stub.url}/ws/2", "COVER_ART_ARCHIVE": stub.url,
+                   "DISCVAULT_MB_RATE": str(args.mb_rate), "DISCVAULT_MB_OFFLINE": "0"}
+            server = start_server(data_dir, port, args.workers, env, Path(data_dir) / "server.log")
+            base_url = f"http://127.0.0.1:{port}"
+            try:
+                print(f"Running {args.users} users for {args.duration:g} s (+{args.warmup:g} s warmup) against {base_url}",
+                      file=sys.stderr)
+                stats, elapsed = asyncio.run(drive(base_url, ctx, args.users, args.duration, args.warmup, mix,
+                                                   args.think_ms, args.seed, args.timeout))
+                health = httpx.get(f"{base_url}/health", timeout=10).json()
+            finally:
+                stop_server(server)
+            server_log = (Path(data_dir) / "server.log").read_text(errors="replace")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    results = {label: s.summary(elapsed) for label, s in stats.items()}
+    combined = EndpointStats()
+    for s in stats.values():
+        combined.timings_ms.extend(s.timings_ms)
+        combined.errors += s.errors
+        combined.statuses.update(s.statuses)
+    total = combined.summary(elapsed) if combined.timings_ms else {}
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "size": args.size, "seed": args.seed, "users": args.users, "workers": args.workers,
+            "duration_s": round(elapsed, 2), "warmup_s": args.warmup, "think_ms": args.think_ms, "mix": mix,
+            "mb_latency_ms": args.mb_latency_ms, "mb_jitter_ms": args.mb_jitter_ms, "mb_rate": args.mb_rate,
+        },
+        "total": total,
+        "endpoints": results,
+        "stub": {"responses": dict(stub.responses)},
+        "server": {"event_loop": health.get("event_loop"), "log_errors": server_log.count("Traceback")},
+    }
+
+def _mix(values: List[str]) -> Dict[str, float]:
+    mix = {name: 0.0 for name in WORKLOADS}
+    for value in values:
+        name, _, weight = value.partition("=")
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"Unknown workload {name!r}; choose from {', '.join(WORKLOADS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="DiscVault load test")
+    parser.add_argument("--size", default="1k", help="Collection size, e.g. 1k 10k 100k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache-dir", help="Keep generated databases here between runs (shared with the benchmark)")
+    parser.add_argument("--users", type=int, default=16, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a user's requests")
+    parser.add_argument("--mix", nargs="+", metavar="WORKLOAD=WEIGHT",
+                        help=f"Workload weights; unlisted ones are off (default: "
+                             f"{' '.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())})")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, help="Port for the server (default: any free one)")
+    parser.add_argument("--timeout", type=float, default=60, help="Client timeout per request in seconds")
+    parser.add_argument("--releases", type=int, default=5000, help="Releases the MusicBrainz stub knows")
+    parser.add_argument("--mb-latency-ms", type=float, default=150, help="Stub response latency")
+    parser.add_argument("--mb-jitter-ms", type=float, default=100, help="Random extra stub latency, up to this much")
+    parser.add_argument("--mb-rate", type=float, default=0,
+                        help="Server-side MusicBrainz requests per second (DISCVAULT_MB_RATE); 0 disables the spacing")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--max-error-rate", type=float, help="Exit 1 if the overall error rate is above this")
+    args = parser.parse_args(argv)
+    try:
+        args.mix = _mix(args.mix) if args.mix else dict(DEFAULT_MIX)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    report = run(args)
+    if not report["total"]:
+        print("No requests completed", file=sys.stderr)
+        return 1
+    report_table(report["endpoints"], report["total"])
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if args.max_error_rate is not None and report["total"]["error_rate"] > args.max_error_rate:
+        print(f"\nError rate {report['total']['error_rate']:.2%} is above {args.max_error_rate:.2%}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
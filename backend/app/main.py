@@ -1,51 +1,27 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Query, BackgroundTasks, Body, Form
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Query, BackgroundTasks, Body, Form, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-from sqlmodel import Session, select, text, func
+from sqlmodel import Session, select
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from typing import Dict, List, Optional
+import asyncio
+import json
 import os
 import shutil
 from pathlib import Path
-import zipfile
 import tempfile
-import json
-from datetime import datetime
-from fastapi.responses import FileResponse
-
-from .database import create_db_and_tables, get_session, engine
-from .models import Album, Artist, Tag, Location, AlbumRead, AlbumCreate, AlbumUpdate, AlbumArtistLink, AlbumTagLink, AlbumGenreLink, Genre, GenreRead, TagRead
-from . import crud, services, utils
+from datetime import datetime, timedelta
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+
+from .database import create_db_and_tables, data_dir, get_session, engine, init_fts, optimize_fts, reclaim_space, run_blocking, run_in_session
+from .writer import run_in_writer, writer
+from .monitoring import loop_monitor, registry, instrument_engine, MetricsMiddleware
+from .models import Album, Artist, Tag, Location, AlbumRead, AlbumCreate, AlbumUpdate, Genre, GenreRead, TagRead, MergeRequest, AlbumSelection, AlbumBulkUpdate, CleanupRequest, TocRequest, CueImportRequest
+from . import backup, catalogue, changes, coverhash, crud, discid, events, exports, facets, mbstore, placeholders, scan, services, suggest, tracklist, utils
+from .covers import COVERS_DIR, cover_stored, external_covers, pull_external_cover, remove_cover_files
 from pydantic import BaseModel
 
-def init_fts(session: Session):
-    # Create FTS5 virtual table for albums if it doesn't exist
-    session.exec(text("CREATE VIRTUAL TABLE IF NOT EXISTS album_search USING fts5(title, notes, content='albums', content_rowid='id');"))
-    
-    # Triggers to keep FTS index in sync
-    session.exec(text("""
-    CREATE TRIGGER IF NOT EXISTS album_ai AFTER INSERT ON albums BEGIN
-      INSERT INTO album_search(rowid, title, notes) VALUES (new.id, new.title, new.notes);
-    END;
-    """))
-    session.exec(text("""
-    CREATE TRIGGER IF NOT EXISTS album_ad AFTER DELETE ON albums BEGIN
-      INSERT INTO album_search(album_search, rowid, title, notes) VALUES('delete', old.id, old.title, old.notes);
-    END;
-    """))
-    session.exec(text("""
-    CREATE TRIGGER IF NOT EXISTS album_au AFTER UPDATE ON albums BEGIN
-      INSERT INTO album_search(album_search, rowid, title, notes) VALUES('delete', old.id, old.title, old.notes);
-      INSERT INTO album_search(rowid, title, notes) VALUES (new.id, new.title, new.notes);
-    END;
-    """))
-    
-    # Force rebuild of the FTS index to ensure existing data is indexed (Good for dev/small dbs)
-    session.exec(text("INSERT INTO album_search(album_search) VALUES('rebuild');"))
-    
-    session.commit()
-
 def seed_data(session: Session):
     # Ensure 'Favoriet' tag exists
     fav_tag = session.exec(select(Tag).where(Tag.name == "Favoriet")).first()
@@ -53,39 +29,121 @@ def seed_data(session: Session):
         session.add(Tag(name="Favoriet", color="#ef4444")) # Red color
         session.commit()
 
-default_data_dir = Path(__file__).parent.parent.parent / "data"
-data_dir = os.getenv("DATA_DIR", str(default_data_dir))
-COVERS_DIR = Path(data_dir) / "covers"
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     COVERS_DIR.mkdir(exist_ok=True)
     create_db_and_tables()
     with Session(engine) as session:
         init_fts(session)
+        changes.init_change_log(session)
         seed_data(session)
+        crud.backfill_album_keys(session)
+        crud.backfill_durations(session)
+        crud.notify_collection_replaced(session)
+    events.bus.bind(asyncio.get_running_loop())
+    loop_monitor.start()
     yield
+    await loop_monitor.stop()
+    # Commit whatever edits are still queued before the process exits
+    await run_blocking(writer.close)
 
-async def pull_external_cover(album_id: int, url: str):
-    """
-    Background task to download an external cover and update the album record.
-    """
-    if not url or not url.startswith("http"):
-        return
-        
-    # Determine extension from URL or default to .jpg
-    ext = os.path.splitext(url.split("?")[0])[1] or ".jpg"
-    if ext.lower() not in [".jpg", ".jpeg", ".png", ".webp"]:
-        ext = ".jpg" # Default fallback
-        
-    dest_path = COVERS_DIR / f"album_{album_id}{ext}"
-    
-    filename = await utils.download_image(url, dest_path)
-    if filename:
-        local_url = f"/covers/{filename}"
-        with Session(engine) as session:
-            # We use crud.update_album to ensure any logic there (like FTS triggers) is respected
-            crud.update_album(session, album_id, AlbumUpdate(cover_url=local_url))
+async def pull_covers_job(albums: List, job: events.Job):
+    # One job for a whole maintenance run, so clients can show progress instead of polling
+    try:
+        for album_id, cover_url in albums:
+            pulled = await pull_external_cover(album_id, cover_url)
+            job.advance(failed=not pulled)
+    except Exception as e:
+        job.finish(error=str(e))
+        raise
+    job.finish()
+
+async def hash_covers_job(pending: List, job: events.Job):
+    # Decoding and hashing run in a process pool; this thread only stores the results per batch
+    def progress(hashed: int, failed: int):
+        job.advance(hashed)
+        if failed:
+            job.advance(failed, failed=True)
+    try:
+        result = await run_blocking(coverhash.hash_covers, pending, None, progress)
+    except Exception as e:
+        job.finish(error=str(e))
+        raise
+    job.finish(result=result)
+
+async def cover_placeholders_job(pending: List, job: events.Job):
+    # Same split as hash_covers_job: workers decode and encode, this thread stores per batch
+    def progress(encoded: int, failed: int):
+        job.advance(encoded)
+        if failed:
+            job.advance(failed, failed=True)
+    try:
+        result = await run_blocking(placeholders.compute_placeholders, pending, None, progress)
+    except Exception as e:
+        job.finish(error=str(e))
+        raise
+    job.finish(result=result)
+
+async def purge_archived_job(album_ids: List[int], job: events.Job):
+    # Deletes in batches so other writers get the database in between, then gives the space back
+    covers = 0
+    try:
+        for i in range(0, len(album_ids), crud.PURGE_BATCH):
+            deleted = await run_in_session(crud.delete_albums, album_ids[i:i + crud.PURGE_BATCH])
+            covers += await run_blocking(remove_cover_files, [url for _, url in deleted])
+            job.advance(len(deleted))
+        await run_in_session(optimize_fts)
+        space = await run_blocking(reclaim_space)
+    except Exception as e:
+        job.finish(error=str(e))
+        raise
+    job.finish(result={"albums": job.done, "covers": covers, **space})
+
+# Counts from the last duplicate report job, served with /reports/stats (None until one ran)
+duplicate_report: Dict = {"duplicate_albums": None, **{f"duplicate_{kind}": None for kind in crud.MERGE_KINDS},
+                          "duplicates_checked_at": None}
+
+async def duplicate_report_job(job: events.Job):
+    try:
+        counts = await run_in_session(crud.count_duplicates)
+    except Exception as e:
+        job.finish(error=str(e))
+        raise
+    duplicate_report.update(counts, duplicates_checked_at=datetime.utcnow().isoformat())
+    job.finish(result=counts)
+
+def _update_album_fields(session: Session, album_id: int, album_update: AlbumUpdate) -> bool:
+    # Runs on the writer; returns only a flag so no ORM state leaks out of the session
+    return crud.update_album(session, album_id, album_update) is not None
+
+def _write_plain(session: Session, fn, *args):
+    # Runs on the writer; returns plain data so no ORM state leaks out of the session
+    result = fn(session, *args)
+    return result.model_dump() if result is not None else None
+
+def _update_album_read(session: Session, album_id: int, album_update: AlbumUpdate) -> Optional[AlbumRead]:
+    updated_album = crud.update_album(session, album_id, album_update)
+    # Serialise while the session is still open so relationships can load
+    return AlbumRead.model_validate(updated_album) if updated_album else None
+
+def _set_album_archived(session: Session, album_id: int, archived: bool) -> Optional[AlbumRead]:
+    if not crud.get_album(session, album_id):
+        return None
+    crud.set_albums_archived(session, [album_id], archived=archived)
+    return AlbumRead.model_validate(crud.get_album(session, album_id))
+
+def _create_genre(session: Session, genre: Genre) -> dict:
+    session.add(genre)
+    session.commit()
+    session.refresh(genre)
+    return genre.model_dump()
+
+def _link_artist(session: Session, album_id: int, artist_id: int, role: str):
+    # Check if exist (basic check)
+    if not crud.get_album(session, album_id):
+        return None
+    # In a real app check for artist too and duplicates
+    return crud.add_artist_to_album(session=session, album_id=album_id, artist_id=artist_id, role=role).model_dump()
 
 app = FastAPI(title="DiscVault API", lifespan=lifespan)
 
@@ -98,6 +156,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency and SQL profiling; exposed on /metrics
+instrument_engine(engine)
+app.add_middleware(MetricsMiddleware)
+
+# Keep the in-memory facet index in step with every committed write
+crud.add_change_listener(facets.index.on_change)
+crud.add_change_listener(suggest.index.on_change)
+# ...and push every change to connected clients
+crud.add_change_listener(events.bus.on_change)
+if catalogue.CATALOGUE_ENABLED:
+    crud.add_change_listener(catalogue.index.on_change)
+
 app.mount("/covers", StaticFiles(directory=COVERS_DIR), name="covers")
 
 @app.get("/")
@@ -106,7 +176,41 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "event_loop": loop_monitor.snapshot(), "catalogue": catalogue.index.memory_stats()}
+
+@app.get("/events")
+async def event_stream(types: Optional[str] = None, last_event_id: Optional[int] = Header(None)):
+    """
+    Server-sent events: "change" (kind and ids of every committed write), "job" (background
+    job progress) and "resync" (missed events; reload or catch up via /changes). Filter with
+    types=change,job. Reconnecting EventSources resume from their Last-Event-ID.
+    """
+    wanted = {t.strip() for t in types.split(",") if t.strip()} if types else None
+    subscriber = events.bus.subscribe(wanted, last_event_id)
+    return StreamingResponse(
+        events.stream(subscriber),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops the nginx proxy from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/jobs")
+def read_jobs():
+    return events.jobs.list()
+
+@app.get("/jobs/{job_id}")
+def read_job(job_id: int):
+    job = events.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """
+    Prometheus text exposition of request, SQL, cache and MusicBrainz metrics.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/stats")
 def read_stats(session: Session = Depends(get_session)):
@@ -114,7 +218,22 @@ def read_stats(session: Session = Depends(get_session)):
 
 @app.get("/reports/stats")
 def read_report_stats(session: Session = Depends(get_session)):
-    return crud.get_report_stats(session)
+    # Duplicate counts come from the last report job (POST /reports/duplicates)
+    return {**crud.get_report_stats(session), **duplicate_report}
+
+@app.post("/reports/duplicates")
+async def run_duplicate_report(background_tasks: BackgroundTasks):
+    """
+    Group every album, artist, genre and tag by normalised keys in a background job. The
+    counts show up in /reports/stats, the groups in /reports/details/duplicate_*.
+    """
+    job = events.jobs.start("duplicate-report")
+    background_tasks.add_task(duplicate_report_job, job)
+    return {"message": "Looking for duplicates.", "job_id": job.id}
+
+@app.get("/reports/runtime")
+def read_runtime_stats(session: Session = Depends(get_session)):
+    return crud.get_runtime_stats(session)
 
 @app.get("/reports/details/{report_type}")
 def read_report_details(report_type: str, session: Session = Depends(get_session)):
@@ -122,6 +241,25 @@ def read_report_details(report_type: str, session: Session = Depends(get_session
     # Ensure Albums are validated against AlbumRead to include loaded relationships (artists)
     return [AlbumRead.model_validate(i) if isinstance(i, Album) else i for i in items]
 
+@app.post("/merge/{kind}")
+async def merge_duplicates(kind: str, merge: MergeRequest):
+    """
+    Merge duplicates (see the duplicate_* reports) into one target in a single transaction.
+    kind is one of: albums, artists, genres, tags.
+    """
+    if kind == "albums":
+        merged = await run_in_writer(crud.merge_albums, merge.target_id, merge.source_ids)
+        if merged is not None:
+            merged, unused_covers = merged
+            await run_blocking(remove_cover_files, unused_covers)
+    elif kind in crud.MERGE_KINDS:
+        merged = await run_in_writer(crud.merge_metadata, kind, merge.target_id, merge.source_ids)
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown merge type: {kind}")
+    if merged is None:
+        raise HTTPException(status_code=404, detail="Merge target not found")
+    return {"ok": True, "target_id": merge.target_id, "merged": merged}
+
 @app.get("/reports/distribution/{dist_type}")
 def read_distribution(dist_type: str, session: Session = Depends(get_session)):
     if dist_type == "genres":
@@ -130,6 +268,26 @@ def read_distribution(dist_type: str, session: Session = Depends(get_session)):
         return crud.get_tag_distribution(session)
     return []
 
+@app.get("/reports/cover-duplicates")
+def get_cover_duplicates(
+    max_distance: int = Query(coverhash.DUPLICATE_DISTANCE, ge=0, le=coverhash.MAX_DUPLICATE_DISTANCE),
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session)
+):
+    """
+    Groups of albums sharing (nearly) the same cover art, e.g. several pressings with one scan.
+    """
+    return coverhash.duplicate_groups(session, max_distance, limit)
+
+@app.get("/changes")
+def read_changes(since: Optional[str] = None, limit: int = Query(500, ge=1, le=2000), session: Session = Depends(get_session)):
+    """
+    Delta sync: albums, artists, genres, tags and locations created, updated or deleted
+    after the since token. Call without a token to get the current one (reset=true), load
+    the full lists, then poll with the returned token; keep calling while more=true.
+    """
+    return changes.get_changes(session, since, limit)
+
 @app.get("/constants")
 def read_constants():
     return {
@@ -145,129 +303,140 @@ def search_albums(
     status: Optional[str] = None,
     session: Session = Depends(get_session)
 ):
-    q_lower = q.lower().strip()
-    
-    is_exact = False
-    if q_lower.startswith('"') and q_lower.endswith('"') and len(q_lower) > 1:
-        is_exact = True
-        q_lower = q_lower[1:-1].strip()
-    
-    results = []
-    
-    # helper for AND logic on tags/genres
-    def search_with_logic(model, link_model, attr_name):
-        nonlocal results
-        # Check for AND/OR
-        if " and " in q_lower and not is_exact:
-            terms = [t.strip() for t in q_lower.split(" and ") if t.strip()]
-            if not terms: return
-            
-            # For AND, we need albums that have ALL terms. 
-            # We find IDs that match each term and then intersect.
-            id_sets = []
-            for term in terms:
-                stmt = select(Album.id).join(link_model).join(model).where(func.lower(getattr(model, attr_name)).contains(term))
-                id_sets.append(set(session.exec(stmt).all()))
-            
-            if not id_sets: return
-            matching_ids = set.intersection(*id_sets)
-            if matching_ids:
-                results += session.exec(select(Album).where(Album.id.in_(list(matching_ids)))).all()
-        
-        elif " or " in q_lower and not is_exact:
-            terms = [t.strip() for t in q_lower.split(" or ") if t.strip()]
-            if not terms: return
-            
-            # For OR, any term matches.
-            from sqlmodel import or_
-            stmt = select(Album).join(link_model).join(model).where(
-                or_(*[func.lower(getattr(model, attr_name)).contains(term) for term in terms])
-            )
-            results += session.exec(stmt).all()
-        else:
-            # Standard single term search
-            if is_exact:
-                results += session.exec(select(Album).join(link_model).join(model).where(func.lower(getattr(model, attr_name)) == q_lower)).all()
-            else:
-                results += session.exec(select(Album).join(link_model).join(model).where(func.lower(getattr(model, attr_name)).contains(q_lower))).all()
-
-    # 1. Search by Title
-    if filter in ["all", "title"]:
-        if is_exact:
-            results += session.exec(select(Album).where(func.lower(Album.title) == q_lower)).all()
-        else:
-            results += session.exec(select(Album).where(func.lower(Album.title).contains(q_lower))).all()
-    
-    # 2. Search by Artist Name
-    if filter in ["all", "artist"]:
-        # We can also support AND/OR for artists if we want, but requirements specifically mentioned genres/tags
-        if is_exact:
-            results += session.exec(select(Album).join(AlbumArtistLink).join(Artist).where(func.lower(Artist.name) == q_lower)).all()
-        else:
-            results += session.exec(select(Album).join(AlbumArtistLink).join(Artist).where(func.lower(Artist.name).contains(q_lower))).all()
-    
-    # 3. Search by Notes
-    if filter == "all":
-        if is_exact:
-            results += session.exec(select(Album).where(func.lower(Album.notes) == q_lower)).all()
-        else:
-            results += session.exec(select(Album).where(func.lower(Album.notes).contains(q_lower))).all()
-
-    # 4. Search by Genre
-    if filter in ["all", "genre"]:
-        search_with_logic(Genre, AlbumGenreLink, "name")
-
-    # 5. Search by Tag
-    if filter in ["all", "tag"]:
-        search_with_logic(Tag, AlbumTagLink, "name")
-        
-    # 6. Search by Track Title
-    if filter in ["all", "track"]:
-        # Join Tracks and filter by title
-        from .models import Track
-        if is_exact:
-            results += session.exec(select(Album).join(Track).where(func.lower(Track.title) == q_lower)).all()
-        else:
-            results += session.exec(select(Album).join(Track).where(func.lower(Track.title).contains(q_lower))).all()
-
-    # 7. Search by Media Type
-    if filter in ["all", "media_type"]:
-        if is_exact:
-            results += session.exec(select(Album).where(func.lower(Album.media_type) == q_lower)).all()
-        else:
-            results += session.exec(select(Album).where(func.lower(Album.media_type).contains(q_lower))).all()
-
-    # Combine and Deduplicate (by ID)
-    seen_ids = set()
-    deduped_ids = []
-    for album in results:
-        if album.id not in seen_ids:
-            deduped_ids.append(album.id)
-            seen_ids.add(album.id)
-    
-    if not deduped_ids:
+    album_ids = crud.search_album_ids(session, q, filter)
+    if not album_ids:
         return []
 
     # Final query to get full objects with relations and APPLY SORTING
     # Also filter by status here if provided
-    return crud.get_albums(session, offset=0, limit=1000, sort_by=sort_by, order=order, album_ids=deduped_ids, status=status)
+    return crud.get_albums(session, offset=0, limit=1000, sort_by=sort_by, order=order, album_ids=album_ids, status=status)
+
+@app.get("/search/facets")
+def search_facets(
+    q: Optional[str] = None,
+    filter: str = "all",
+    genre: List[int] = Query([]),
+    tag: List[int] = Query([]),
+    media_type: List[str] = Query([]),
+    decade: List[int] = Query([]),
+    location: List[int] = Query([]),
+    status: List[str] = Query([]),
+    session: Session = Depends(get_session)
+):
+    """
+    Faceted drill-down: the ids of matching albums plus counts per genre, tag, media type,
+    decade, location and status. Repeat a parameter to OR values within a facet; different
+    facets are AND-ed. Without q the whole collection is faceted.
+    """
+    candidates = crud.search_album_ids(session, q, filter) if q and q.strip() else None
+    selected = {"genres": genre, "tags": tag, "media_type": media_type, "decade": decade, "location": location, "status": status}
+    return facets.facet_search(session, candidates, selected)
+
+@app.get("/suggest")
+def suggest_names(
+    q: str = "",
+    kind: List[str] = Query(["artists"]),
+    limit: int = Query(10, ge=1, le=suggest.MAX_LIMIT),
+    session: Session = Depends(get_session)
+):
+    """
+    Typeahead for artist, genre and tag names: names with a word starting with q
+    (accents, case and punctuation ignored), most used first. Repeat kind for several
+    lists in one call; an empty q returns the most used names.
+    """
+    unknown = [k for k in kind if k not in suggest.KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown kind: {', '.join(unknown)}")
+    return {k: suggest.index.suggest(session, k, q, limit) for k in kind}
+
+@app.post("/search/cover")
+async def search_by_cover(
+    file: UploadFile = File(...),
+    max_distance: int = Query(12, ge=0, le=coverhash.MAX_DISTANCE),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Find albums by a photo or scan of their sleeve: the closest stored covers by perceptual
+    hash (Hamming distance of the 64-bit pHash). Needs the optional Pillow and NumPy packages.
+    """
+    if not coverhash.available():
+        raise HTTPException(status_code=501, detail="Cover search requires the optional Pillow and NumPy packages")
+    try:
+        _, phash = await run_blocking(coverhash.hash_image, file.file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"phash": f"{phash:016x}", "matches": await run_in_session(coverhash.nearest, phash, max_distance, limit)}
 
 # --- Album Endpoints ---
 @app.post("/albums/", response_model=Album)
-def create_album(album: AlbumCreate, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
-    db_album = crud.create_album(session=session, album_create=album)
-    if db_album.cover_url and db_album.cover_url.startswith("http"):
-        background_tasks.add_task(pull_external_cover, db_album.id, db_album.cover_url)
+async def create_album(album: AlbumCreate, background_tasks: BackgroundTasks):
+    # Interactive edits go through the group-commit writer: concurrent ones share one COMMIT
+    db_album = await run_in_writer(_write_plain, crud.create_album, album)
+    if db_album["cover_url"] and db_album["cover_url"].startswith("http"):
+        background_tasks.add_task(pull_external_cover, db_album["id"], db_album["cover_url"])
     return db_album
 
+def _selected_album_ids(session: Session, selection: AlbumSelection) -> List[int]:
+    if selection.album_ids is None and not (selection.q and selection.q.strip()):
+        raise HTTPException(status_code=400, detail="Provide album_ids or a search query")
+    return crud.resolve_bulk_selection(session, selection)
+
+@app.patch("/albums/bulk")
+async def bulk_update_albums(bulk: AlbumBulkUpdate):
+    """
+    Edit many albums at once: add/remove tags, genres and artists, set location_id or status.
+    Select albums with album_ids, or with q/filter as in /search (optionally match_status).
+    """
+    if bulk.status is not None and bulk.status not in ("collection", "wishlist"):
+        raise HTTPException(status_code=400, detail=f"Unknown status: {bulk.status}")
+    if bulk.location_id is not None and not await run_in_session(crud.get_location, bulk.location_id):
+        raise HTTPException(status_code=404, detail="Location not found")
+    # The selection is a read and stays off the writer; only the edit itself goes through it
+    album_ids = await run_in_session(_selected_album_ids, bulk)
+    updated = await run_in_writer(crud.bulk_update_albums, album_ids, bulk)
+    return {"ok": True, "matched": len(album_ids), "updated": updated}
+
+@app.post("/albums/bulk/archive")
+async def bulk_archive_albums(selection: AlbumSelection):
+    """
+    Archive many albums: they keep their data but leave listings, search, stats and reports.
+    """
+    album_ids = await run_in_session(_selected_album_ids, selection)
+    archived = await run_in_writer(crud.set_albums_archived, album_ids, archived=True)
+    return {"ok": True, "matched": len(album_ids), "archived": len(archived)}
+
+@app.post("/albums/bulk/restore")
+async def bulk_restore_albums(selection: AlbumSelection):
+    # Search never finds archived albums, so restoring takes explicit ids
+    if selection.album_ids is None:
+        raise HTTPException(status_code=400, detail="Provide album_ids")
+    restored = await run_in_writer(crud.set_albums_archived, selection.album_ids, archived=False)
+    return {"ok": True, "matched": len(selection.album_ids), "restored": len(restored)}
+
+@app.post("/albums/bulk/delete")
+async def bulk_delete_albums(selection: AlbumSelection):
+    """
+    Delete many albums permanently, with their tracks, links and stored covers.
+    """
+    album_ids = await run_in_session(_selected_album_ids, selection)
+    deleted = await run_in_writer(crud.delete_albums, album_ids)
+    covers = await run_blocking(remove_cover_files, [url for _, url in deleted])
+    return {"ok": True, "matched": len(album_ids), "deleted": len(deleted), "covers_removed": covers}
+
+@app.get("/albums/archived", response_model=List[AlbumRead])
+def read_archived_albums(offset: int = 0, limit: int = 100, session: Session = Depends(get_session)):
+    # Most recently archived first
+    return crud.get_archived_albums(session, offset=offset, limit=limit)
+
 @app.get("/albums/check-duplicate", response_model=List[AlbumRead])
 def check_duplicate(
     title: str, 
     artist_names: List[str] = Query([]), 
     upc_ean: Optional[str] = None, 
+    fuzzy: bool = False,
     session: Session = Depends(get_session)
 ):
-    return crud.check_duplicate_album(session, title=title, artist_names=artist_names, upc_ean=upc_ean)
+    return crud.check_duplicate_album(session, title=title, artist_names=artist_names, upc_ean=upc_ean, fuzzy=fuzzy)
 
 @app.get("/albums/", response_model=List[AlbumRead])
 def read_albums(
@@ -287,9 +456,57 @@ def read_album(album_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Album not found")
     return album
 
+@app.post("/albums/{album_id}/archive", response_model=AlbumRead)
+async def archive_album(album_id: int):
+    album = await run_in_writer(_set_album_archived, album_id, True)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return album
+
+@app.post("/albums/{album_id}/restore", response_model=AlbumRead)
+async def restore_album(album_id: int):
+    album = await run_in_writer(_set_album_archived, album_id, False)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return album
+
+@app.delete("/albums/{album_id}")
+async def delete_album(album_id: int):
+    deleted = await run_in_writer(crud.delete_albums, [album_id])
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Album not found")
+    await run_blocking(remove_cover_files, [url for _, url in deleted])
+    return {"ok": True}
+
+@app.get("/albums/{album_id}/runtime")
+def read_album_runtime(album_id: int, session: Session = Depends(get_session)):
+    """
+    Total runtime of an album and per disc, from the normalised track durations.
+    """
+    runtime = crud.get_album_runtime(session, album_id)
+    if runtime is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return runtime
+
+@app.get("/albums/{album_id}/similar-covers")
+def get_similar_covers(
+    album_id: int,
+    max_distance: int = Query(10, ge=0, le=coverhash.MAX_DISTANCE),
+    limit: int = Query(10, ge=1, le=50),
+    session: Session = Depends(get_session)
+):
+    """
+    Other albums with (nearly) the same artwork, closest first. Covers are hashed by
+    POST /maintenance/hash-covers and whenever a cover is uploaded or pulled.
+    """
+    phash = coverhash.album_hash(session, album_id)
+    if phash is None:
+        raise HTTPException(status_code=404, detail="No hash for this album's cover")
+    return coverhash.nearest(session, phash, max_distance, limit, exclude=album_id)
+
 @app.put("/albums/{album_id}", response_model=AlbumRead)
-def update_album(album_id: int, album_update: AlbumUpdate, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
-    updated_album = crud.update_album(session=session, album_id=album_id, album_update=album_update)
+async def update_album(album_id: int, album_update: AlbumUpdate, background_tasks: BackgroundTasks):
+    updated_album = await run_in_writer(_update_album_read, album_id, album_update)
     if not updated_album:
         raise HTTPException(status_code=404, detail="Album not found")
     
@@ -300,81 +517,78 @@ def update_album(album_id: int, album_update: AlbumUpdate, background_tasks: Bac
 
 # --- Artist Endpoints ---
 @app.post("/artists/", response_model=Artist)
-def create_artist(artist: Artist, session: Session = Depends(get_session)):
-    return crud.create_artist(session=session, artist=artist)
+async def create_artist(artist: Artist):
+    return await run_in_writer(_write_plain, crud.create_artist, artist)
 
 @app.get("/artists/", response_model=List[Artist])
 def read_artists(session: Session = Depends(get_session)):
     return crud.get_artists(session=session)
 
 @app.delete("/artists/{artist_id}")
-def delete_artist(artist_id: int, session: Session = Depends(get_session)):
-    success = crud.delete_artist(session=session, artist_id=artist_id)
+async def delete_artist(artist_id: int):
+    success = await run_in_writer(crud.delete_artist, artist_id)
     if not success:
         raise HTTPException(status_code=404, detail="Artist not found")
     return {"ok": True}
 
 # --- Tag Endpoints ---
 @app.post("/tags/", response_model=Tag)
-def create_tag(tag: Tag, session: Session = Depends(get_session)):
-    return crud.create_tag(session=session, tag=tag)
+async def create_tag(tag: Tag):
+    return await run_in_writer(_write_plain, crud.create_tag, tag)
 
 @app.get("/tags/", response_model=List[TagRead])
 def read_tags(session: Session = Depends(get_session)):
     return crud.get_tags(session=session)
 
 @app.put("/tags/{tag_id}", response_model=Tag)
-def update_tag(tag_id: int, tag: Tag, session: Session = Depends(get_session)):
-    updated_tag = crud.update_tag(session=session, tag_id=tag_id, tag_data=tag)
+async def update_tag(tag_id: int, tag: Tag):
+    updated_tag = await run_in_writer(_write_plain, crud.update_tag, tag_id, tag)
     if not updated_tag:
         raise HTTPException(status_code=404, detail="Tag not found")
     return updated_tag
 
 @app.delete("/tags/{tag_id}")
-def delete_tag(tag_id: int, session: Session = Depends(get_session)):
-    success = crud.delete_tag(session=session, tag_id=tag_id)
+async def delete_tag(tag_id: int):
+    success = await run_in_writer(crud.delete_tag, tag_id)
     if not success:
         raise HTTPException(status_code=404, detail="Tag not found")
     return {"ok": True}
 
 # --- Genre Endpoints ---
 @app.post("/genres/", response_model=Genre)
-def create_genre(genre: Genre, session: Session = Depends(get_session)):
-    session.add(genre)
-    session.commit()
-    session.refresh(genre)
-    return genre
+async def create_genre(genre: Genre):
+    return await run_in_writer(_create_genre, genre)
 
 @app.get("/genres/", response_model=List[GenreRead])
 def read_genres(session: Session = Depends(get_session)):
     return crud.get_genres(session=session)
 
 @app.put("/genres/{genre_id}", response_model=Genre)
-def update_genre(genre_id: int, genre: Genre, session: Session = Depends(get_session)):
-    updated_genre = crud.update_genre(session=session, genre_id=genre_id, genre_data=genre)
+async def update_genre(genre_id: int, genre: Genre):
+    updated_genre = await run_in_writer(_write_plain, crud.update_genre, genre_id, genre)
     if not updated_genre:
         raise HTTPException(status_code=404, detail="Genre not found")
     return updated_genre
 
 @app.delete("/genres/{genre_id}")
-def delete_genre(genre_id: int, session: Session = Depends(get_session)):
-    success = crud.delete_genre(session=session, genre_id=genre_id)
+async def delete_genre(genre_id: int):
+    success = await run_in_writer(crud.delete_genre, genre_id)
     if not success:
         raise HTTPException(status_code=404, detail="Genre not found")
     return {"ok": True}
 
 # --- Location Endpoints ---
 @app.post("/locations/", response_model=Location)
-def create_location(location: Location, session: Session = Depends(get_session)):
-    return crud.create_location(session=session, location=location)
+async def create_location(location: Location):
+    return await run_in_writer(_write_plain, crud.create_location, location)
 
 @app.get("/locations/", response_model=List[Location])
 def read_locations(session: Session = Depends(get_session)):
     return crud.get_locations(session=session)
 
 @app.put("/locations/{location_id}", response_model=Location)
-def update_location(location_id: int, location: Location, session: Session = Depends(get_session)):
-    updated_location = crud.update_location(session=session, location_id=location_id, location_data=location)
+async def update_location(location_id: int, location: Location):
+    updated_location = await run_in_writer(_write_plain, crud.update_location, location_id, location)
     if not updated_location:
         raise HTTPException(status_code=404, detail="Location not found")
     return updated_location
@@ -387,9 +601,68 @@ async def lookup_barcode(barcode: str):
         raise HTTPException(status_code=404, detail="Barcode not found in MusicBrainz")
     return result
 
+@app.websocket("/ws/scan")
+async def scan_session(websocket: WebSocket):
+    """
+    Scan session: send barcodes (plain text or {"barcode": ...}) as they are scanned and
+    receive "scanned", "duplicates" and "lookup" messages per barcode as each becomes known,
+    matched up by seq. Send "done" to get a "done" summary once all lookups have finished.
+    """
+    await websocket.accept()
+    session = scan.ScanSession()
+    writer = asyncio.create_task(session.pump(websocket.send_json))
+    drains = set()
+    try:
+        while True:
+            message = scan.parse_message(await websocket.receive_text())
+            if message["type"] == "done":
+                task = asyncio.create_task(session.drain())
+                drains.add(task)
+                task.add_done_callback(drains.discard)
+            elif message["type"] == "error":
+                session.outbox.put_nowait(message)
+            else:
+                for barcode in message["barcodes"]:
+                    session.submit(barcode)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
+        for task in list(drains):
+            task.cancel()
+        writer.cancel()
+
+@app.get("/musicbrainz/store")
+def musicbrainz_store_stats():
+    return mbstore.store.stats()
+
+@app.get("/musicbrainz/store/lookup")
+def musicbrainz_store_lookup(barcode: Optional[str] = None, mbid: Optional[str] = None, catalog_no: Optional[str] = None):
+    """
+    Offline lookup by barcode, MBID or catalogue number in the local MusicBrainz store.
+    """
+    if not mbstore.store.available():
+        raise HTTPException(status_code=404, detail="No offline MusicBrainz store")
+    result = mbstore.store.by_barcode(barcode) or mbstore.store.by_mbid(mbid) or mbstore.store.by_catalog_no(catalog_no)
+    if not result:
+        raise HTTPException(status_code=404, detail="Release not found in offline store")
+    return result
+
+@app.post("/musicbrainz/store/import")
+async def musicbrainz_store_import(file: UploadFile = File(...)):
+    """
+    Adds releases from a MusicBrainz JSON dump (JSON lines or array) or a CSV subset.
+    """
+    try:
+        count = await run_blocking(mbstore.store.import_file, file.file)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable dump: {e}")
+    return {"imported": count, **await run_blocking(mbstore.store.stats)}
+
 @app.post("/albums/{album_id}/cover")
-async def upload_album_cover(album_id: int, file: UploadFile = File(...), session: Session = Depends(get_session)):
-    album = crud.get_album(session, album_id)
+async def upload_album_cover(album_id: int, file: UploadFile = File(...)):
+    # All database and disk work runs on the blocking executor, never on the event loop
+    album = await run_in_session(crud.get_album, album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
@@ -397,29 +670,20 @@ async def upload_album_cover(album_id: int, file: UploadFile = File(...), sessio
     file_extension = os.path.splitext(file.filename)[1]
     file_path = COVERS_DIR / f"album_{album_id}{file_extension}"
     
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await utils.save_upload_file(file, file_path)
     
     # Update DB
     cover_url = f"/covers/{file_path.name}"
-    crud.update_album(session, album_id, AlbumUpdate(cover_url=cover_url))
+    await run_in_writer(_update_album_fields, album_id, AlbumUpdate(cover_url=cover_url))
+    await cover_stored(album_id)
     
     return {"cover_url": cover_url}
 
-@app.post("/albums/{album_id}/sync", response_model=AlbumRead)
-async def sync_album_with_musicbrainz(album_id: int, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+def _sync_album_update(session: Session, album_id: int, mb_data: dict) -> Optional[AlbumRead]:
     db_album = crud.get_album(session, album_id)
     if not db_album:
-        raise HTTPException(status_code=404, detail="Album not found")
-    
-    if not db_album.upc_ean:
-        raise HTTPException(status_code=400, detail="Album has no barcode for syncing")
-    
-    # Fetch data from MusicBrainz
-    mb_data = await services.lookup_musicbrainz_by_barcode(db_album.upc_ean)
-    if not mb_data:
-        raise HTTPException(status_code=404, detail="Could not find album on MusicBrainz")
-    
+        return None
+
     # Prepare update
     # We prioritize MB data for tracks and genres, and potentially catalog_no/year if missing
     update_params = {
@@ -441,21 +705,36 @@ async def sync_album_with_musicbrainz(album_id: int, background_tasks: Backgroun
     # Use AlbumUpdate to validate (though crud.update_album does it too)
     album_update = AlbumUpdate(**{k: v for k, v in update_params.items() if v is not None})
     
-    updated_album = crud.update_album(session, album_id, album_update)
+    return _update_album_read(session, album_id, album_update)
+
+@app.post("/albums/{album_id}/sync", response_model=AlbumRead)
+async def sync_album_with_musicbrainz(album_id: int, background_tasks: BackgroundTasks):
+    db_album = await run_in_session(crud.get_album, album_id)
+    if not db_album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    
+    if not db_album.upc_ean:
+        raise HTTPException(status_code=400, detail="Album has no barcode for syncing")
+    
+    # Fetch data from MusicBrainz
+    mb_data = await services.lookup_musicbrainz_by_barcode(db_album.upc_ean)
+    if not mb_data:
+        raise HTTPException(status_code=404, detail="Could not find album on MusicBrainz")
+    
+    updated_album = await run_in_writer(_sync_album_update, album_id, mb_data)
+    if not updated_album:
+        raise HTTPException(status_code=404, detail="Album not found")
     if updated_album and updated_album.cover_url and updated_album.cover_url.startswith("http"):
         background_tasks.add_task(pull_external_cover, updated_album.id, updated_album.cover_url)
     return updated_album
 
 # --- Relationships ---
 @app.post("/albums/{album_id}/artists/{artist_id}")
-def link_artist_to_album(album_id: int, artist_id: int, role: str = "Main", session: Session = Depends(get_session)):
-    # Check if exist (basic check)
-    album = crud.get_album(session, album_id)
-    if not album:
-         raise HTTPException(status_code=404, detail="Album not found")
-    # In a real app check for artist too and duplicates
-    
-    return crud.add_artist_to_album(session=session, album_id=album_id, artist_id=artist_id, role=role)
+async def link_artist_to_album(album_id: int, artist_id: int, role: str = "Main"):
+    link = await run_in_writer(_link_artist, album_id, artist_id, role)
+    if link is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return link
 
 # --- Bulk Track Parsing ---
 @app.post("/tracks/parse")
@@ -464,37 +743,138 @@ async def parse_tracks(
     file: Optional[UploadFile] = File(None)
 ):
     """
-    Parse a tracklist from pasted text or a TXT file via FormData.
+    Parse a tracklist from pasted text or an uploaded TXT/CSV/cue file via FormData.
+    Multi-disc lists (disc headers such as "CD2", or "2-05" numbering) are supported.
     """
-    text_content = ""
-    
     if file:
-        content = await file.read()
-        text_content = content.decode('utf-8', errors='ignore')
+        # The upload is parsed line by line straight from its spooled file, off the event loop
+        body = await run_blocking(_parsed_json, tracklist.parse_tracklist, file.file)
     elif text:
-        text_content = text
+        if not text.strip():
+            raise HTTPException(status_code=400, detail="Inhoud is leeg.")
+        body = await run_blocking(_parsed_json, utils.parse_tracklist_csv, text)
     else:
         raise HTTPException(status_code=400, detail="Geen tekst of bestand ontvangen.")
-        
-    if not text_content.strip():
+
+    if body is None:
         raise HTTPException(status_code=400, detail="Inhoud is leeg.")
-        
-    parsed = utils.parse_tracklist_csv(text_content)
-    return parsed
+    return Response(body, media_type="application/json")
+
+def _parsed_json(parse, source) -> Optional[bytes]:
+    # Encoded here as well: FastAPI would serialise a box set's tracklist on the event loop
+    parsed = parse(source)
+    return json.dumps(parsed).encode() if parsed else None
+
+# --- Disc IDs & cue import (offline) ---
+IMPORT_ROOT = Path(os.getenv("DISCVAULT_IMPORT_ROOT", str(Path(data_dir) / "import")))
+
+@app.post("/discid/toc")
+def disc_id_from_toc(request: TocRequest):
+    """
+    MusicBrainz disc ID and track durations for a raw TOC ("first last leadout offsets...").
+    """
+    try:
+        toc = discid.parse_toc(request.toc)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return discid.describe_toc(toc)
+
+@app.post("/discid/cue")
+async def disc_id_from_cue(file: UploadFile = File(...), total_frames: Optional[int] = Form(None)):
+    """
+    Album fields, tracks and disc IDs from an uploaded cue sheet. The disc ID needs the length
+    of the audio image: pass total_frames (1/75 s) for single-file cue sheets.
+    """
+    # Read, decoded and parsed straight from the spooled upload, off the event loop
+    result = await run_blocking(_disc_ids_from_cue, file.file, total_frames)
+    if result is None:
+        raise HTTPException(status_code=400, detail="Geen tracks gevonden in cue sheet.")
+    return result
+
+def _disc_ids_from_cue(source, total_frames: Optional[int]) -> Optional[dict]:
+    sheet = tracklist.parse_cue(tracklist.open_text(source))
+    if not sheet["tracks"]:
+        return None
+    file_frames = {sheet["files"][-1]: total_frames} if total_frames and sheet["files"] else None
+    discs = discid.cue_discs(sheet, file_frames=file_frames)
+    return {"album": discid.album_from_cue(sheet, discs), "discs": discs}
+
+@app.post("/import/cue-directory")
+def import_cue_directory(request: CueImportRequest, session: Session = Depends(get_session)):
+    """
+    Creates an album for every cue sheet below DISCVAULT_IMPORT_ROOT/path, offline and in
+    batches. Already catalogued discs are skipped; dry_run only reports what would be created.
+    """
+    if request.status not in ("collection", "wishlist"):
+        raise HTTPException(status_code=400, detail=f"Unknown status: {request.status}")
+    root = IMPORT_ROOT.resolve()
+    target = (root / request.path).resolve()
+    if target != root and root not in target.parents:
+        raise HTTPException(status_code=400, detail="Path must lie inside the import directory")
+    if not target.is_dir():
+        raise HTTPException(status_code=404, detail="Import directory not found")
+    return discid.import_cue_directory(session, target, status=request.status, dry_run=request.dry_run)
 
 # --- Maintenance ---
 @app.post("/maintenance/pull-covers")
-async def maintenance_pull_covers(background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+async def maintenance_pull_covers(background_tasks: BackgroundTasks):
     """
     Scan all albums and pull external covers to local storage.
     """
-    # Find all albums where cover_url starts with http
-    albums = session.exec(select(Album).where(Album.cover_url.like("http%"))).all()
-    
-    for album in albums:
-        background_tasks.add_task(pull_external_cover, album.id, album.cover_url)
-        
-    return {"message": f"Queued {len(albums)} covers for background download."}
+    albums = await run_in_session(external_covers)
+    job = events.jobs.start("pull-covers", total=len(albums))
+    background_tasks.add_task(pull_covers_job, albums, job)
+    return {"message": f"Queued {len(albums)} covers for background download.", "job_id": job.id}
+
+@app.post("/maintenance/hash-covers")
+async def maintenance_hash_covers(background_tasks: BackgroundTasks, rehash: bool = False):
+    """
+    Compute perceptual hashes for every stored cover that has none yet (all with rehash),
+    in a background job using all cores. Needs the optional Pillow and NumPy packages.
+    """
+    if not coverhash.available():
+        raise HTTPException(status_code=501, detail="Cover hashing requires the optional Pillow and NumPy packages")
+    pending = await run_in_session(coverhash.pending_covers, rehash)
+    job = events.jobs.start("hash-covers", total=len(pending))
+    background_tasks.add_task(hash_covers_job, pending, job)
+    return {"message": f"Hashing {len(pending)} covers.", "job_id": job.id}
+
+@app.post("/maintenance/cover-placeholders")
+async def maintenance_cover_placeholders(background_tasks: BackgroundTasks, refresh: bool = False):
+    """
+    Compute the blurhash and dominant colour of every stored cover that has none yet (all
+    with refresh), in a background job using all cores. New covers get theirs when they are
+    uploaded or pulled. Needs the optional Pillow and NumPy packages.
+    """
+    if not placeholders.available():
+        raise HTTPException(status_code=501, detail="Cover placeholders require the optional Pillow and NumPy packages")
+    pending = await run_in_session(placeholders.pending_covers, refresh)
+    job = events.jobs.start("cover-placeholders", total=len(pending))
+    background_tasks.add_task(cover_placeholders_job, pending, job)
+    return {"message": f"Encoding {len(pending)} covers.", "job_id": job.id}
+
+@app.post("/maintenance/purge-archived")
+async def maintenance_purge_archived(background_tasks: BackgroundTasks, older_than_days: int = Query(30, ge=0)):
+    """
+    Permanently delete albums archived more than older_than_days ago, remove their covers
+    and return the freed space to the file system (incremental VACUUM).
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    album_ids = await run_in_session(crud.archived_album_ids, cutoff)
+    job = events.jobs.start("purge-archived", total=len(album_ids))
+    background_tasks.add_task(purge_archived_job, album_ids, job)
+    return {"message": f"Purging {len(album_ids)} archived albums.", "job_id": job.id}
+
+@app.post("/maintenance/cleanup/{kind}")
+async def maintenance_cleanup(kind: str, cleanup: CleanupRequest = Body(default_factory=CleanupRequest)):
+    """
+    Bulk-delete genres, tags or artists in one transaction.
+    Without ids every unused item (see the unused_* reports) is removed.
+    """
+    if kind not in crud.MERGE_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown cleanup type: {kind}")
+    deleted = await run_in_writer(crud.cleanup_metadata, kind, cleanup.ids)
+    return {"ok": True, "deleted": deleted}
 
 # --- Backup & Restore ---
 @app.get("/export")
@@ -506,46 +886,46 @@ def export_collection(background_tasks: BackgroundTasks, session: Session = Depe
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     zip_filename = f"discvault_backup_{timestamp}.zip"
     zip_path = os.path.join(temp_dir, zip_filename)
-    
-    from .database import sqlite_file_name
-    db_path = sqlite_file_name
-    
-    # 2. Create manifest
-    album_count = session.exec(select(func.count(Album.id))).one()
-    manifest = {
-        "version": "1.5.0",
-        "date": datetime.now().isoformat(),
-        "album_count": album_count
-    }
-    
-    try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Add DB
-            if os.path.exists(db_path):
-                zip_file.write(db_path, "discvault.db")
-            
-            # Add Covers
-            if os.path.exists(COVERS_DIR):
-                for root, dirs, files in os.walk(COVERS_DIR):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.join("covers", os.path.relpath(file_path, COVERS_DIR))
-                        zip_file.write(file_path, arcname)
-            
-            # Add manifest
-            manifest_path = os.path.join(temp_dir, "manifest.json")
-            with open(manifest_path, 'w') as f:
-                json.dump(manifest, f)
-            zip_file.write(manifest_path, "manifest.json")
 
+    try:
+        backup.write_backup(zip_path, session)
         background_tasks.add_task(lambda: shutil.rmtree(temp_dir))
         return FileResponse(zip_path, filename=zip_filename, media_type="application/zip")
     except Exception as e:
         shutil.rmtree(temp_dir)
         raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
+def _export_response(body, fmt: str, name: str) -> StreamingResponse:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return StreamingResponse(body, media_type=exports.FORMATS[fmt], headers={
+        "Content-Disposition": f'attachment; filename="discvault_{name}_{timestamp}.{fmt}"'
+    })
+
+@app.get("/export/albums")
+def export_albums(format: str = "ndjson", status: Optional[str] = None):
+    """
+    Stream every album with artists, genres, tags and tracks as NDJSON, CSV (one row per
+    album, tracks summarised) or Parquet (needs the optional pyarrow package).
+    """
+    if format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {format}")
+    if format == "parquet":
+        if not exports.parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export requires the optional pyarrow package")
+        return _export_response(exports.stream_albums_parquet(status), format, "albums")
+    return _export_response(exports.stream_albums(format, status), format, "albums")
+
+@app.get("/export/tracks")
+def export_tracks(format: str = "ndjson", status: Optional[str] = None):
+    """
+    Stream every track (album_id, disc, number, title, duration) as NDJSON or CSV.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {format}")
+    return _export_response(exports.stream_tracks(format, status), format, "tracks")
+
 @app.post("/import")
-async def import_collection(file: UploadFile = File(...), session: Session = Depends(get_session)):
+async def import_collection(file: UploadFile = File(...)):
     """
     Restore the collection from a ZIP backup. WARNING: Overwrites current data.
     """
@@ -553,37 +933,20 @@ async def import_collection(file: UploadFile = File(...), session: Session = Dep
         raise HTTPException(status_code=400, detail="Ongeldig bestandstype. Upload een ZIP-bestand.")
     
     temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, "import.zip")
     
     try:
-        with open(zip_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-            
-        # Validate
-        import_db_path = os.path.join(temp_dir, "discvault.db")
-        if not os.path.exists(import_db_path):
+        restored = await run_blocking(backup.restore_backup, file.file, temp_dir)
+        if not restored:
              raise HTTPException(status_code=400, detail="Ongeldige backup: discvault.db ontbreekt.")
         
-        # Replace Covers
-        import_covers_dir = os.path.join(temp_dir, "covers")
-        if os.path.exists(import_covers_dir):
-            if os.path.exists(COVERS_DIR):
-                shutil.rmtree(COVERS_DIR)
-            shutil.copytree(import_covers_dir, COVERS_DIR)
-            
-        # Replace DB
-        from .database import sqlite_file_name
-        shutil.copy(import_db_path, sqlite_file_name)
-        
         return {"message": "Import succesvol. Herlaad de app."}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Import mislukt: {str(e)}")
     finally:
-        shutil.rmtree(temp_dir)
+        await run_blocking(shutil.rmtree, temp_dir, ignore_errors=True)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,264 @@
+"""
+Optional offline MusicBrainz store for network-free lookups.
+
+A separate SQLite file holds one row per release, already mapped to the lookup format
+services returns, indexed by normalised barcode, MBID and catalogue number. It is built
+from a MusicBrainz JSON data dump (one release per line, as in mbdump/release), a JSON
+array of releases, or a CSV subset, and consulted before the live API, so a lookup is a
+single indexed read instead of a rate-limited HTTP round trip.
+
+Build one with:  python -m backend.app.mbstore import <file> [<file> ...]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional
+
+from . import utils
+from .database import data_dir
+
+MB_STORE_PATH = Path(os.getenv("DISCVAULT_MB_STORE", str(Path(data_dir) / "musicbrainz.db")))
+COVER_ART_ARCHIVE = os.getenv("COVER_ART_ARCHIVE", "https://coverartarchive.org")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS releases (
+    mbid TEXT PRIMARY KEY,
+    barcode_key TEXT,
+    catalog_key TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_releases_barcode_key ON releases (barcode_key);
+CREATE INDEX IF NOT EXISTS ix_releases_catalog_key ON releases (catalog_key);
+"""
+
+def cover_art_url(mbid: Optional[str]) -> Optional[str]:
+    return f"{COVER_ART_ARCHIVE}/release/{mbid}/front-250" if mbid else None
+
+def catalog_key(catalog_no: Optional[str]) -> Optional[str]:
+    # "ECM 1064/65", "ecm-1064/65" and "ECM1064/65" are the same catalogue number
+    key = "".join(ch for ch in (catalog_no or "").upper() if ch.isalnum())
+    return key or None
+
+def format_length(length_ms: Optional[int]) -> Optional[str]:
+    if not length_ms:
+        return None
+    minutes, seconds = divmod(length_ms // 1000, 60)
+    return f"{minutes}:{seconds:02d}"
+
+def media_tracks(media_list: List[Dict]) -> List[Dict]:
+    """
+    Tracklist in our format from the "media" of a MusicBrainz release.
+    """
+    tracks = []
+    for i, media in enumerate(media_list or []):
+        disc_no = i + 1
+        disc_format = media.get("format", f"Disc {disc_no}")
+        for track in media.get("tracks", []):
+            number = str(track.get("number", "0"))
+            tracks.append({
+                "track_no": int(number) if number.isdigit() else track.get("position", 0),
+                "title": (track.get("recording") or {}).get("title") or track.get("title"),
+                "duration": format_length(track.get("length")),
+                "duration_ms": track.get("length"),
+                "disc_no": disc_no,
+                "disc_name": disc_format,
+            })
+    return tracks
+
+def top_genres(release: Dict, limit: int = 5) -> List[str]:
+    # Genres from the release tags, falling back to the release group's
+    tags = release.get("tags") or (release.get("release-group") or {}).get("tags") or []
+    tags = sorted(tags, key=lambda t: t.get("count", 0), reverse=True)
+    return [t.get("name").title() for t in tags[:limit] if t.get("name")]
+
+def release_to_lookup(release: Dict) -> Dict:
+    """
+    Maps a full MusicBrainz release (JSON dump or /ws/2 lookup) to the lookup format.
+    """
+    mbid = release.get("id")
+    date = release.get("date") or ""
+    label_info = release.get("label-info") or []
+    return {
+        "title": release.get("title"),
+        "year": int(date[:4]) if date[:4].isdigit() else None,
+        "artists": [(a.get("artist") or {}).get("name") or a.get("name") for a in release.get("artist-credit", [])],
+        "genres": top_genres(release),
+        "barcode": release.get("barcode") or None,
+        "mbid": mbid,
+        "catalog_no": label_info[0].get("catalog-number") if label_info else None,
+        "cover_url": cover_art_url(mbid),
+        "tracks": media_tracks(release.get("media")),
+    }
+
+def csv_row_to_lookup(row: Dict[str, str]) -> Dict:
+    """
+    A row of a CSV subset: mbid, barcode, title, artists, date/year, catalog_no, genres
+    (artists and genres separated by ';').
+    """
+    def split(value):
+        return [part.strip() for part in (value or "").split(";") if part.strip()]
+
+    date = (row.get("date") or row.get("year") or "").strip()
+    mbid = (row.get("mbid") or "").strip() or None
+    return {
+        "title": row.get("title"),
+        "year": int(date[:4]) if date[:4].isdigit() else None,
+        "artists": split(row.get("artists") or row.get("artist")),
+        "genres": split(row.get("genres")),
+        "barcode": (row.get("barcode") or "").strip() or None,
+        "mbid": mbid,
+        "catalog_no": (row.get("catalog_no") or "").strip() or None,
+        "cover_url": cover_art_url(mbid),
+        "tracks": [],
+    }
+
+def iter_releases(source: IO[str]) -> Iterator[Dict]:
+    """
+    Yields lookup dicts from a JSON-lines dump, a JSON array or a CSV subset, detected
+    from the first non-blank character.
+    """
+    head = source.read(1)
+    while head and head.isspace():
+        head = source.read(1)
+    if not head:
+        return
+    if head == "[":
+        for release in json.loads(head + source.read()):
+            yield release_to_lookup(release)
+    elif head == "{":
+        for line in _prepend(head, source):
+            if line.strip():
+                yield release_to_lookup(json.loads(line))
+    else:
+        for row in csv.DictReader(_prepend(head, source)):
+            yield csv_row_to_lookup(row)
+
+def _prepend(head: str, source: IO[str]) -> Iterator[str]:
+    # Puts the sniffed character back in front of the stream
+    yield head + source.readline()
+    yield from source
+
+class MusicBrainzStore:
+    def __init__(self, path: Path = MB_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def available(self) -> bool:
+        return self.path.is_file()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # One read-only connection per thread, reopened when the file is rebuilt
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.mtime != mtime:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn, self._local.mtime = conn, mtime
+        return conn
+
+    def _one(self, column: str, value: Optional[str]) -> Optional[Dict]:
+        if not value:
+            return None
+        conn = self._connection()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(f"SELECT data FROM releases WHERE {column} = ? LIMIT 1", (value,)).fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        return json.loads(row[0]) if row else None
+
+    def by_barcode(self, barcode: Optional[str]) -> Optional[Dict]:
+        return self._one("barcode_key", utils.normalize_barcode(barcode))
+
+    def by_mbid(self, mbid: Optional[str]) -> Optional[Dict]:
+        return self._one("mbid", (mbid or "").strip().lower() or None)
+
+    def by_catalog_no(self, catalog_no: Optional[str]) -> Optional[Dict]:
+        return self._one("catalog_key", catalog_key(catalog_no))
+
+    def load(self, releases: Iterable[Dict], batch_size: int = 5000) -> int:
+        """
+        Inserts or replaces releases (lookup dicts); returns how many were written.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        count = 0
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executescript(SCHEMA)
+            # A rebuildable cache: durability per batch isn't worth an fsync
+            conn.execute("PRAGMA synchronous = OFF")
+            batch = []
+            for release in releases:
+                if not release.get("mbid"):
+                    continue
+                batch.append((release["mbid"].lower(), utils.normalize_barcode(release.get("barcode")),
+                              catalog_key(release.get("catalog_no")), json.dumps(release, ensure_ascii=False)))
+                if len(batch) >= batch_size:
+                    conn.executemany("INSERT OR REPLACE INTO releases VALUES (?, ?, ?, ?)", batch)
+                    conn.commit()
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany("INSERT OR REPLACE INTO releases VALUES (?, ?, ?, ?)", batch)
+                conn.commit()
+                count += len(batch)
+            conn.execute("ANALYZE")
+        finally:
+            conn.close()
+        return count
+
+    def import_file(self, source: IO[bytes]) -> int:
+        return self.load(iter_releases(io.TextIOWrapper(source, encoding="utf-8-sig", newline="")))
+
+    def stats(self) -> Dict:
+        conn = self._connection()
+        if conn is None:
+            return {"available": False, "path": str(self.path)}
+        releases = conn.execute("SELECT COUNT(*) FROM releases").fetchone()[0]
+        barcodes = conn.execute("SELECT COUNT(*) FROM releases WHERE barcode_key IS NOT NULL").fetchone()[0]
+        return {"available": True, "path": str(self.path), "releases": releases, "with_barcode": barcodes,
+                "bytes": self.path.stat().st_size}
+
+store = MusicBrainzStore()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline MusicBrainz store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    load = sub.add_parser("import", help="Import MusicBrainz JSON dumps or CSV subsets")
+    load.add_argument("files", nargs="+", type=Path)
+    stub = sub.add_parser("synthetic", help="Fill the store with a deterministic stub dataset")
+    stub.add_argument("--releases", type=int, default=1000)
+    stub.add_argument("--seed", type=int, default=42)
+    lookup = sub.add_parser("lookup", help="Look up a barcode")
+    lookup.add_argument("barcode")
+    parser.add_argument("--store", type=Path, default=MB_STORE_PATH)
+    args = parser.parse_args()
+
+    target = MusicBrainzStore(args.store)
+    start = time.perf_counter()
+    if args.command == "import":
+        for path in args.files:
+            with open(path, "rb") as f:
+                print(f"{path}: {target.import_file(f)} releases")
+    elif args.command == "synthetic":
+        # The benchmark data generator is only needed here, never by the server
+        from .synthetic import musicbrainz_releases
+        count = target.load(release_to_lookup(r) for r in musicbrainz_releases(args.releases, args.seed))
+        print(f"{count} synthetic releases")
+    else:
+        print(json.dumps(target.by_barcode(args.barcode), indent=2, ensure_ascii=False))
+    print(f"{time.perf_counter() - start:.2f}s, store: {args.store}")
+
+if __name__ == "__main__":
+    main()
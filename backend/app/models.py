@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional, List, Any
+from sqlalchemy import Index, text
 from sqlmodel import Field, SQLModel, Relationship
 from pydantic import field_validator
 
@@ -7,18 +8,19 @@ from pydantic import field_validator
 class AlbumTagLink(SQLModel, table=True):
     __tablename__ = "album_tag_links"
     album_id: Optional[int] = Field(default=None, foreign_key="albums.id", primary_key=True)
-    tag_id: Optional[int] = Field(default=None, foreign_key="tags.id", primary_key=True)
+    # The composite PK covers album -> tag lookups; the extra index covers tag -> albums
+    tag_id: Optional[int] = Field(default=None, foreign_key="tags.id", primary_key=True, index=True)
 
 class AlbumArtistLink(SQLModel, table=True):
     __tablename__ = "album_artist_links"
     album_id: Optional[int] = Field(default=None, foreign_key="albums.id", primary_key=True)
-    artist_id: Optional[int] = Field(default=None, foreign_key="artists.id", primary_key=True)
+    artist_id: Optional[int] = Field(default=None, foreign_key="artists.id", primary_key=True, index=True)
     role: Optional[str] = "Main"
 
 class AlbumGenreLink(SQLModel, table=True):
     __tablename__ = "album_genre_links"
     album_id: Optional[int] = Field(default=None, foreign_key="albums.id", primary_key=True)
-    genre_id: Optional[int] = Field(default=None, foreign_key="genres.id", primary_key=True)
+    genre_id: Optional[int] = Field(default=None, foreign_key="genres.id", primary_key=True, index=True)
 
 # --- Genre ---
 class GenreBase(SQLModel):
@@ -80,6 +82,8 @@ class TrackBase(SQLModel):
     track_no: int
     title: str
     duration: Optional[str] = None
+    # Normalised from duration by crud on every write
+    duration_ms: Optional[int] = None
     disc_no: int = 1
     disc_name: Optional[str] = None
     
@@ -90,7 +94,7 @@ class TrackBase(SQLModel):
 class Track(TrackBase, table=True):
     __tablename__ = "tracks"
     id: Optional[int] = Field(default=None, primary_key=True)
-    album_id: int = Field(foreign_key="albums.id")
+    album_id: int = Field(foreign_key="albums.id", index=True)
     album: "Album" = Relationship(back_populates="tracks")
 
 class TrackRead(TrackBase):
@@ -101,6 +105,7 @@ class AlbumBase(SQLModel):
     title: str = Field(index=True)
     year: Optional[int] = None
     upc_ean: Optional[str] = Field(default=None, index=True)
+    mb_disc_id: Optional[str] = Field(default=None, index=True)
     catalog_no: Optional[str] = None
     spars_code: Optional[str] = None
     cover_url: Optional[str] = None
@@ -109,12 +114,32 @@ class AlbumBase(SQLModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     archived_at: Optional[datetime] = None
-    location_id: Optional[int] = Field(default=None, foreign_key="locations.id")
-    status: str = Field(default="collection", index=True) # "collection" or "wishlist"
+    location_id: Optional[int] = Field(default=None, foreign_key="locations.id", index=True)
+    status: str = "collection" # "collection" or "wishlist"
 
 class Album(AlbumBase, table=True):
     __tablename__ = "albums"
+    # Listings, search and stats only ever look at albums that aren't archived; partial
+    # indexes on those keep archived albums out of the hot paths entirely. The queries must
+    # repeat "archived_at IS NULL" literally for SQLite to pick them.
+    __table_args__ = (
+        Index("ix_albums_active_status", "status", sqlite_where=text("archived_at IS NULL")),
+        # "Longest albums in the collection" reads this index backwards, no sort needed
+        Index("ix_albums_active_status_runtime_ms", "status", "runtime_ms", sqlite_where=text("archived_at IS NULL")),
+        Index("ix_albums_archived_at", "archived_at", sqlite_where=text("archived_at IS NOT NULL")),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
+
+    # Normalised keys for duplicate detection, maintained by crud on every write
+    title_key: Optional[str] = Field(default=None, index=True)
+    fingerprint: Optional[str] = Field(default=None, index=True)
+    barcode_key: Optional[str] = Field(default=None, index=True)
+    # Sum of the track durations, kept in step by crud whenever the tracklist changes
+    runtime_ms: Optional[int] = None
+    # Blurhash and dominant colour ("#rrggbb") of the stored cover, so lists can show something
+    # before the image loads; cleared by crud whenever the cover changes
+    cover_blurhash: Optional[str] = None
+    cover_color: Optional[str] = None
     
     location: Optional[Location] = Relationship(back_populates="albums")
     artists: List[Artist] = Relationship(back_populates="albums", link_model=AlbumArtistLink)
@@ -122,6 +147,21 @@ class Album(AlbumBase, table=True):
     genres: List[Genre] = Relationship(back_populates="albums", link_model=AlbumGenreLink)
     tracks: List[Track] = Relationship(back_populates="album")
 
+# --- Cover hashes ---
+class CoverHash(SQLModel, table=True):
+    __tablename__ = "cover_hashes"
+    album_id: int = Field(foreign_key="albums.id", primary_key=True)
+    # The cover the hashes were computed from; a row whose URL no longer matches the album is stale
+    cover_url: str
+    ahash: int
+    phash: int
+    # The pHash in four 16-bit segments for multi-index hashing, each with its own index
+    phash_0: int = Field(index=True)
+    phash_1: int = Field(index=True)
+    phash_2: int = Field(index=True)
+    phash_3: int = Field(index=True)
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
 # --- Create Models (DTOs) ---
 class AlbumCreate(AlbumBase):
     tag_ids: List[int] = []
@@ -166,8 +206,54 @@ class AlbumUpdate(SQLModel):
 # --- Read Models (DTOs) ---
 class AlbumRead(AlbumBase):
     id: int
+    runtime_ms: Optional[int] = None
+    cover_blurhash: Optional[str] = None
+    cover_color: Optional[str] = None
     location: Optional[LocationRead] = None
     artists: List[ArtistRead] = []
     tags: List[TagRead] = []
     genres: List[GenreRead] = []
-    tracks: List[TrackRead] = []
\ No newline at end of file
+    tracks: List[TrackRead] = []
+
+class MergeRequest(SQLModel):
+    target_id: int
+    source_ids: List[int]
+
+class CleanupRequest(SQLModel):
+    # None removes every unused item; otherwise exactly these ids (links included)
+    ids: Optional[List[int]] = None
+
+class TocRequest(SQLModel):
+    # "first last leadout offset1 ... offsetN" in CD frames, as used by MusicBrainz
+    toc: str
+
+class CueImportRequest(SQLModel):
+    # Directory below the import root; every .cue file in it (recursively) becomes an album
+    path: str = ""
+    status: str = "collection"
+    dry_run: bool = False
+
+class AlbumSelection(SQLModel):
+    # Explicit ids, or every album matching a /search query (optionally one status)
+    album_ids: Optional[List[int]] = None
+    q: Optional[str] = None
+    filter: str = "all"
+    match_status: Optional[str] = None
+
+class AlbumBulkUpdate(AlbumSelection):
+    # Operations; location_id and status are only applied when present in the request
+    add_tag_ids: List[int] = []
+    remove_tag_ids: List[int] = []
+    add_genre_ids: List[int] = []
+    remove_genre_ids: List[int] = []
+    add_artist_ids: List[int] = []
+    remove_artist_ids: List[int] = []
+    location_id: Optional[int] = None
+    status: Optional[str] = None
+
+    @field_validator("location_id", mode="before")
+    @classmethod
+    def empty_string_to_none(cls, v: Any) -> Any:
+        if v == "":
+            return None
+        return v
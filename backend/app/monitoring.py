@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Optional, Callable, Dict, Tuple, List
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("DISCVAULT_LOOP_STALL_MS", "100"))
+LOOP_PROBE_INTERVAL_MS = float(os.getenv("DISCVAULT_LOOP_PROBE_MS", "20"))
+SLOW_QUERY_MS = float(os.getenv("DISCVAULT_SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+# --- Prometheus-style metrics ---
+# A deliberately small subset of the exposition format: counters, gauges and histograms
+# with labels. Enough for /metrics without pulling in prometheus_client.
+
+def _format_labels(labelnames: Tuple[str, ...], key: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self._fn is not None:
+            return [f"{self.name} {self._fn()}"]
+        return super().samples()
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        lines = []
+        for key, row in items:
+            for bound, count in zip(self.buckets, row):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, f'le="{bound}"')} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, 'le="+Inf"')} {row[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, fn))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.counter("discvault_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+http_latency = registry.histogram("discvault_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+db_queries = registry.counter("discvault_db_queries_total", "SQL statements executed, by route.", ("route",))
+db_query_latency = registry.histogram("discvault_db_query_duration_seconds", "SQL statement latency, by route.", ("route",))
+db_queries_per_request = registry.histogram("discvault_db_queries_per_request", "SQL statements issued per HTTP request.", ("route",), QUERY_COUNT_BUCKETS)
+db_slow_queries = registry.counter("discvault_db_slow_queries_total", "SQL statements slower than the slow-query threshold.", ("route",))
+cache_requests = registry.counter("discvault_cache_requests_total", "In-process cache lookups by cache and result (hit/miss).", ("cache", "result"))
+musicbrainz_requests = registry.counter("discvault_musicbrainz_requests_total", "MusicBrainz API calls by endpoint and outcome.", ("endpoint", "outcome"))
+musicbrainz_latency = registry.histogram("discvault_musicbrainz_request_duration_seconds", "MusicBrainz API call latency.", ("endpoint",))
+
+class LoopStallMonitor:
+    """
+    Watchdog that detects event loop stalls.
+    A probe task sleeps for a fixed interval; any extra delay before it wakes up is time
+    the loop spent running something that didn't yield. Lags over the threshold are
+    counted and logged so a blocking call in an async route shows up immediately.
+    """
+
+    def __init__(self, threshold_ms: float = LOOP_STALL_THRESHOLD_MS, interval_ms: float = LOOP_PROBE_INTERVAL_MS):
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+        self.last_stall_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self):
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+        self.last_stall_at = None
+
+    async def _run(self):
+        interval = self.interval_ms / 1000
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lag_ms = (time.perf_counter() - expected) * 1000
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > self.threshold_ms:
+                self.stalls += 1
+                self.last_stall_at = time.time()
+                logger.warning(f"Event loop stalled for {lag_ms:.0f} ms (threshold {self.threshold_ms:.0f} ms)")
+
+    def snapshot(self):
+        return {
+            "stalls": self.stalls,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "threshold_ms": self.threshold_ms,
+        }
+
+loop_monitor = LoopStallMonitor()
+
+registry.gauge("discvault_event_loop_stalls", "Event loop stalls above the threshold since startup.", fn=lambda: loop_monitor.stalls)
+registry.gauge("discvault_event_loop_max_lag_ms", "Largest observed event loop lag in milliseconds.", fn=lambda: round(loop_monitor.max_lag_ms, 1))
+
+# --- Per-request query profiling ---
+class RequestStats:
+    __slots__ = ("scope", "queries", "query_seconds")
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope before the endpoint runs
+        return _route_name(self.scope) if self.scope is not None else "background"
+
+# Holds the stats object of the request being served. Worker threads get a copy of the
+# context, so they mutate the same RequestStats instance as the middleware reads.
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("discvault_request_stats", default=None)
+
+def instrument_engine(engine):
+    """
+    Attaches query timing to an engine: per-request counts and durations, plus
+    slow-query logging with the EXPLAIN QUERY PLAN of the offending statement.
+    """
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("discvault_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("discvault_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = current_request.get()
+    route = stats.route if stats else "background"
+    if stats:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+    db_queries.inc(route=route)
+    db_query_latency.observe(elapsed, route=route)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        db_slow_queries.inc(route=route)
+        plan = _explain(cursor, statement, parameters, executemany)
+        logger.warning(f"Slow query ({elapsed * 1000:.0f} ms) on {route}: {' '.join(statement.split())}\n{plan}")
+
+def _explain(cursor, statement: str, parameters, executemany: bool) -> str:
+    # Only plain SELECTs are explained; the raw DBAPI connection is used so the
+    # EXPLAIN itself doesn't re-enter these event hooks.
+    if executemany or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return "  (no plan captured)"
+    try:
+        rows = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+        return "\n".join(f"  {row[-1]}" for row in rows)
+    except Exception as e:
+        return f"  (plan unavailable: {type(e).__name__}: {e})"
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and SQL usage per route template.
+    Also adds a Server-Timing header so query cost is visible in browser devtools.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                headers.append((b"server-timing", (
+                    f'app;dur={elapsed_ms:.1f}, db;dur={stats.query_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                ).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = _route_name(scope)
+            method = scope.get("method", "")
+            http_requests.inc(method=method, route=route, status=status_code)
+            http_latency.observe(elapsed, method=method, route=route)
+            db_queries_per_request.observe(stats.queries, route=route)
+            current_request.reset(token)
+
+def _route_name(scope) -> str:
+    # Use the route template ("/albums/{album_id}") so label cardinality stays bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
@@ -0,0 +1,163 @@
+"""
+Placeholders for stored covers, so album lists can paint something before the real image
+has downloaded: a blurhash (a ~36 character string the client decodes into a blurred
+preview) and the dominant colour.
+
+Both come from a 32x32 RGB thumbnail. Covers are decoded in batches in a process pool and
+the pixel maths runs over the whole batch at once: the blurhash factors as one einsum
+against the cosine bases, the dominant colour as a single bincount over quantised colours.
+Decoding and encoding need the optional Pillow and NumPy packages.
+"""
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session, text
+
+from . import covers, crud
+from .database import engine
+
+IMAGE_SIZE = 32
+# Covers are square; 4x4 components keep the hash at 36 characters
+COMPONENTS_X = 4
+COMPONENTS_Y = 4
+# Colours are counted in 8x8x8 buckets; the fullest bucket's mean is the dominant colour
+COLOR_BITS = 3
+BATCH_SIZE = 64
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+@lru_cache(maxsize=1)
+def available() -> bool:
+    try:
+        import numpy  # noqa: F401
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+# --- Encoding (runs in worker processes) ---
+def _base83(value: int, length: int) -> str:
+    return "".join(BASE83[(value // 83 ** (length - 1 - i)) % 83] for i in range(length))
+
+@lru_cache(maxsize=1)
+def _bases():
+    # cos(pi * k * x / size) per component k and pixel x, as in the reference encoder
+    import numpy as np
+    x = np.arange(IMAGE_SIZE)[None, :]
+    return (np.cos(np.pi * np.arange(COMPONENTS_X)[:, None] * x / IMAGE_SIZE),
+            np.cos(np.pi * np.arange(COMPONENTS_Y)[:, None] * x / IMAGE_SIZE))
+
+def _blurhashes(pixels) -> List[str]:
+    import numpy as np
+    n = len(pixels)
+    srgb = pixels / 255.0
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+    basis_x, basis_y = _bases()
+    factors = np.einsum("jy,nyxc,ix->njic", basis_y, linear, basis_x) / (IMAGE_SIZE * IMAGE_SIZE)
+    factors = factors.reshape(n, COMPONENTS_X * COMPONENTS_Y, 3)
+    factors[:, 1:] *= 2
+    dc, ac = factors[:, 0], factors[:, 1:]
+
+    dc = np.clip(dc, 0, 1)
+    dc = np.where(dc <= 0.0031308, dc * 12.92, 1.055 * dc ** (1 / 2.4) - 0.055)
+    dc = (dc * 255 + 0.5).astype(np.int64)
+    dc_values = (dc[:, 0] << 16) + (dc[:, 1] << 8) + dc[:, 2]
+
+    quantised_max = np.clip(np.floor(np.abs(ac).max(axis=(1, 2)) * 166 - 0.5), 0, 82).astype(np.int64)
+    scaled = ac / ((quantised_max + 1) / 166)[:, None, None]
+    quantised = np.clip(np.floor(np.sign(scaled) * np.abs(scaled) ** 0.5 * 9 + 9.5), 0, 18).astype(np.int64)
+    ac_values = quantised[..., 0] * 19 * 19 + quantised[..., 1] * 19 + quantised[..., 2]
+
+    size_flag = (COMPONENTS_X - 1) + (COMPONENTS_Y - 1) * 9
+    return [
+        _base83(size_flag, 1) + _base83(int(maximum), 1) + _base83(int(dc_value), 4)
+        + "".join(_base83(int(value), 2) for value in values)
+        for maximum, dc_value, values in zip(quantised_max, dc_values, ac_values)
+    ]
+
+def _dominant_colors(pixels) -> List[str]:
+    import numpy as np
+    n = len(pixels)
+    flat = pixels.reshape(n, -1, 3)
+    shift = 8 - COLOR_BITS
+    buckets = 1 << (3 * COLOR_BITS)
+    quantised = flat.astype(np.int64) >> shift
+    index = (quantised[..., 0] << (2 * COLOR_BITS)) + (quantised[..., 1] << COLOR_BITS) + quantised[..., 2]
+    # One bincount for the whole batch: every image gets its own range of buckets
+    counts = np.bincount((index + np.arange(n)[:, None] * buckets).ravel(), minlength=n * buckets).reshape(n, buckets)
+    members = index == counts.argmax(axis=1)[:, None]
+    means = (flat * members[..., None]).sum(axis=1) / members.sum(axis=1)[:, None]
+    return ["#%02x%02x%02x" % tuple(color) for color in np.rint(means).astype(int)]
+
+def encode_pixels(pixels) -> List[Tuple[str, str]]:
+    """
+    (blurhash, dominant colour) for a (n, 32, 32, 3) batch of RGB thumbnails.
+    """
+    return list(zip(_blurhashes(pixels), _dominant_colors(pixels)))
+
+def _thumbnail(source):
+    import numpy as np
+    from PIL import Image
+    with Image.open(source) as image:
+        # JPEGs decode straight at a fraction of their size, far cheaper than a full decode
+        image.draft("RGB", (IMAGE_SIZE * 2, IMAGE_SIZE * 2))
+        return np.asarray(image.convert("RGB").resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.BOX), dtype=np.float64)
+
+def encode_files(items: List[Tuple[int, str]]) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    (album_id, blurhash, colour) per (album_id, path); None for files that can't be decoded.
+    Top-level so worker processes can run it.
+    """
+    import numpy as np
+    results, decoded, thumbnails = [], [], []
+    for album_id, path in items:
+        try:
+            thumbnails.append(_thumbnail(path))
+            decoded.append(album_id)
+        except Exception:
+            # Missing, truncated or not an image at all: reported as failed, retried next run
+            results.append((album_id, None, None))
+    if thumbnails:
+        for album_id, (blurhash, color) in zip(decoded, encode_pixels(np.stack(thumbnails))):
+            results.append((album_id, blurhash, color))
+    return results
+
+# --- Storage ---
+def pending_covers(session: Session, refresh: bool = False) -> List[Tuple[int, str]]:
+    """
+    (album_id, cover_url) of stored covers without a placeholder (all of them with refresh).
+    """
+    sql = "SELECT albums.id, albums.cover_url FROM albums WHERE albums.cover_url LIKE '/covers/%'"
+    if not refresh:
+        sql += " AND albums.cover_blurhash IS NULL"
+    return [(row[0], row[1]) for row in session.exec(text(sql + " ORDER BY albums.id")).all()]
+
+def compute_placeholders(pending: List[Tuple[int, str]], workers: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Encodes the given covers in a process pool and stores them batch by batch.
+    progress(encoded, failed) is called after every batch.
+    """
+    urls = dict(pending)
+    items = [(album_id, str(covers.cover_file(url))) for album_id, url in pending]
+    encoded = failed = 0
+    for results in covers.map_cover_batches(encode_files, items, BATCH_SIZE, workers):
+        rows = [(album_id, urls[album_id], blurhash, color) for album_id, blurhash, color in results if blurhash is not None]
+        with Session(engine) as session:
+            crud.set_cover_placeholders(session, rows)
+        encoded += len(rows)
+        failed += len(results) - len(rows)
+        if progress:
+            progress(len(rows), len(results) - len(rows))
+    return {"encoded": encoded, "failed": failed}
+
+def encode_cover(album_id: int, cover_url: str) -> List[Tuple[int, str, str, str]]:
+    """
+    Rows for crud.set_cover_placeholders for one album's cover right after it was stored;
+    empty if it can't be decoded (the batch job picks those up).
+    """
+    path = covers.cover_file(cover_url)
+    if path is None:
+        return []
+    return [(album_id, cover_url, blurhash, color) for _, blurhash, color in encode_files([(album_id, str(path))])
+            if blurhash is not None]
@@ -0,0 +1,353 @@
+"""
+Query-plan regression checks.
+
+Seeds a synthetic collection, exercises the crud layer and the HTTP endpoints, captures
+every SQL statement they issue and runs EXPLAIN QUERY PLAN on each one. The run fails when
+a statement scans a large table or sorts through a temporary B-tree without an entry in
+ALLOWED, or when a statement in EXPECTED stops using its index:
+
+    python -m backend.app.queryplan            # exits non-zero on violations
+    python -m backend.app.queryplan --verbose  # print every plan
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Tables that grow with the collection. Scans of genres, tags and locations are fine.
+LARGE_TABLES = {"albums", "tracks", "artists", "album_artist_links", "album_genre_links", "album_tag_links", "cover_hashes"}
+
+SCAN_RE = re.compile(r"\bSCAN (?:TABLE )?(\w+)")
+TEMP_BTREE_RE = re.compile(r"USE TEMP B-TREE")
+TABLE_RE = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE)\s+(\w+)", re.IGNORECASE)
+
+@dataclass
+class Allowance:
+    sql: str
+    plan: str
+    reason: str
+
+    def matches(self, statement: str, detail: str) -> bool:
+        return re.search(self.sql, statement, re.IGNORECASE | re.DOTALL) is not None and re.search(self.plan, detail) is not None
+
+@dataclass
+class Expectation:
+    sql: str
+    index: str
+    description: str
+
+# Known and accepted plan shapes. Every entry needs a reason; new scans must be fixed or argued for here.
+ALLOWED: List[Allowance] = [
+    Allowance(r"LIKE|lower\(\w+\.\w+\) = \?", r"SCAN (albums|tracks|artists)\b",
+              "Substring and case-insensitive matches can't use a B-tree index"),
+    Allowance(r"GROUP BY albums\.id ORDER BY", r"SCAN albums|USE TEMP B-TREE",
+              "Album listing sorts on computed keys (lower(title), min(artist)) over the joined set"),
+    Allowance(r"GROUP BY (genres|tags)\.name ORDER BY count DESC", r"SCAN|USE TEMP B-TREE",
+              "Top-10 distribution aggregates every link row"),
+    Allowance(r"GROUP BY album_(genre|tag)_links\.(genre|tag)_id\s+HAVING", r"SCAN album_(genre|tag)_links USING COVERING INDEX",
+              "Low-usage counts aggregate the whole link table, in index order"),
+    Allowance(r"^SELECT count\((albums|artists)\.id\) AS count_1 \nFROM (albums|artists)$", r"SCAN (albums|artists)",
+              "Unfiltered totals count every row"),
+    Allowance(r"^SELECT artists\.name, artists\.id \nFROM artists$", r"SCAN artists",
+              "The artist list endpoint returns every artist"),
+    Allowance(r"^SELECT (albums\.id, albums\.fingerprint, albums\.barcode_key|artists\.id, artists\.name) \nFROM (albums|artists)( \nWHERE albums\.archived_at IS NULL)?$", r"SCAN (albums|artists)",
+              "Duplicate reports read every key once for hash-based grouping"),
+    Allowance(r"^SELECT (albums\.id, albums\.media_type, albums\.year, albums\.location_id, albums\.status \nFROM albums \nWHERE albums\.archived_at IS NULL"
+              r"|album_(genre|tag)_links\.album_id, album_(genre|tag)_links\.(genre|tag)_id \nFROM album_(genre|tag)_links)$",
+              r"SCAN (albums|album_(genre|tag)_links)",
+              "The facet index is built from one pass over albums and the genre/tag links"),
+    Allowance(r"sum\(albums\.runtime_ms\) AS runtime_ms.*GROUP BY genres\.id ORDER BY runtime_ms DESC", r"USE TEMP B-TREE",
+              "Runtime per genre sums every album in the collection; only the top entries are kept"),
+    Allowance(r"FROM tracks\s+WHERE tracks\.album_id = \? GROUP BY tracks\.disc_no", r"USE TEMP B-TREE FOR GROUP BY",
+              "Per-disc runtime groups the handful of tracks of one album"),
+    Allowance(r"WHERE albums\.runtime_ms IS NULL AND \(EXISTS", r"SCAN albums",
+              "Startup backfill looks for albums whose runtime was never computed"),
+    Allowance(r"GROUP BY album_(artist|genre|tag)_links\.(artist|genre|tag)_id$", r"SCAN album_(artist|genre|tag)_links USING (COVERING )?INDEX",
+              "Typeahead usage counts aggregate each link table once per write, in index order"),
+    Allowance(r"^SELECT (artists|genres|tags)\.id, \1\.name \nFROM \1$", r"SCAN (artists|genres|tags)",
+              "The typeahead index is built from every name once"),
+    Allowance(r"FROM (artists|genres|tags) WHERE NOT EXISTS", r"SCAN (artists|genres|tags)",
+              "Unused-metadata cleanup checks every row, probing the link index per row"),
+    Allowance(r"FROM artists LEFT OUTER JOIN album_artist_links", r"SCAN artists",
+              "Unused-artist report checks every artist for a link"),
+    Allowance(r"albums\.cover_url LIKE", r"SCAN albums",
+              "Cover maintenance looks for external URLs across the collection"),
+    Allowance(r"^SELECT cover_hashes\.album_id, cover_hashes\.phash FROM cover_hashes CROSS JOIN albums .*archived_at IS NULL$", r"SCAN cover_hashes",
+              "The cover duplicate report buckets every current hash once"),
+    Allowance(r"album_search", r"SCAN album_search",
+              "FTS rebuild reads the whole content table by design"),
+]
+
+# Statements that must keep using a specific index
+EXPECTED: List[Expectation] = [
+    Expectation(r"FROM tracks \nWHERE tracks\.album_id IN", "ix_tracks_album_id", "tracklists load by album id"),
+    Expectation(r"DELETE FROM tracks WHERE album_id", "ix_tracks_album_id", "tracklist replacement deletes by album id"),
+    Expectation(r"EXISTS \(SELECT \*\s+FROM tracks", "ix_tracks_album_id", "missing-tracks report probes tracks per album"),
+    Expectation(r"WHERE \(albums\.barcode_key = \? OR albums\.fingerprint = \?\)", "ix_albums_barcode_key", "duplicate check by barcode"),
+    Expectation(r"WHERE \(albums\.barcode_key = \? OR albums\.fingerprint = \?\)", "ix_albums_fingerprint", "duplicate check by fingerprint"),
+    Expectation(r"WHERE albums\.title_key >= \? AND albums\.title_key < \?", "ix_albums_title_key", "fuzzy duplicate candidates"),
+    Expectation(r"LEFT OUTER JOIN album_genre_links ON genres\.id = album_genre_links\.genre_id", "ix_album_genre_links_genre_id", "genre usage counts"),
+    Expectation(r"LEFT OUTER JOIN album_tag_links ON tags\.id = album_tag_links\.tag_id", "ix_album_tag_links_tag_id", "tag usage counts"),
+    Expectation(r"WHERE albums\.location_id IS NULL AND albums\.status = \? AND albums\.archived_at IS NULL", "ix_albums_active_status", "missing-location report"),
+    Expectation(r"sum\(albums\.runtime_ms\) AS sum_1 \nFROM albums \nWHERE albums\.status = \? AND albums\.archived_at IS NULL", "ix_albums_active_status", "collection stats skip archived albums"),
+    Expectation(r"WHERE albums\.archived_at IS NOT NULL ORDER BY albums\.archived_at", "ix_albums_archived_at", "archived albums are read from their own partial index"),
+    *[Expectation(r"cover_hashes\.phash_0 IN", f"ix_cover_hashes_phash_{i}", f"cover lookups probe segment index {i}") for i in range(4)],
+]
+
+@dataclass
+class CapturedStatement:
+    sql: str
+    params: tuple
+    sources: List[str] = field(default_factory=list)
+    plan: List[str] = field(default_factory=list)
+    violations: List[str] = field(default_factory=list)
+    allowed: List[str] = field(default_factory=list)
+
+class StatementRecorder:
+    """
+    Collects the distinct SQL statements issued on an engine, tagged with the step that issued them.
+    """
+
+    def __init__(self):
+        self.statements: Dict[str, CapturedStatement] = {}
+        self.source = "startup"
+
+    def attach(self, engine):
+        from sqlalchemy import event
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def detach(self, engine):
+        from sqlalchemy import event
+        event.remove(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany and parameters:
+            parameters = parameters[0]
+        captured = self.statements.get(statement)
+        if captured is None:
+            captured = self.statements[statement] = CapturedStatement(statement, tuple(parameters or ()))
+        if self.source not in captured.sources:
+            captured.sources.append(self.source)
+
+def _explainable(sql: str) -> bool:
+    return sql.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"))
+
+def analyse(engine, statements: Dict[str, CapturedStatement]) -> List[CapturedStatement]:
+    raw = engine.raw_connection()
+    try:
+        for captured in statements.values():
+            if not _explainable(captured.sql):
+                continue
+            try:
+                rows = raw.cursor().execute(f"EXPLAIN QUERY PLAN {captured.sql}", captured.params).fetchall()
+            except Exception as e:
+                captured.violations.append(f"EXPLAIN failed: {type(e).__name__}: {e}")
+                continue
+            captured.plan = [row[-1] for row in rows]
+            touches_large = {t.lower() for t in TABLE_RE.findall(captured.sql)} & LARGE_TABLES
+            for detail in captured.plan:
+                scan = SCAN_RE.search(detail)
+                flagged = (scan and scan.group(1) in LARGE_TABLES) or (TEMP_BTREE_RE.search(detail) and touches_large)
+                if not flagged:
+                    continue
+                allowance = next((a for a in ALLOWED if a.matches(captured.sql, detail)), None)
+                if allowance:
+                    captured.allowed.append(f"{detail}  ({allowance.reason})")
+                else:
+                    captured.violations.append(detail)
+    finally:
+        raw.close()
+    return [s for s in statements.values() if s.plan or s.violations]
+
+def check_expectations(statements: Dict[str, CapturedStatement]) -> List[str]:
+    failures = []
+    for expectation in EXPECTED:
+        matching = [s for s in statements.values() if re.search(expectation.sql, s.sql, re.DOTALL)]
+        if not matching:
+            failures.append(f"not exercised: {expectation.description} ({expectation.sql})")
+            continue
+        for s in matching:
+            if not any(expectation.index in detail for detail in s.plan):
+                failures.append(f"{expectation.description}: expected {expectation.index}, got {' | '.join(s.plan)}")
+    return failures
+
+def exercise(recorder: StatementRecorder, client, session_factory):
+    """
+    Drives every crud function and read/write endpoint at least once.
+    """
+    from . import crud
+    from .models import AlbumCreate, AlbumUpdate, TrackBase
+
+    def step(name):
+        recorder.source = name
+
+    with session_factory() as session:
+        step("crud.get_stats")
+        crud.get_stats(session)
+        step("crud.get_report_stats")
+        crud.get_report_stats(session)
+        step("crud.count_duplicates")
+        crud.count_duplicates(session)
+        for report_type in ["unused_genres", "unused_tags", "unused_artists", "low_usage_genres", "low_usage_tags",
+                            "missing_covers", "missing_tracks", "missing_year", "missing_location", "missing_media", "missing_catalog"]:
+            step(f"crud.get_report_details:{report_type}")
+            crud.get_report_details(session, report_type)
+        for sort_by in ["created_at", "title", "artist", "year"]:
+            step(f"crud.get_albums:{sort_by}")
+            crud.get_albums(session, offset=100, limit=50, sort_by=sort_by, order="asc")
+            crud.get_albums(session, limit=50, sort_by=sort_by, order="desc", status="collection")
+        step("crud.get_albums:album_ids")
+        crud.get_albums(session, album_ids=[1, 2, 3], status="collection")
+        step("crud.get_genre_distribution")
+        crud.get_genre_distribution(session)
+        step("crud.get_tag_distribution")
+        crud.get_tag_distribution(session)
+        step("crud.get_genres")
+        crud.get_genres(session)
+        step("crud.get_tags")
+        crud.get_tags(session)
+        step("crud.get_artists")
+        crud.get_artists(session)
+        step("crud.get_locations")
+        crud.get_locations(session)
+        step("crud.check_duplicate_album")
+        crud.check_duplicate_album(session, title="Summer Night", artist_names=["Miles Davis"], upc_ean="8712345678906", fuzzy=True)
+        step("crud.create_album")
+        album = crud.create_album(session, AlbumCreate(
+            title="Query Plan Album", artist_names=["Plan Artist"], genre_names=["Rock"], tag_ids=[1],
+            tracks=[TrackBase(track_no=1, title="One", duration="3:00")]))
+        step("crud.update_album")
+        crud.update_album(session, album.id, AlbumUpdate(
+            notes="checked", tag_ids=[1, 2], genre_ids=[1], artist_names=["Plan Artist"],
+            tracks=[{"track_no": 1, "title": "Uno", "duration": "3:01", "disc_no": 1}]))
+
+    with session_factory() as session:
+        # Hashes for the synthetic covers (no image files here), a few of them near-identical
+        from . import coverhash
+        step("coverhash.pending_covers")
+        pending = coverhash.pending_covers(session)
+        step("coverhash.store_hashes")
+        coverhash.store_hashes(session, [(album_id, url, album_id, (album_id // 2) * 0x9E3779B97F4A7C15 & coverhash.HASH_MASK)
+                                         for album_id, url in pending[:500]])
+    hashed_album = pending[0][0] if pending else 1
+
+    with session_factory() as session:
+        from . import placeholders
+        step("placeholders.pending_covers")
+        pending = placeholders.pending_covers(session)
+        step("crud.set_cover_placeholders")
+        crud.set_cover_placeholders(session, [(album_id, url, "U00000fQfQfQfQfQfQfQfQfQfQfQfQfQfQfQ", "#000000")
+                                              for album_id, url in pending[:50]])
+
+    reads = [
+        ("/stats", {}), ("/reports/stats", {}), ("/reports/distribution/genres", {}), ("/reports/distribution/tags", {}),
+        ("/reports/runtime", {}), ("/albums/1/runtime", {}), ("/reports/cover-duplicates", {}),
+        (f"/albums/{hashed_album}/similar-covers", {}),
+        ("/suggest", {"q": "mi", "kind": ["artists", "genres", "tags"]}),
+        ("/albums/", {"limit": 50}), ("/albums/1", {}), ("/genres/", {}), ("/tags/", {}), ("/artists/", {}), ("/locations/", {}),
+        ("/albums/check-duplicate", {"title": "Summer Night", "artist_names": ["Miles Davis"], "upc_ean": "8712345678906"}),
+    ]
+    for filter_mode, q in [("all", "night"), ("title", "summer"), ("artist", "davis"), ("genre", "rock"),
+                           ("genre", "rock and jazz"), ("genre", "rock or jazz"), ("tag", '"live"'),
+                           ("track", "river"), ("media_type", "sacd")]:
+        reads.append(("/search", {"q": q, "filter": filter_mode, "status": "collection"}))
+    reads.append(("/search/facets", {}))
+    reads.append(("/search/facets", {"q": "night", "genre": [1], "media_type": ["CD"]}))
+    for path, params in reads:
+        step(f"GET {path}")
+        response = client.get(path, params=params)
+        if response.status_code >= 500:
+            raise RuntimeError(f"GET {path} failed with {response.status_code}")
+
+    step("POST /albums/")
+    created = client.post("/albums/", json={"title": "Plan Album", "artist_names": ["Plan Artist"], "genre_names": ["Jazz"]}).json()
+    step("PUT /albums/{album_id}")
+    client.put(f"/albums/{created['id']}", json={"year": 2001, "tag_ids": [1]})
+    step("PATCH /albums/bulk")
+    client.patch("/albums/bulk", json={"album_ids": list(range(1, 201)), "add_tag_ids": [2], "remove_genre_ids": [1], "add_artist_ids": [1], "location_id": 1})
+    for kind in ("artists", "genres", "tags"):
+        step(f"POST /maintenance/cleanup/{kind}")
+        client.post(f"/maintenance/cleanup/{kind}")
+    step("POST /maintenance/cleanup/tags (ids)")
+    client.post("/maintenance/cleanup/tags", json={"ids": [20]})
+    step("POST /maintenance/pull-covers")
+    client.post("/maintenance/pull-covers")
+    step("GET /export")
+    client.get("/export")
+    step("POST /albums/bulk/archive")
+    client.post("/albums/bulk/archive", json={"album_ids": list(range(301, 341))})
+    step("GET /albums/archived")
+    client.get("/albums/archived", params={"limit": 20})
+    step("POST /albums/bulk/restore")
+    client.post("/albums/bulk/restore", json={"album_ids": list(range(301, 311))})
+    step("DELETE /albums/{album_id}")
+    client.delete(f"/albums/{created['id']}")
+    step("POST /maintenance/purge-archived")
+    client.post("/maintenance/purge-archived", params={"older_than_days": 0})
+    step("GET /changes")
+    token = client.get("/changes").json()["token"]
+    client.get("/changes", params={"since": token.split(":")[0] + ":0"})
+
+def run(albums: int = 2000, seed: int = 42) -> Tuple[List[CapturedStatement], List[str]]:
+    # DATA_DIR must point at a scratch directory before the app (and its engine) is imported
+    data_dir = tempfile.mkdtemp(prefix="discvault-plans-")
+    os.environ["DATA_DIR"] = data_dir
+    (Path(data_dir) / "covers").mkdir(parents=True, exist_ok=True)
+    try:
+        from fastapi.testclient import TestClient
+        from sqlmodel import Session
+        from .synthetic import generate_collection
+        from .database import engine, create_db_and_tables
+        from .main import app
+
+        create_db_and_tables()
+        generate_collection(engine, albums=albums, seed=seed)
+
+        recorder = StatementRecorder()
+        recorder.attach(engine)
+        try:
+            with TestClient(app) as client:
+                exercise(recorder, client, lambda: Session(engine))
+        finally:
+            recorder.detach(engine)
+        analysed = analyse(engine, recorder.statements)
+        failures = check_expectations(recorder.statements)
+        engine.dispose()
+        return analysed, failures
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN regression checks")
+    parser.add_argument("--albums", type=int, default=2000, help="Size of the seeded collection")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="Print the plan of every statement")
+    args = parser.parse_args(argv)
+
+    statements, failures = run(args.albums, args.seed)
+    violations = [s for s in statements if s.violations]
+    for s in statements:
+        if not (args.verbose or s.violations):
+            continue
+        print(f"\n-- {', '.join(s.sources)}")
+        print("   " + " ".join(s.sql.split()))
+        for detail in s.plan:
+            print(f"     {detail}")
+        for detail in s.violations:
+            print(f"   ! {detail}")
+        if args.verbose:
+            for detail in s.allowed:
+                print(f"   ~ {detail}")
+    for failure in failures:
+        print(f"\n! {failure}")
+
+    print(f"\n{len(statements)} statements checked, {len(violations)} with unexpected scans, {len(failures)} index expectation(s) failed")
+    return 1 if violations or failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Scan sessions: a continuous stream of barcodes in, results out as soon as each is known.
+
+Every barcode gets an immediate local answer (GTIN checksum and duplicates by the indexed
+barcode_key), then its MusicBrainz lookup runs in the background. Lookups overlap up to
+LOOKUP_CONCURRENCY at a time while services keeps the actual API calls within the rate
+limit, so the next disc can be scanned while earlier ones are still being looked up.
+Results carry the seq of the barcode they belong to and may arrive out of order.
+"""
+import asyncio
+import itertools
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlmodel import Session
+
+from . import crud, services
+from .database import run_in_session
+from .monitoring import registry
+
+LOOKUP_CONCURRENCY = 4
+GTIN_FORMATS = {8: "EAN-8", 12: "UPC-A", 13: "EAN-13", 14: "GTIN-14"}
+
+scans = registry.counter("discvault_scans_total", "Barcodes received in scan sessions, by outcome.", ("outcome",))
+
+def gtin_check_digit(body: str) -> int:
+    # GS1: weights 3 and 1 alternate from the rightmost digit of the body
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return (10 - total % 10) % 10
+
+def validate_barcode(raw: str) -> Dict:
+    """
+    Checks an EAN-8, UPC-A, EAN-13 or GTIN-14 locally. Spaces and dashes are ignored.
+    """
+    code = "".join(c for c in raw if c not in " -")
+    result = {"barcode": code, "valid": False, "format": GTIN_FORMATS.get(len(code)), "error": None}
+    if not code.isdigit():
+        result["error"] = "Barcode may only contain digits"
+    elif result["format"] is None:
+        result["error"] = f"Unexpected length {len(code)} (expected 8, 12, 13 or 14 digits)"
+    elif gtin_check_digit(code[:-1]) != int(code[-1]):
+        result["error"] = f"Check digit should be {gtin_check_digit(code[:-1])}"
+    else:
+        result["valid"] = True
+    return result
+
+def _summaries(albums) -> List[Dict]:
+    return [{"id": a.id, "title": a.title, "artists": [ar.name for ar in a.artists], "status": a.status} for a in albums]
+
+def find_duplicates(session: Session, barcode: str, title: Optional[str] = None, artist_names: Optional[List[str]] = None) -> List[Dict]:
+    return _summaries(crud.check_duplicate_album(session, title=title or "", artist_names=artist_names or [], upc_ean=barcode))
+
+def parse_message(message: str) -> Dict:
+    """
+    A message is a JSON object ({"barcode": ...} or {"type": "done"}) or plain text with
+    one or more barcodes, as a keyboard-wedge scanner sends them.
+    """
+    message = message.strip()
+    if message.startswith("{"):
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return {"type": "error", "error": "Invalid JSON"}
+        if data.get("type") == "done":
+            return {"type": "done"}
+        return {"type": "barcodes", "barcodes": [str(data.get("barcode") or "")]}
+    if message.lower() == "done":
+        return {"type": "done"}
+    return {"type": "barcodes", "barcodes": message.split()}
+
+class ScanSession:
+    def __init__(self, concurrency: int = LOOKUP_CONCURRENCY):
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._seq = itertools.count(1)
+        self._seen: Dict[str, int] = {}
+        self.counts = {"scanned": 0, "invalid": 0, "repeated": 0, "duplicates": 0, "found": 0, "not_found": 0}
+
+    def submit(self, raw: str):
+        seq = next(self._seq)
+        self.counts["scanned"] += 1
+        check = validate_barcode(raw)
+        message = {"type": "scanned", "seq": seq, **check}
+        if not check["valid"]:
+            self.counts["invalid"] += 1
+            scans.inc(outcome="invalid")
+            self.outbox.put_nowait(message)
+            return
+        # The same disc scanned twice in one session is answered by the first scan
+        first = self._seen.get(check["barcode"])
+        if first is not None:
+            self.counts["repeated"] += 1
+            scans.inc(outcome="repeated")
+            self.outbox.put_nowait({**message, "repeat_of": first})
+            return
+        self._seen[check["barcode"]] = seq
+        scans.inc(outcome="accepted")
+        self.outbox.put_nowait(message)
+        task = asyncio.create_task(self._process(seq, check["barcode"]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, seq: int, barcode: str):
+        try:
+            duplicates = await run_in_session(find_duplicates, barcode)
+            if duplicates:
+                self.counts["duplicates"] += 1
+            self.outbox.put_nowait({"type": "duplicates", "seq": seq, "barcode": barcode, "duplicates": duplicates})
+
+            async with self._semaphore:
+                result = await services.lookup_musicbrainz_by_barcode(barcode)
+            if result:
+                self.counts["found"] += 1
+                # Without a barcode match the same release may still be in the collection under another pressing
+                if not duplicates and result.get("title"):
+                    duplicates = await run_in_session(find_duplicates, barcode, result["title"], result.get("artists"))
+            else:
+                self.counts["not_found"] += 1
+            self.outbox.put_nowait({"type": "lookup", "seq": seq, "barcode": barcode, "found": bool(result),
+                                    "result": result, "duplicates": duplicates})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.outbox.put_nowait({"type": "error", "seq": seq, "barcode": barcode, "error": str(e)})
+
+    async def drain(self):
+        # Waits for every lookup submitted so far, then reports the session totals
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        self.outbox.put_nowait({"type": "done", **self.counts})
+
+    async def pump(self, send: Callable[[Dict], Awaitable[None]]):
+        # The only writer to the socket, so concurrent lookups never interleave frames
+        while True:
+            await send(await self.outbox.get())
+
+    def close(self):
+        for task in list(self._tasks):
+            task.cancel()
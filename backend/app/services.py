@@ -1,10 +1,101 @@
+import asyncio
 import httpx
-from typing import Optional, Dict, Any
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
 
-MUSICBRAINZ_API = "https://musicbrainz.org/ws/2"
+from . import mbstore
+from .database import run_blocking
+from .monitoring import cache_requests, musicbrainz_requests, musicbrainz_latency
+
+logger = logging.getLogger(__name__)
+
+MUSICBRAINZ_API = os.getenv("MUSICBRAINZ_API", "https://musicbrainz.org/ws/2")
+# With an offline store in place the live API can be switched off entirely
+MUSICBRAINZ_OFFLINE = os.getenv("DISCVAULT_MB_OFFLINE", "0").lower() in ("1", "true", "yes")
 USER_AGENT = "DiscVault/0.1.0 ( https://github.com/eric/discvault )"
+# MusicBrainz allows one request per second per client; 0 disables the spacing (e.g. against a local mirror)
+MUSICBRAINZ_RATE = float(os.getenv("DISCVAULT_MB_RATE", "1.0"))
+
+# Successful barcode lookups are kept for a while: scanning, the duplicate check and a
+# later sync typically ask for the same barcode within minutes.
+LOOKUP_CACHE_SIZE = 512
+LOOKUP_CACHE_TTL = 3600
+_lookup_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def _cache_get(barcode: str) -> Optional[Dict[str, Any]]:
+    entry = _lookup_cache.get(barcode)
+    if entry and entry[0] > time.monotonic():
+        _lookup_cache.move_to_end(barcode)
+        cache_requests.inc(cache="musicbrainz", result="hit")
+        return entry[1]
+    if entry:
+        del _lookup_cache[barcode]
+    cache_requests.inc(cache="musicbrainz", result="miss")
+    return None
+
+def _cache_put(barcode: str, result: Dict[str, Any]):
+    _lookup_cache[barcode] = (time.monotonic() + LOOKUP_CACHE_TTL, result)
+    _lookup_cache.move_to_end(barcode)
+    while len(_lookup_cache) > LOOKUP_CACHE_SIZE:
+        _lookup_cache.popitem(last=False)
+
+class RequestSpacing:
+    """
+    Spaces calls at least interval seconds apart. Each caller reserves the next free slot
+    before sleeping, so concurrent lookups queue up in order instead of bursting.
+    """
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+_spacing = RequestSpacing(MUSICBRAINZ_RATE)
+
+async def _mb_get(client: httpx.AsyncClient, endpoint: str, url: str, params: Dict[str, Any], headers: Dict[str, str]) -> httpx.Response:
+    await _spacing.wait()
+    start = time.perf_counter()
+    try:
+        response = await client.get(url, params=params, headers=headers)
+    except httpx.RequestError:
+        musicbrainz_requests.inc(endpoint=endpoint, outcome="error")
+        raise
+    finally:
+        musicbrainz_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+    musicbrainz_requests.inc(endpoint=endpoint, outcome="ok" if response.status_code == 200 else f"http_{response.status_code}")
+    return response
+
+def _local_lookup(barcode: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    return mbstore.store.by_barcode(barcode), mbstore.store.available()
 
 async def lookup_musicbrainz_by_barcode(barcode: str) -> Optional[Dict[str, Any]]:
+    cached = _cache_get(barcode)
+    if cached is not None:
+        return cached
+    # The offline store answers from one indexed read; only misses go to the live API.
+    # It's a synchronous SQLite query, so it runs on the blocking executor.
+    local, available = await run_blocking(_local_lookup, barcode)
+    if available:
+        cache_requests.inc(cache="mbstore", result="hit" if local else "miss")
+    if local:
+        local["barcode"] = barcode
+        return local
+    if MUSICBRAINZ_OFFLINE:
+        return None
+    result = await _lookup_musicbrainz_by_barcode(barcode)
+    if result:
+        _cache_put(barcode, result)
+    return result
+
+async def _lookup_musicbrainz_by_barcode(barcode: str) -> Optional[Dict[str, Any]]:
     # we use 'barcode' filter in release query
     # added inc=tags to get genres
     url = f"{MUSICBRAINZ_API}/release/"
@@ -16,7 +107,7 @@ async def lookup_musicbrainz_by_barcode(barcode: str) -> Optional[Dict[str, Any]
     
     async with httpx.AsyncClient(timeout=10.0) as client:
         try:
-            response = await client.get(url, params=params, headers=headers)
+            response = await _mb_get(client, "search", url, params, headers)
             if response.status_code != 200:
                 return None
             
@@ -39,44 +130,19 @@ async def lookup_musicbrainz_by_barcode(barcode: str) -> Optional[Dict[str, Any]
                 try:
                     detail_url = f"{MUSICBRAINZ_API}/release/{mbid}"
                     detail_params = {"inc": "recordings+media+tags+release-groups", "fmt": "json"}
-                    detail_res = await client.get(detail_url, params=detail_params, headers=headers)
+                    detail_res = await _mb_get(client, "release", detail_url, detail_params, headers)
                     if detail_res.status_code == 200:
                         detail_data = detail_res.json()
                         
                         # 1. Genres from release-group or release tags
-                        tags = detail_data.get("tags", [])
-                        if not tags:
-                            tags = detail_data.get("release-group", {}).get("tags", [])
-                        
-                        if tags:
-                            tags.sort(key=lambda x: x.get("count", 0), reverse=True)
-                            genres = [t.get("name").title() for t in tags[:5]]
-                        
+                        genres = mbstore.top_genres(detail_data)
                         # 2. Tracks from media (discs)
-                        media_list = detail_data.get("media", [])
-                        for i, media in enumerate(media_list):
-                            disc_no = i + 1
-                            disc_format = media.get("format", f"Disc {disc_no}")
-                            for track in media.get("tracks", []):
-                                duration_ms = track.get("length")
-                                duration_str = None
-                                if duration_ms:
-                                    s = duration_ms // 1000
-                                    m, s = divmod(s, 60)
-                                    duration_str = f"{m}:{s:02d}"
-                                
-                                tracks.append({
-                                    "track_no": int(track.get("number", "0")),
-                                    "title": track.get("recording", {}).get("title") or track.get("title"),
-                                    "duration": duration_str,
-                                    "disc_no": disc_no,
-                                    "disc_name": disc_format
-                                })
+                        tracks = mbstore.media_tracks(detail_data.get("media", []))
                 except Exception as e:
-                    print(f"Error fetching MB details: {e}")
+                    logger.error(f"Error fetching MB details: {e}")
 
             # Check Cover Art Archive 
-            cover_url = f"https://coverartarchive.org/release/{mbid}/front-250" if mbid else None
+            cover_url = mbstore.cover_art_url(mbid)
 
             # Map MB data to our internal format
             result = {
@@ -92,5 +158,5 @@ async def lookup_musicbrainz_by_barcode(barcode: str) -> Optional[Dict[str, Any]
             }
             return result
         except httpx.RequestError as e:
-            print(f"Network error during MusicBrainz lookup: {e}")
+            logger.error(f"Network error during MusicBrainz lookup: {e}")
             return None
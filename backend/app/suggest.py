@@ -0,0 +1,154 @@
+"""
+In-memory prefix index for typeahead on artist, genre and tag names.
+
+Per kind, every name is indexed under its normalised form and under each later word
+("pink floyd" and "floyd"), in one sorted list. A prefix query is two bisects for the
+matching range, and the best matches by album count are picked from that range, so a
+suggestion never touches SQLite once the index is built.
+
+Like the facet index it is built lazily and kept current through crud's change listeners:
+renamed, added or deleted names are patched into the sorted list, and album writes, which
+only change usage counts, mark the counts for a recount on the next query.
+"""
+import heapq
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlmodel import Session, func, select
+
+from . import utils
+from .models import Artist, Genre, Tag, AlbumArtistLink, AlbumGenreLink, AlbumTagLink
+
+KINDS = {
+    "artists": (Artist, AlbumArtistLink, AlbumArtistLink.artist_id),
+    "genres": (Genre, AlbumGenreLink, AlbumGenreLink.genre_id),
+    "tags": (Tag, AlbumTagLink, AlbumTagLink.tag_id),
+}
+MAX_LIMIT = 50
+SHORT_PREFIX = 2
+# Larger changes (imports, merges) rebuild the kind instead of patching it
+MAX_PATCH = 500
+
+def _keys(name: str) -> List[Tuple[str, bool]]:
+    # The normalised name and every tail starting at a later word, flagged as such
+    words = utils.normalize_text(name).split()
+    return [(" ".join(words[start:]), start > 0) for start in range(len(words))]
+
+class PrefixIndex:
+    def __init__(self, names: List[Tuple[int, str]]):
+        self.ids: List[Optional[int]] = []
+        self.names: List[Optional[str]] = []
+        self.positions: Dict[int, int] = {}
+        self.keyed: List[Tuple[str, bool, int]] = []
+        for item_id, name in names:
+            position = self._append(item_id, name)
+            self.keyed.extend((key, later_word, position) for key, later_word in _keys(name))
+        self.keyed.sort()
+        self.set_counts({})
+
+    def _append(self, item_id: int, name: str) -> int:
+        self.positions[item_id] = len(self.ids)
+        self.ids.append(item_id)
+        self.names.append(name)
+        return len(self.ids) - 1
+
+    def patch(self, names: Dict[int, Optional[str]]):
+        """
+        Applies renamed, added and (name None) removed entries without resorting everything.
+        Counts of new entries are 0 until the next set_counts.
+        """
+        for item_id, name in names.items():
+            position = self.positions.pop(item_id, None)
+            if position is not None:
+                for key, later_word in _keys(self.names[position]):
+                    i = bisect_left(self.keyed, (key, later_word, position))
+                    if i < len(self.keyed) and self.keyed[i] == (key, later_word, position):
+                        del self.keyed[i]
+                self.ids[position] = self.names[position] = None
+            if name:
+                position = self._append(item_id, name)
+                self.counts.append(0)
+                for key, later_word in _keys(name):
+                    insort(self.keyed, (key, later_word, position))
+
+    def set_counts(self, counts: Dict[int, int]):
+        # Album counts per id; only these change on album writes, the sorted keys stay
+        self.counts = [counts.get(item_id, 0) for item_id in self.ids]
+        self.by_count = sorted((p for p, item_id in enumerate(self.ids) if item_id is not None), key=self._rank)
+        self._short: Dict[str, List[int]] = {}
+
+    def _rank(self, position: int, later_word: bool = False):
+        return (-self.counts[position], later_word, self.names[position].casefold())
+
+    def _matches(self, prefix: str, limit: int) -> List[int]:
+        lo = bisect_left(self.keyed, (prefix,))
+        hi = bisect_left(self.keyed, (prefix + "\uffff",), lo)
+        # A name can match on several words; keep its best (name-start) match
+        best: Dict[int, bool] = {}
+        for _, later_word, position in self.keyed[lo:hi]:
+            best[position] = best.get(position, True) and later_word
+        return heapq.nsmallest(limit, best, key=lambda p: self._rank(p, best[p]))
+
+    def search(self, prefix: str, limit: int) -> List[Dict]:
+        normalised = utils.normalize_text(prefix)
+        if not normalised:
+            # Only an empty query lists the most used names; punctuation alone matches nothing
+            if prefix.strip():
+                return []
+            positions = self.by_count[:limit]
+        elif len(normalised) <= SHORT_PREFIX:
+            # One or two letters match a large part of the index; remember their ranking
+            if normalised not in self._short:
+                self._short[normalised] = self._matches(normalised, MAX_LIMIT)
+            positions = self._short[normalised][:limit]
+        else:
+            positions = self._matches(normalised, limit)
+        return [{"id": self.ids[p], "name": self.names[p], "count": self.counts[p]} for p in positions]
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, PrefixIndex] = {}
+        self._stale_counts = set()
+
+    def _counts(self, session: Session, kind: str) -> Dict[int, int]:
+        _, link_model, column = KINDS[kind]
+        return dict(session.exec(select(column, func.count(link_model.album_id)).group_by(column)).all())
+
+    def suggest(self, session: Session, kind: str, prefix: str, limit: int = 10) -> List[Dict]:
+        with self._lock:
+            index = self._indexes.get(kind)
+            if index is None:
+                model = KINDS[kind][0]
+                index = self._indexes[kind] = PrefixIndex([row for row in session.exec(select(model.id, model.name)).all() if row[1]])
+                self._stale_counts.add(kind)
+            if kind in self._stale_counts:
+                index.set_counts(self._counts(session, kind))
+                self._stale_counts.discard(kind)
+            return index.search(prefix, limit)
+
+    def on_change(self, session: Session, kind: str, ids: Optional[List[int]]):
+        # crud change listener: patch changed names of that kind; album writes only change counts
+        if kind in KINDS:
+            with self._lock:
+                index = self._indexes.get(kind)
+                if index is None:
+                    return
+                if ids is None or len(ids) > MAX_PATCH:
+                    del self._indexes[kind]
+                    return
+                model = KINDS[kind][0]
+                names = dict.fromkeys(ids)
+                names.update(session.exec(select(model.id, model.name).where(model.id.in_(ids))).all())
+                index.patch(names)
+                self._stale_counts.add(kind)
+        elif kind == "albums":
+            with self._lock:
+                self._stale_counts.update(KINDS)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {kind: {"names": len(index.positions), "keys": len(index.keyed)} for kind, index in self._indexes.items()}
+
+index = SuggestIndex()
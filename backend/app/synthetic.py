@@ -0,0 +1,247 @@
+"""
+Deterministic synthetic collections for benchmarks, query-plan checks and load tests.
+
+The same seed and size always produce the same rows, so timings from different
+branches are measured against identical data.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator
+
+from sqlalchemy import insert
+from sqlmodel import SQLModel
+
+from .utils import parse_duration
+from .models import Album, Artist, Genre, Tag, Location, Track, AlbumArtistLink, AlbumGenreLink, AlbumTagLink
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+GENRES = [
+    "Rock", "Pop", "Jazz", "Blues", "Classical", "Opera", "Soul", "Funk", "Disco", "Hip Hop",
+    "Electronic", "House", "Techno", "Ambient", "Folk", "Country", "Bluegrass", "Reggae", "Ska", "Punk",
+    "Post-Punk", "New Wave", "Metal", "Heavy Metal", "Thrash Metal", "Hard Rock", "Progressive Rock",
+    "Psychedelic Rock", "Indie Rock", "Alternative Rock", "Grunge", "Britpop", "Shoegaze", "Trip Hop",
+    "Drum And Bass", "Dubstep", "R&B", "Gospel", "Latin", "Bossa Nova", "Salsa", "Afrobeat", "World",
+    "Chanson", "Nederpop", "Singer-Songwriter", "Soundtrack", "Musical", "Baroque", "Romantic",
+    "Minimalism", "Fusion", "Bebop", "Swing", "Big Band", "Easy Listening", "Lounge", "Synthpop",
+    "Krautrock", "Americana",
+]
+
+TAGS = [
+    ("Favoriet", "#ef4444"), ("Gesigneerd", "#f59e0b"), ("Eerste persing", "#10b981"),
+    ("Remaster", "#3b82f6"), ("Live", "#8b5cf6"), ("Compilatie", "#ec4899"), ("Import", "#14b8a6"),
+    ("Gelimiteerd", "#f97316"), ("Box set", "#6366f1"), ("Uitleen", "#84cc16"), ("Te koop", "#64748b"),
+    ("Beschadigd", "#dc2626"), ("Cadeau", "#d946ef"), ("Soundtrack", "#0ea5e9"), ("Vinyl rip", "#a3a3a3"),
+    ("Japanse persing", "#e11d48"), ("Deluxe", "#7c3aed"), ("Promo", "#059669"), ("SACD laag", "#2563eb"),
+    ("Nog luisteren", "#ca8a04"),
+]
+
+FIRST_NAMES = [
+    "John", "Paul", "Miles", "Nina", "Ella", "David", "Joni", "Bob", "Aretha", "Herman", "Anouk",
+    "Kate", "Leonard", "Björk", "Thom", "Marvin", "Stevie", "Billie", "Frank", "Patti", "Iggy",
+    "Lou", "Johnny", "Dolly", "Willie", "Ray", "Sade", "Ennio", "Hans", "Arvo", "Glenn", "Keith",
+    "Chet", "Wes", "Sonny", "Dexter", "Tom", "Neil", "Carole", "Brian",
+]
+LAST_NAMES = [
+    "Davis", "Simone", "Fitzgerald", "Bowie", "Mitchell", "Dylan", "Franklin", "Brood", "Bush",
+    "Cohen", "Yorke", "Gaye", "Wonder", "Holiday", "Zappa", "Smith", "Pop", "Reed", "Cash", "Parton",
+    "Nelson", "Charles", "Adu", "Morricone", "Zimmer", "Pärt", "Gould", "Jarrett", "Baker",
+    "Montgomery", "Rollins", "Gordon", "Waits", "Young", "King", "Eno", "van Veen", "de Jong",
+    "Jansen", "Bakker",
+]
+BAND_ADJECTIVES = [
+    "Black", "Silver", "Electric", "Velvet", "Golden", "Broken", "Crystal", "Midnight", "Neon",
+    "Rolling", "Flying", "Wild", "Quiet", "Burning", "Frozen", "Hollow", "Royal", "Red", "Blue", "Iron",
+]
+BAND_NOUNS = [
+    "Stones", "Keys", "Owls", "Wolves", "Machines", "Echoes", "Horses", "Sparrows", "Lights", "Rivers",
+    "Mirrors", "Pilots", "Tigers", "Ghosts", "Harbours", "Satellites", "Pianos", "Saints", "Engines", "Clouds",
+]
+TITLE_WORDS = [
+    "Night", "Summer", "Love", "River", "Dream", "Heart", "Fire", "Rain", "Moon", "Road", "Blue",
+    "Kind", "Highway", "Garden", "Winter", "Light", "Shadow", "Ocean", "City", "Song", "Story", "Time",
+    "Home", "Storm", "Silence", "Paradise", "Morning", "Dance", "Machine", "Echo", "Glass", "Golden",
+    "Wild", "Lonely", "Secret", "Electric", "Hollow", "Northern", "Southern", "Endless",
+]
+TITLE_SUFFIXES = ["", "", "", "", " (Remastered)", " (Deluxe Edition)", " (Live)", " - 2009 Remaster", " Vol. 2"]
+MEDIA_TYPES = [("CD", 70), ("Vinyl", 10), ("SACD", 5), ("CD-Single", 4), ("Digital", 4), ("CD-R", 2),
+               ("Blu-ray Audio", 2), ("DVD Audio", 2), ("Blu-ray Video", 1)]
+STORAGE_TYPES = ["Kast", "Rek", "Doos", "Lade"]
+LABEL_PREFIXES = ["EMI", "CBS", "SONY", "ECM", "BN", "DG", "WB", "RCA", "ATL", "ISL"]
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    if value in SIZES:
+        return SIZES[value]
+    if value.endswith("k"):
+        return int(float(value[:-1]) * 1000)
+    return int(value)
+
+def ean13(rng: random.Random) -> str:
+    digits = [rng.randint(0, 9) for _ in range(12)]
+    checksum = (10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return "".join(map(str, digits)) + str(checksum)
+
+def _chunks(rows, size: int = 5000):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def _insert(conn, table, rows):
+    for chunk in _chunks(rows):
+        conn.execute(insert(table), chunk)
+
+def _artist_name(rng: random.Random, i: int) -> str:
+    if rng.random() < 0.45:
+        name = f"The {rng.choice(BAND_ADJECTIVES)} {rng.choice(BAND_NOUNS)}"
+    else:
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    # Keep names unique but realistic-looking once the combinations run out
+    return name if i < 600 else f"{name} {i // 600 + 1}"
+
+def _album_title(rng: random.Random) -> str:
+    words = rng.sample(TITLE_WORDS, rng.choice([1, 2, 2, 3]))
+    prefix = "The " if rng.random() < 0.15 else ""
+    return prefix + " ".join(words) + rng.choice(TITLE_SUFFIXES)
+
+def _duration(rng: random.Random) -> str:
+    seconds = int(rng.gauss(250, 80))
+    seconds = min(max(seconds, 45), 1500)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def generate_collection(engine, albums: int = 1000, seed: int = 42) -> Dict[str, int]:
+    """
+    Fills the (empty) database behind engine with a deterministic collection of the given size.
+    Returns row counts per table.
+    """
+    rng = random.Random(seed)
+    SQLModel.metadata.create_all(engine)
+
+    artist_count = max(50, int(albums * 0.4))
+    location_count = max(5, albums // 200)
+    media_choices = [m for m, weight in MEDIA_TYPES for _ in range(weight)]
+    base_date = datetime(2020, 1, 1)
+
+    location_rows = [{
+        "id": i + 1,
+        "name": f"{rng.choice(STORAGE_TYPES)} {i + 1}",
+        "storage_type": rng.choice(STORAGE_TYPES),
+        "section": rng.choice(["A", "B", "C", "D", None]),
+        "shelf": str(rng.randint(1, 8)),
+        "position": str(rng.randint(1, 40)) if rng.random() < 0.5 else None,
+    } for i in range(location_count)]
+    genre_rows = [{"id": i + 1, "name": name} for i, name in enumerate(GENRES)]
+    tag_rows = [{"id": i + 1, "name": name, "color": color} for i, (name, color) in enumerate(TAGS)]
+    artist_rows = [{"id": i + 1, "name": _artist_name(rng, i)} for i in range(artist_count)]
+
+    album_rows, artist_links, genre_links, tag_links, track_rows = [], [], [], [], []
+    # Popularity skew: a few artists, genres and tags carry most of the collection
+    artist_weights = [1 / (i + 1) ** 0.8 for i in range(artist_count)]
+    genre_weights = [1 / (i + 1) for i in range(len(GENRES))]
+    tag_weights = [1 / (i + 1) for i in range(len(TAGS))]
+    track_id = 1
+
+    for album_id in range(1, albums + 1):
+        created = base_date + timedelta(minutes=album_id * 7 + rng.randint(0, 6))
+        album_rows.append({
+            "id": album_id,
+            "title": _album_title(rng),
+            "year": rng.randint(1955, 2024) if rng.random() < 0.92 else None,
+            "upc_ean": ean13(rng) if rng.random() < 0.8 else None,
+            "catalog_no": f"{rng.choice(LABEL_PREFIXES)} {rng.randint(1000, 99999)}" if rng.random() < 0.7 else None,
+            "spars_code": rng.choice(["DDD", "ADD", "AAD", None, None]),
+            "cover_url": f"/covers/album_{album_id}.jpg" if rng.random() < 0.75 else None,
+            "media_type": rng.choice(media_choices),
+            "notes": rng.choice([None, None, None, "Hoes licht beschadigd", "Gekocht op platenbeurs", "Japanse import met obi"]),
+            "created_at": created,
+            "updated_at": created,
+            "archived_at": None,
+            "location_id": rng.randint(1, location_count) if rng.random() < 0.85 else None,
+            "status": "wishlist" if rng.random() < 0.1 else "collection",
+        })
+
+        for artist_id in set(rng.choices(range(1, artist_count + 1), weights=artist_weights, k=rng.choice([1, 1, 1, 1, 2, 3]))):
+            artist_links.append({"album_id": album_id, "artist_id": artist_id, "role": "Main"})
+        for genre_id in set(rng.choices(range(1, len(GENRES) + 1), weights=genre_weights, k=rng.choice([1, 1, 2, 3]))):
+            genre_links.append({"album_id": album_id, "genre_id": genre_id})
+        for tag_id in set(rng.choices(range(1, len(TAGS) + 1), weights=tag_weights, k=rng.choice([0, 0, 1, 1, 2, 3]))):
+            tag_links.append({"album_id": album_id, "tag_id": tag_id})
+
+        roll = rng.random()
+        discs = 1 if roll < 0.85 else (2 if roll < 0.97 else rng.randint(3, 6))
+        if rng.random() < 0.05:
+            discs = 0  # Albums without tracklist show up in the "missing tracks" report
+        runtime = None
+        for disc_no in range(1, discs + 1):
+            for track_no in range(1, rng.randint(8, 18) + 1):
+                duration = _duration(rng) if rng.random() < 0.95 else None
+                duration_ms = parse_duration(duration)
+                track_rows.append({
+                    "id": track_id,
+                    "album_id": album_id,
+                    "track_no": track_no,
+                    "title": " ".join(rng.sample(TITLE_WORDS, rng.choice([1, 2, 3]))),
+                    "duration": duration,
+                    "duration_ms": duration_ms,
+                    "disc_no": disc_no,
+                    "disc_name": f"CD {disc_no}" if discs > 1 else None,
+                })
+                if duration_ms is not None:
+                    runtime = (runtime or 0) + duration_ms
+                track_id += 1
+        album_rows[-1]["runtime_ms"] = runtime
+
+    with engine.begin() as conn:
+        _insert(conn, Location.__table__, location_rows)
+        _insert(conn, Genre.__table__, genre_rows)
+        _insert(conn, Tag.__table__, tag_rows)
+        _insert(conn, Artist.__table__, artist_rows)
+        _insert(conn, Album.__table__, album_rows)
+        _insert(conn, AlbumArtistLink.__table__, artist_links)
+        _insert(conn, AlbumGenreLink.__table__, genre_links)
+        _insert(conn, AlbumTagLink.__table__, tag_links)
+        _insert(conn, Track.__table__, track_rows)
+
+    return {
+        "albums": len(album_rows),
+        "artists": len(artist_rows),
+        "genres": len(genre_rows),
+        "tags": len(tag_rows),
+        "locations": len(location_rows),
+        "tracks": len(track_rows),
+        "album_artist_links": len(artist_links),
+        "album_genre_links": len(genre_links),
+        "album_tag_links": len(tag_links),
+    }
+
+def musicbrainz_releases(count: int = 1000, seed: int = 42) -> Iterator[Dict]:
+    """
+    Deterministic MusicBrainz-shaped releases (as in the JSON data dumps) for a stub
+    offline store: barcodes, label info, tags and media with tracks.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        mbid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        media = []
+        for disc_no in range(1, (1 if rng.random() < 0.9 else 2) + 1):
+            media.append({
+                "format": "CD",
+                "position": disc_no,
+                "tracks": [{
+                    "number": str(n),
+                    "position": n,
+                    "title": " ".join(rng.sample(TITLE_WORDS, rng.choice([1, 2, 3]))),
+                    "length": rng.randint(45, 900) * 1000,
+                } for n in range(1, rng.randint(8, 16) + 1)],
+            })
+        artist = _artist_name(rng, i)
+        yield {
+            "id": mbid,
+            "title": _album_title(rng),
+            "date": f"{rng.randint(1955, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "barcode": ean13(rng),
+            "artist-credit": [{"name": artist, "artist": {"name": artist}}],
+            "label-info": [{"catalog-number": f"{rng.choice(LABEL_PREFIXES)} {rng.randint(1000, 99999)}"}],
+            "tags": [{"name": name.lower(), "count": rng.randint(1, 20)} for name in rng.sample(GENRES, rng.randint(1, 3))],
+            "media": media,
+        }
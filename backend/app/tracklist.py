@@ -0,0 +1,312 @@
+"""
+Streaming tracklist parser for pasted text and uploaded files.
+
+Input is consumed line by line. The layout is decided once per file from a small sample:
+delimiter and column roles for CSV-like lists, or a per-line pattern for plain text
+("01. Title 3:45"). Disc headers ("CD2", "Disc 3: Live", "[Schijf 4]") and disc-prefixed
+numbers ("2-05") switch the disc, so box sets come out as one multi-disc tracklist.
+Cue sheets are recognised and parsed separately; parse_cue is shared with the disc-id import.
+"""
+import codecs
+import csv
+import io
+import re
+from collections import Counter
+from itertools import chain
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+SAMPLE_LINES = 50
+DELIMITERS = ["\t", ";", "|", ","]
+# How title columns are glued back together; titles split on an unquoted comma keep their comma
+TITLE_JOINERS = {",": ", ", ";": "; "}
+FRAMES_PER_SECOND = 75
+
+_DURATION = r"\d{1,3}:\d{2}(?::\d{2})?"
+DURATION_RE = re.compile(rf"^[\(\[]?\s*({_DURATION})\s*[\)\]]?$")
+TRACK_NO_RE = re.compile(r"^(?:(?i:track)\s*)?(?:(?:(\d{1,3})\s*[-./]\s*)?(\d{1,3})\.?|([A-Za-z])(\d{1,2}))$")
+DISC_HEADER_RE = re.compile(
+    r"^[\W_]*(?:cd|disc|disk|schijf|dvd|sacd|blu-?ray)\s*[-#:.]?\s*(\d{1,3})\b(?:\s*[-:–—.)\]]?\s*(.*?))?[\W_]*$",
+    re.IGNORECASE,
+)
+PLAIN_LINE_RE = re.compile(
+    rf"^(?:(?:(?i:track)\s+)?(?P<no>(?:\d{{1,3}}\s*[-./]\s*)?\d{{1,3}}|[A-Za-z]\d{{1,2}})(?:[.):]|\s+-)?\s+)?"
+    rf"(?P<title>.*?)"
+    rf"(?:\s*[-–—]?\s*[\(\[]?(?P<duration>{_DURATION})[\)\]]?)?\s*$"
+)
+# Only a real "TRACK 01 AUDIO" line makes a cue sheet; "Track 1, Intro, 3:00" is an ordinary list
+CUE_TRACK_RE = re.compile(r"^\s*TRACK\s+(\d+)\s+(AUDIO|MODE\S*|CDG|CDI\S*)\b", re.IGNORECASE)
+CUE_INDEX_RE = re.compile(r"^\s*INDEX\s+(\d+)\s+(\d+):(\d{2}):(\d{2})", re.IGNORECASE)
+
+def open_text(binary: IO[bytes], sample_size: int = 64 * 1024) -> IO[str]:
+    """
+    Wraps an uploaded binary file for line-by-line reading. UTF-8 (with or without BOM)
+    is assumed unless the first block doesn't decode, in which case Windows-1252 is used.
+    """
+    head = binary.read(sample_size)
+    binary.seek(0)
+    encoding = "utf-8-sig"
+    try:
+        # Trim a multi-byte character that may have been cut off at the sample boundary
+        codecs.getincrementaldecoder("utf-8-sig")().decode(head, final=False)
+    except UnicodeDecodeError:
+        encoding = "cp1252"
+    return io.TextIOWrapper(binary, encoding=encoding, errors="replace", newline=None)
+
+def _clean(line: str) -> str:
+    return line.strip().strip("\ufeff")
+
+def _is_comment(line: str) -> bool:
+    return line.startswith(("#", "//"))
+
+def _disc_header(line: str) -> Optional[Tuple[int, Optional[str]]]:
+    match = DISC_HEADER_RE.match(line)
+    if not match or DURATION_RE.search(line.split()[-1]):
+        return None
+    name = (match.group(2) or "").strip() or None
+    return int(match.group(1)), name
+
+def _track_no(value: str) -> Optional[Tuple[Optional[int], int]]:
+    match = TRACK_NO_RE.match(value.strip())
+    if not match:
+        return None
+    if match.group(2):
+        return (int(match.group(1)) if match.group(1) else None), int(match.group(2))
+    # Vinyl-style "A1", "B3": keep the position within the side
+    return None, int(match.group(4))
+
+def _position(value: str) -> Optional[Tuple[Optional[int], int]]:
+    # A track number, or any plain number in a column that holds the position
+    number = _track_no(value)
+    if number is None and value.strip().isdigit():
+        return None, int(value)
+    return number
+
+def _duration(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    match = DURATION_RE.match(value.strip())
+    return match.group(1) if match else None
+
+class Layout:
+    """
+    How data lines of one file are split: a delimiter with column roles, or plain text.
+    A negative duration_col counts from the end of each line ("<nr>, <title>, <duration>"
+    lists whose title may contain the delimiter).
+    """
+    def __init__(self, delimiter: Optional[str] = None, columns: int = 1, number_col: Optional[int] = None,
+                 duration_col: Optional[int] = None):
+        self.delimiter = delimiter
+        self.columns = columns
+        self.number_col = number_col
+        self.duration_col = duration_col
+
+def _split(line: str, delimiter: str) -> List[str]:
+    return next(csv.reader([line], delimiter=delimiter, skipinitialspace=True))
+
+def detect_layout(sample: List[str]) -> Layout:
+    data = [line for line in sample if not _disc_header(line)]
+    if not data:
+        return Layout()
+
+    # "<nr>, <title>, <duration>" first: the number and duration pin the title in between
+    for delimiter in DELIMITERS:
+        rows = [_split(line, delimiter) for line in data]
+        numbered = sum(1 for fields in rows if len(fields) >= 3 and _position(fields[0]) is not None
+                       and _duration(fields[-1]) is not None)
+        if numbered / len(data) >= 0.8:
+            return Layout(delimiter, 3, number_col=0, duration_col=-1)
+
+    best, best_score = None, 0.0
+    for delimiter in DELIMITERS:
+        counts = [len(_split(line, delimiter)) - 1 for line in data]
+        mode, hits = Counter(counts).most_common(1)[0]
+        score = hits / len(data)
+        if mode > 0 and score >= 0.6 and score > best_score:
+            best, best_score = (delimiter, mode + 1), score
+    if best is None:
+        return Layout()
+
+    delimiter, columns = best
+    rows = [fields for fields in (_split(line, delimiter) for line in data) if len(fields) >= columns]
+
+    def share(col, test):
+        return sum(1 for fields in rows if test(fields[col])) / len(rows) if rows else 0
+
+    number_col = next((c for c in range(columns) if share(c, lambda v: _track_no(v) is not None) >= 0.8), None)
+    duration_cols = [c for c in range(columns) if c != number_col and share(c, lambda v: _duration(v) is not None) >= 0.6]
+    duration_col = duration_cols[-1] if duration_cols else None
+    return Layout(delimiter, columns, number_col, duration_col)
+
+def _parse_delimited(line: str, layout: Layout) -> Optional[Dict]:
+    fields = [f.strip() for f in _split(line, layout.delimiter)]
+    joiner = TITLE_JOINERS.get(layout.delimiter, " - ")
+    if layout.duration_col is not None and layout.duration_col < 0:
+        # "<nr>, <title>, <duration>": whatever lies between number and duration is the title
+        number = _position(fields[0])
+        duration = _duration(fields[-1]) if len(fields) > 1 else None
+        rest = fields[1:] if number is not None else fields
+        title = joiner.join(f for f in (rest[:-1] if duration else rest) if f)
+        if not title and number is None:
+            return None
+        return {"number": number, "title": title, "duration": duration}
+
+    title_col = next((c for c in range(layout.columns) if c not in (layout.number_col, layout.duration_col)), None)
+    if len(fields) > layout.columns and title_col is not None:
+        # Unquoted delimiters inside a title: fold the surplus back into the title column
+        surplus = len(fields) - layout.columns
+        fields[title_col:title_col + surplus + 1] = [joiner.join(f for f in fields[title_col:title_col + surplus + 1] if f)]
+    number = _position(fields[layout.number_col]) if layout.number_col is not None and layout.number_col < len(fields) else None
+    duration = _duration(fields[layout.duration_col]) if layout.duration_col is not None and layout.duration_col < len(fields) else None
+    title = " - ".join(f for c, f in enumerate(fields) if c not in (layout.number_col, layout.duration_col) and f)
+    if not title and number is None:
+        return None
+    return {"number": number, "title": title, "duration": duration}
+
+def _parse_plain(line: str) -> Optional[Dict]:
+    match = PLAIN_LINE_RE.match(line)
+    if not match:
+        return None
+    number = _track_no(match.group("no")) if match.group("no") else None
+    return {"number": number, "title": match.group("title").strip(), "duration": match.group("duration")}
+
+def iter_tracks(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Yields track dicts (position, title, duration, disc_no, disc_name) from text lines.
+    """
+    lines = iter(lines)
+    sample: List[str] = []
+    for raw in lines:
+        line = _clean(raw)
+        if not line or _is_comment(line):
+            continue
+        sample.append(line)
+        if len(sample) >= SAMPLE_LINES:
+            break
+
+    if any(CUE_TRACK_RE.match(line) for line in sample):
+        yield from cue_tracks(parse_cue(chain(sample, lines)))
+        return
+
+    layout = detect_layout(sample)
+    disc_no, disc_name, position = 1, None, 0
+    for raw in chain(sample, lines):
+        line = _clean(raw)
+        if not line or _is_comment(line):
+            continue
+        header = _disc_header(line)
+        if header:
+            disc_no, disc_name = header
+            disc_name = disc_name or f"CD {disc_no}"
+            position = 0
+            continue
+        parsed = _parse_delimited(line, layout) if layout.delimiter and layout.delimiter in line else _parse_plain(line)
+        if not parsed:
+            continue
+        number = parsed["number"]
+        if number is not None:
+            if number[0] is not None and number[0] != disc_no:
+                # "2-05" style numbering switches disc without a header line
+                disc_no, disc_name = number[0], None
+            position = number[1]
+        else:
+            position += 1
+        yield {
+            "position": position,
+            "title": parsed["title"] or f"Track {position}",
+            "duration": parsed["duration"],
+            "disc_no": disc_no,
+            "disc_name": disc_name,
+        }
+
+def parse_tracklist(source: IO) -> List[Dict]:
+    """
+    Parses an uploaded (binary) or pasted (text) tracklist. Blocking; run it off the event loop.
+    """
+    if isinstance(source, io.TextIOBase):
+        return list(iter_tracks(source))
+    return list(iter_tracks(open_text(source)))
+
+# --- Cue sheets ---
+def _cue_value(line: str) -> str:
+    value = line.split(None, 1)[1] if len(line.split(None, 1)) > 1 else ""
+    value = value.strip()
+    if value.startswith('"'):
+        end = value.find('"', 1)
+        return value[1:end] if end > 0 else value[1:]
+    return value
+
+def parse_cue(lines: Iterable[str]) -> Dict:
+    """
+    Parses a cue sheet into album-level fields and a list of tracks. Each track has its
+    number, title, performer, file, disc_no (REM DISCNUMBER) and INDEX 01 offset in frames.
+    """
+    sheet: Dict = {"title": None, "performer": None, "catalog": None, "genre": None, "date": None, "files": [], "tracks": []}
+    current_file = None
+    disc_no = 1
+    track = None
+    for raw in lines:
+        line = _clean(raw)
+        if not line:
+            continue
+        keyword = line.split(None, 1)[0].upper()
+        if keyword == "FILE":
+            current_file = _cue_value(line.rsplit(None, 1)[0]) if line.count('"') >= 2 else line.split()[1]
+            sheet["files"].append(current_file)
+        elif keyword == "TRACK":
+            parts = line.split()
+            track = {"number": int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None,
+                     "type": parts[2].upper() if len(parts) > 2 else "AUDIO", "title": None,
+                     "performer": None, "file": current_file, "disc_no": disc_no, "index01": None}
+            # A malformed TRACK line still collects its TITLE/INDEX lines, but isn't a track
+            if track["number"] is not None:
+                sheet["tracks"].append(track)
+        elif keyword in ("TITLE", "PERFORMER"):
+            target = track if track is not None else sheet
+            target[keyword.lower()] = _cue_value(line)
+        elif keyword == "CATALOG":
+            sheet["catalog"] = _cue_value(line)
+        elif keyword == "INDEX" and track is not None:
+            match = CUE_INDEX_RE.match(line)
+            if match and int(match.group(1)) == 1:
+                minutes, seconds, frames = int(match.group(2)), int(match.group(3)), int(match.group(4))
+                track["index01"] = (minutes * 60 + seconds) * FRAMES_PER_SECOND + frames
+        elif keyword == "REM":
+            parts = line.split(None, 2)
+            if len(parts) == 3:
+                key = parts[1].upper()
+                if key == "DISCNUMBER" and parts[2].strip().isdigit():
+                    disc_no = int(parts[2].strip())
+                elif key in ("GENRE", "DATE") and track is None:
+                    sheet[key.lower()] = _cue_value(parts[1] + " " + parts[2])
+    return sheet
+
+def format_frames(frames: int) -> str:
+    seconds = round(frames / FRAMES_PER_SECOND)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def cue_tracks(sheet: Dict, total_frames: Optional[Dict[str, int]] = None) -> List[Dict]:
+    """
+    Converts a parsed cue sheet into tracklist dicts. Durations come from the distance between
+    INDEX 01 positions within the same file; the last track of a file needs its length in
+    frames (total_frames, keyed by file name) and is left empty otherwise.
+    """
+    tracks = [t for t in sheet["tracks"] if t["type"] == "AUDIO"]
+    result = []
+    for i, track in enumerate(tracks):
+        duration = None
+        following = tracks[i + 1] if i + 1 < len(tracks) else None
+        if track["index01"] is not None:
+            if following and following["file"] == track["file"] and following["index01"] is not None:
+                duration = format_frames(following["index01"] - track["index01"])
+            elif total_frames and track["file"] in total_frames:
+                duration = format_frames(total_frames[track["file"]] - track["index01"])
+        result.append({
+            "position": track["number"],
+            "title": track["title"] or f"Track {track['number']}",
+            "duration": duration,
+            "disc_no": track["disc_no"],
+            "disc_name": None,
+        })
+    return result
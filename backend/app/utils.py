@@ -1,10 +1,14 @@
-import csv
 import io
-import httpx
 import os
+import re
+import unicodedata
 from pathlib import Path
 from typing import List, Dict, Optional
 import logging
+import shutil
+
+from .database import run_blocking
+from .tracklist import iter_tracks
 
 logger = logging.getLogger(__name__)
 
@@ -16,15 +20,14 @@ async def download_image(url: str, dest_path: Path) -> Optional[str]:
     if not url or not url.startswith("http"):
         return None
         
+    # Imported here so offline tools that only need the text helpers stay fast to start
+    import httpx
     try:
         async with httpx.AsyncClient(timeout=30.0) as client:
             response = await client.get(url, follow_redirects=True)
             if response.status_code == 200:
-                # Ensure directory exists
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                with dest_path.open("wb") as f:
-                    f.write(response.content)
+                # Disk writes go through the executor so the event loop keeps serving requests
+                await run_blocking(_write_bytes, dest_path, response.content)
                 logger.info(f"Successfully downloaded {url} to {dest_path}")
                 return dest_path.name
             else:
@@ -36,55 +39,133 @@ async def download_image(url: str, dest_path: Path) -> Optional[str]:
         
     return None
 
+def _write_bytes(dest_path: Path, content: bytes):
+    # Ensure directory exists
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    with dest_path.open("wb") as f:
+        f.write(content)
+
+def _copy_fileobj(src, dest_path: Path):
+    src.seek(0)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    with dest_path.open("wb") as buffer:
+        shutil.copyfileobj(src, buffer)
+
+async def save_upload_file(upload, dest_path: Path) -> Path:
+    """
+    Streams an UploadFile to dest_path on the blocking executor.
+    """
+    await run_blocking(_copy_fileobj, upload.file, dest_path)
+    return dest_path
+
 def parse_tracklist_csv(text: str) -> List[Dict]:
     """
-    Parses a raw text string as CSV into a list of track dictionaries.
-    Expected format: <tracknr>, <tracktitel>, <trackduur>
+    Parses a pasted tracklist into a list of track dictionaries.
+    See tracklist.py for the supported layouts (CSV-like, plain text, disc headers, cue sheets).
     """
-    # Use io.StringIO to treat the string as a file for the csv module
-    f = io.StringIO(text.strip())
-    # DictReader would be nice but the user input doesn't have headers
-    # We use a simple reader and map the columns ourselves
-    reader = csv.reader(f, skipinitialspace=True)
-    
-    parsed_tracks = []
-    
-    for i, row in enumerate(reader):
-        if not row:
+    return list(iter_tracks(io.StringIO(text)))
+
+# --- Normalisation for duplicate detection ---
+# Bump when the keys below change, so stored keys are recomputed (crud.backfill_album_keys)
+KEYS_VERSION = 2
+# Edition markers that don't make a different album: "(Remastered 2009)", "[Deluxe Edition]",
+# "- 2011 Remaster", ... "Live Version" or "Extended Mix" are different recordings, so
+# version, mix, mono and stereo only count as part of a remaster ("Mono Remaster").
+_EDITION_WORDS = r"remaster(?:ed)?|deluxe|edition|expanded|anniversary|bonus|reissue"
+_EDITION_BRACKET_RE = re.compile(rf"\s*[\(\[][^\)\]]*\b(?:{_EDITION_WORDS})\b[^\)\]]*[\)\]]\s*$", re.IGNORECASE)
+_EDITION_DASH_RE = re.compile(rf"\s+[-–—]\s+[^-–—]*\b(?:{_EDITION_WORDS})\b[^-–—]*$", re.IGNORECASE)
+_LEADING_ARTICLES = ("the ", "a ", "an ", "de ", "het ", "een ")
+# Accents are only dropped from Latin, Greek and Cyrillic letters; in other scripts
+# (kana voicing marks, Devanagari signs) the combining mark makes a different letter
+_ACCENTED_SCRIPTS_END = "\u0530"
+
+def _strip_accents(value: str) -> str:
+    kept, base = [], ""
+    for c in unicodedata.normalize("NFKD", value):
+        if not unicodedata.combining(c):
+            base = c
+        elif base < _ACCENTED_SCRIPTS_END:
             continue
-            
-        # Try to extract data based on column count
-        # Default values
-        track_no = i + 1
-        title = ""
-        duration = None
-        
-        if len(row) >= 3:
-            # Full format: nr, title, duration
-            try:
-                track_no = int(row[0])
-            except ValueError:
-                track_no = i + 1
-            title = row[1]
-            duration = row[2]
-        elif len(row) == 2:
-            # Short format: title, duration OR nr, title
-            # Let's check if the first column is a number
-            try:
-                track_no = int(row[0])
-                title = row[1]
-            except ValueError:
-                title = row[0]
-                duration = row[1]
-        elif len(row) == 1:
-            # Minimal format: title only
-            title = row[0]
-            
-        parsed_tracks.append({
-            "position": track_no,
-            "title": title.strip() if title else f"Track {i+1}",
-            "duration": duration.strip() if duration else None,
-            "disc_no": 1
-        })
-        
-    return parsed_tracks
+        kept.append(c)
+    return unicodedata.normalize("NFC", "".join(kept))
+
+def normalize_text(value: Optional[str]) -> str:
+    """
+    Casefolds, strips accents and punctuation and collapses whitespace: "Björk & Co." -> "bjork and co".
+    Letters and digits of every script are kept: "Кино" -> "кино", "坂本龍一" stays as is.
+    """
+    if not value:
+        return ""
+    value = value.casefold().replace("&", " and ").replace("'", "").replace("\u2019", "")
+    value = _strip_accents(value)
+    # Marks still left belong to their letter (Devanagari vowel signs); everything else separates words
+    return " ".join("".join(c if c.isalnum() or unicodedata.category(c)[0] == "M" else " " for c in value).split())
+
+def _strip_article(value: str) -> str:
+    for article in _LEADING_ARTICLES:
+        if value.startswith(article) and len(value) > len(article):
+            return value[len(article):]
+    return value
+
+def normalize_title(title: Optional[str]) -> str:
+    if not title:
+        return ""
+    previous = None
+    while previous != title:
+        previous = title
+        title = _EDITION_BRACKET_RE.sub("", title)
+        title = _EDITION_DASH_RE.sub("", title)
+    return _strip_article(normalize_text(title))
+
+def artist_key(name: Optional[str]) -> str:
+    key = normalize_text(name)
+    if key.endswith(" the"):  # "Beatles, The"
+        key = key[:-4]
+    return _strip_article(key)
+
+def album_fingerprint(title: Optional[str], artist_names: List[str]) -> Optional[str]:
+    title_key = normalize_title(title)
+    if not title_key:
+        return None
+    keys = sorted({artist_key(name) for name in artist_names if artist_key(name)})
+    return f"{title_key}|{'+'.join(keys)}"
+
+def normalize_barcode(barcode: Optional[str]) -> Optional[str]:
+    """
+    Digits only, without leading zeros, so UPC-A "075678164125" and EAN-13 "0075678164125" match.
+    """
+    if not barcode:
+        return None
+    digits = "".join(c for c in barcode if c.isdigit()).lstrip("0")
+    return digits or None
+
+DURATION_RE = re.compile(r"^(?:(\d+):(\d{2}):(\d{2})|(\d{1,3})[:.'](\d{2}))(?:[.,](\d{1,3}))?$")
+
+def parse_duration(value: Optional[str]) -> Optional[int]:
+    """
+    Milliseconds from "4:05", "1:02:03", "4.05", "4:05.250" or plain seconds ("245").
+    None for anything else.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value) * 1000
+    match = DURATION_RE.match(value)
+    if not match:
+        return None
+    hours, h_minutes, h_seconds, minutes, seconds, fraction = match.groups()
+    if hours is not None:
+        minutes, seconds = h_minutes, h_seconds
+    if int(seconds) >= 60:
+        return None
+    total = (int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)) * 1000
+    return total + (int(fraction.ljust(3, "0")) if fraction else 0)
+
+def format_duration(ms: Optional[int]) -> Optional[str]:
+    if ms is None:
+        return None
+    seconds = ms // 1000
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
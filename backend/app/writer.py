@@ -0,0 +1,175 @@
+"""
+Group commit for interactive writes.
+
+Writes submitted here run one after another on a single writer thread. Whatever has queued
+up while the previous group was being committed (up to MAX_BATCH operations; an operation
+that finds the writer idle waits at most MAX_DELAY_MS for company) runs in one transaction,
+each operation in its own SAVEPOINT, and the group ends with a single COMMIT: one fsync for
+the lot instead of one per write. An operation that raises is rolled back to its savepoint
+alone; its caller gets the exception and the rest of the group commits as usual.
+
+The crud functions keep calling session.commit(). The sessions handed to them are joined to
+the group's transaction with join_transaction_mode="create_savepoint", so those commits only
+release savepoints. Change notifications are held back until the group has committed, so
+neither the in-memory indexes nor connected clients ever see a write that could still be
+rolled back, and callers get their result only after that.
+
+Operations must return plain data (ids, dicts, pydantic copies): their session is closed
+before the result is handed over.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from . import crud
+from .database import engine
+from .monitoring import registry
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = int(os.getenv("DISCVAULT_GROUP_COMMIT_MAX", "64"))
+MAX_DELAY_MS = float(os.getenv("DISCVAULT_GROUP_COMMIT_DELAY_MS", "2"))
+
+group_commits = registry.counter("discvault_group_commits_total", "Transactions committed by the write coordinator, by outcome.", ("outcome",))
+group_size = registry.histogram("discvault_group_commit_size", "Write operations per group commit.",
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+write_latency = registry.histogram("discvault_write_latency_seconds", "Time from submitting a write until its group committed.")
+
+class _Operation:
+    __slots__ = ("fn", "args", "kwargs", "context", "future", "submitted", "result", "error", "notifications")
+
+    def __init__(self, fn: Callable, args: Tuple, kwargs: Dict):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        # Run in the submitter's context so per-request query profiling still attributes the work
+        self.context = contextvars.copy_context()
+        self.future: Future = Future()
+        self.submitted = time.monotonic()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.notifications: List = []
+
+class GroupCommitWriter:
+    def __init__(self, max_batch: int = MAX_BATCH, max_delay_ms: float = MAX_DELAY_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay_ms / 1000
+        self._queue: "queue.SimpleQueue[Optional[_Operation]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queues fn(session, *args, **kwargs); the future resolves once its group has committed.
+        """
+        operation = _Operation(fn, args, kwargs)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="discvault-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(operation)
+        return operation.future
+
+    def close(self, timeout: Optional[float] = None):
+        # Commits what is already queued, then stops the thread; a later submit starts a new one
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            # A caller that was cancelled while queued (client gone, timeout) has nothing to run
+            if not first.future.set_running_or_notify_cancel():
+                continue
+            group, stop = [first], False
+            deadline = first.submitted + self.max_delay
+            while len(group) < self.max_batch:
+                # Under load the deadline has long passed and this only drains what queued up
+                remaining = deadline - time.monotonic()
+                try:
+                    operation = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if operation is None:
+                    stop = True
+                    break
+                if operation.future.set_running_or_notify_cancel():
+                    group.append(operation)
+            self._commit_group(group)
+            if stop:
+                return
+
+    def _commit_group(self, group: List[_Operation]):
+        try:
+            with engine.connect() as conn:
+                # pysqlite opens transactions only implicitly before DML, which would turn the
+                # first SAVEPOINT into a transaction of its own; IMMEDIATE takes the write lock
+                # up front so the group can't deadlock against another writer halfway through
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                for operation in group:
+                    self._execute(conn, operation)
+                conn.commit()
+            group_commits.inc(outcome="ok")
+        except Exception as e:
+            logger.exception("Group commit of %d write(s) failed", len(group))
+            group_commits.inc(outcome="error")
+            for operation in group:
+                if operation.error is None:
+                    operation.error, operation.notifications = e, []
+        group_size.observe(len(group))
+
+        # Listeners first, so a caller that reads right after its write sees fresh indexes
+        notifications = [n for operation in group for n in operation.notifications]
+        if notifications:
+            try:
+                with Session(engine) as session:
+                    crud.deliver_notifications(session, notifications)
+            except Exception:
+                logger.exception("Delivering change notifications after a group commit failed")
+        now = time.monotonic()
+        for operation in group:
+            write_latency.observe(now - operation.submitted)
+            try:
+                if operation.error is not None:
+                    operation.future.set_exception(operation.error)
+                else:
+                    operation.future.set_result(operation.result)
+            except InvalidStateError:
+                # Already resolved elsewhere; must not keep the rest of the group waiting
+                logger.warning("Result of a group-committed write could not be delivered")
+
+    def _execute(self, conn, operation: _Operation):
+        savepoint = conn.begin_nested()
+        session = Session(bind=conn, join_transaction_mode="create_savepoint",
+                          info={crud.DEFERRED_NOTIFICATIONS: operation.notifications})
+        try:
+            operation.result = operation.context.run(operation.fn, session, *operation.args, **operation.kwargs)
+        except Exception as e:
+            operation.error, operation.notifications = e, []
+            session.close()
+            savepoint.rollback()
+            return
+        # Closing discards whatever the operation left uncommitted, as with any session
+        session.close()
+        savepoint.commit()
+
+writer = GroupCommitWriter()
+
+async def run_in_writer(fn, *args, **kwargs):
+    """
+    Runs fn(session, *args, **kwargs) through the group-commit writer and awaits its result.
+    """
+    return await asyncio.wrap_future(writer.submit(fn, *args, **kwargs))
@@ -0,0 +1,11 @@
+"""
+Shared test setup: the app runs against a throw-away data directory and never calls out to
+MusicBrainz. Both have to be in place before backend.app is first imported.
+"""
+import os
+import tempfile
+
+_data_dir = tempfile.mkdtemp(prefix="discvault-test-")
+os.makedirs(os.path.join(_data_dir, "covers"), exist_ok=True)
+os.environ["DATA_DIR"] = _data_dir
+os.environ["DISCVAULT_MB_OFFLINE"] = "1"
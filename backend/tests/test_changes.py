@@ -0,0 +1,39 @@
+"""
+Delta sync through GET /changes: archiving reads as a deletion, and a restored backup
+invalidates every token handed out before it.
+"""
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+
+def _changes(client: TestClient, token: str) -> dict:
+    response = client.get("/changes", params={"since": token})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_archived_albums_are_reported_as_deleted():
+    with TestClient(app) as client:
+        token = _changes(client, "")["token"]
+        album_id = client.post("/albums/", json={"title": "Archive Me", "status": "collection"}).json()["id"]
+        changed = _changes(client, token)
+        assert [a["id"] for a in changed["albums"]["upserted"]] == [album_id]
+
+        token = changed["token"]
+        assert client.post(f"/albums/{album_id}/archive").status_code == 200
+        changed = _changes(client, token)
+        assert changed["albums"] == {"upserted": [], "deleted": [album_id]}
+
+        token = changed["token"]
+        assert client.post(f"/albums/{album_id}/restore").status_code == 200
+        assert [a["id"] for a in _changes(client, token)["albums"]["upserted"]] == [album_id]
+
+def test_restoring_a_backup_resets_clients():
+    with TestClient(app) as client:
+        archive = client.get("/export").content
+        client.post("/albums/", json={"title": "After The Backup", "status": "collection"})
+        token = _changes(client, "")["token"]
+
+        restored = client.post("/import", files={"file": ("backup.zip", archive, "application/zip")})
+        assert restored.status_code == 200, restored.text
+        # The restored log is behind the token; same database or not, the client must reload
+        assert _changes(client, token)["reset"] is True
@@ -0,0 +1,33 @@
+"""
+The facet index patched by album writes must equal one built from scratch.
+"""
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from backend.app import facets
+from backend.app.database import engine
+from backend.app.main import app
+
+def _snapshot(index: facets.FacetIndex):
+    return index._all, {facet: dict(values) for facet, values in index._postings.items()}
+
+def test_patched_index_matches_a_rebuild():
+    with TestClient(app) as client:
+        ids = [client.post("/albums/", json={"title": f"Facet {i}", "status": "collection", "year": 1970 + i,
+                                            "media_type": "CD", "genre_names": ["Rock", f"Genre {i % 3}"]}).json()["id"]
+               for i in range(6)]
+        # Build after the genres exist: new genres rebuild the index instead of patching it
+        with Session(engine) as session:
+            facets.index.search(session, None, {})
+        client.put(f"/albums/{ids[0]}", json={"genre_names": ["Genre 2"], "media_type": "Vinyl", "year": 1999})
+        client.patch("/albums/bulk", json={"album_ids": ids[1:4], "add_tag_ids": [1]})
+        client.post(f"/albums/{ids[2]}/archive")
+        client.delete(f"/albums/{ids[3]}")
+
+        assert facets.index._postings is not None, "album writes should patch the index, not drop it"
+        patched = _snapshot(facets.index)
+        fresh = facets.FacetIndex()
+        with Session(engine) as session:
+            fresh.search(session, None, {})
+        assert patched == _snapshot(fresh)
+        assert ids[0] not in facets.from_bitset(patched[1]["media_type"].get("CD", 0))
@@ -0,0 +1,31 @@
+"""
+Duplicate-detection keys: normalisation has to keep every script's letters, and only fold
+away markers that don't make a different album.
+"""
+from backend.app import utils
+
+def test_latin_names_are_folded():
+    assert utils.normalize_text("Björk & Co.") == "bjork and co"
+    assert utils.artist_key("Beatles, The") == utils.artist_key("The Beatles") == "beatles"
+
+def test_cyrillic_names_are_kept():
+    assert utils.normalize_text("Кино") == "кино"
+    assert utils.artist_key("Аквариум") == "аквариум"
+    assert utils.album_fingerprint("Greatest Hits", ["Кино"]) != utils.album_fingerprint("Greatest Hits", ["Аквариум"])
+    assert utils.album_fingerprint("Группа крови", ["Кино"]) == "группа крови|кино"
+
+def test_cjk_names_are_kept():
+    assert utils.artist_key("坂本龍一") == "坂本龍一"
+    assert utils.normalize_title("戦場のメリークリスマス") == "戦場のメリークリスマス"
+    # Voicing marks make a different kana, unlike accents on Latin letters
+    assert utils.normalize_text("ガ") != utils.normalize_text("カ")
+    assert utils.album_fingerprint("B-2 Unit", ["坂本龍一"]) != utils.album_fingerprint("B-2 Unit", ["細野晴臣"])
+
+def test_remasters_match_but_other_versions_do_not():
+    studio = utils.normalize_title("Abbey Road")
+    assert utils.normalize_title("Abbey Road (Remastered 2009)") == studio
+    assert utils.normalize_title("Abbey Road - 2019 Mono Remaster") == studio
+    assert utils.normalize_title("Abbey Road [Super Deluxe Edition]") == studio
+    assert utils.normalize_title("Abbey Road (Live Version)") != studio
+    assert utils.normalize_title("Abbey Road (Extended Mix)") != studio
+    assert utils.normalize_title("Abbey Road (Mono)") != studio
@@ -0,0 +1,17 @@
+"""
+Query-plan regression checks (backend/app/queryplan.py) as part of the test run.
+
+The checks seed their own temporary database and bind the app's engine to it on import, so
+they run in a fresh interpreter rather than next to the app these tests already imported.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+def test_no_unexpected_scans():
+    result = subprocess.run([sys.executable, "-m", "backend.app.queryplan"], cwd=ROOT,
+                            capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert " 0 with unexpected scans, 0 index expectation(s) failed" in result.stdout
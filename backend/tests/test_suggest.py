@@ -0,0 +1,29 @@
+"""
+Typeahead over the in-memory prefix index, in any script.
+"""
+from backend.app.suggest import PrefixIndex
+
+def _index() -> PrefixIndex:
+    index = PrefixIndex([(1, "Pink Floyd"), (2, "ABBA"), (3, "Кино"), (4, "坂本龍一"), (5, "Кинг Кримсон")])
+    index.set_counts({1: 40, 2: 30, 3: 5, 4: 3, 5: 1})
+    return index
+
+def _names(results) -> list:
+    return [r["name"] for r in results]
+
+def test_non_latin_prefixes_match():
+    index = _index()
+    assert _names(index.search("Кин", 10)) == ["Кино", "Кинг Кримсон"]
+    assert _names(index.search("кино", 10)) == ["Кино"]
+    assert _names(index.search("坂本", 10)) == ["坂本龍一"]
+    assert _names(index.search("Кримсон", 10)) == ["Кинг Кримсон"]
+
+def test_patched_non_latin_names_are_suggested():
+    index = _index()
+    index.patch({6: "Аквариум"})
+    assert _names(index.search("акв", 10)) == ["Аквариум"]
+
+def test_only_an_empty_query_falls_back_to_popularity():
+    index = _index()
+    assert _names(index.search("", 2)) == ["Pink Floyd", "ABBA"]
+    assert index.search("?!", 10) == []
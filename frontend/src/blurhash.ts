@@ -0,0 +1,87 @@
+// Decodes the blurhash placeholders the API sends with each album into small data URLs,
+// so lists can paint a blurred cover before the real image has loaded.
+
+const BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+const SIZE = 32
+
+const cache = new Map<string, string>()
+
+function decode83(text: string): number {
+  let value = 0
+  for (const char of text) value = value * 83 + BASE83.indexOf(char)
+  return value
+}
+
+function srgbToLinear(value: number): number {
+  const v = value / 255
+  return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4)
+}
+
+function linearToSrgb(value: number): number {
+  const v = Math.max(0, Math.min(1, value))
+  return Math.round(v <= 0.0031308 ? v * 12.92 * 255 : (1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255)
+}
+
+function signPow(value: number, exp: number): number {
+  return Math.sign(value) * Math.pow(Math.abs(value), exp)
+}
+
+function decodePixels(hash: string): Uint8ClampedArray<ArrayBuffer> | null {
+  const sizeFlag = decode83(hash[0] ?? '')
+  const componentsX = (sizeFlag % 9) + 1
+  const componentsY = Math.floor(sizeFlag / 9) + 1
+  if (hash.length !== 4 + 2 * componentsX * componentsY) return null
+
+  const maximum = (decode83(hash[1] ?? '') + 1) / 166
+  const colors: number[][] = []
+  const dc = decode83(hash.slice(2, 6))
+  colors.push([srgbToLinear(dc >> 16), srgbToLinear((dc >> 8) & 255), srgbToLinear(dc & 255)])
+  for (let i = 1; i < componentsX * componentsY; i++) {
+    const ac = decode83(hash.slice(4 + i * 2, 6 + i * 2))
+    colors.push([
+      signPow((Math.floor(ac / (19 * 19)) - 9) / 9, 2) * maximum,
+      signPow(((Math.floor(ac / 19) % 19) - 9) / 9, 2) * maximum,
+      signPow(((ac % 19) - 9) / 9, 2) * maximum,
+    ])
+  }
+
+  const pixels = new Uint8ClampedArray(SIZE * SIZE * 4)
+  for (let y = 0; y < SIZE; y++) {
+    for (let x = 0; x < SIZE; x++) {
+      let r = 0, g = 0, b = 0
+      for (let j = 0; j < componentsY; j++) {
+        for (let i = 0; i < componentsX; i++) {
+          const basis = Math.cos((Math.PI * x * i) / SIZE) * Math.cos((Math.PI * y * j) / SIZE)
+          const color = colors[i + j * componentsX]!
+          r += color[0]! * basis
+          g += color[1]! * basis
+          b += color[2]! * basis
+        }
+      }
+      const offset = 4 * (x + y * SIZE)
+      pixels[offset] = linearToSrgb(r)
+      pixels[offset + 1] = linearToSrgb(g)
+      pixels[offset + 2] = linearToSrgb(b)
+      pixels[offset + 3] = 255
+    }
+  }
+  return pixels
+}
+
+export function blurhashToDataURL(hash: string | undefined | null): string | undefined {
+  if (!hash) return undefined
+  const cached = cache.get(hash)
+  if (cached !== undefined) return cached || undefined
+
+  let url = ''
+  const pixels = decodePixels(hash)
+  const canvas = document.createElement('canvas')
+  const context = canvas.getContext('2d')
+  if (pixels && context) {
+    canvas.width = canvas.height = SIZE
+    context.putImageData(new ImageData(pixels, SIZE, SIZE), 0, 0)
+    url = canvas.toDataURL()
+  }
+  cache.set(hash, url)
+  return url || undefined
+}
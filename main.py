@@ -1,6 +1,6 @@
-def main():
-    print("Hello from discvault!")
+import sys
 
+from backend.app.cli import main
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())